@@ -0,0 +1,7 @@
+"""
+Benchmark suite for Ruddibaba Optimizer
+
+Run from the repository root with ``python -m benchmarks.run``. The suite
+only needs the standard library and runs on Linux as well as Windows:
+temp trees, the registry and external commands are all synthetic.
+"""
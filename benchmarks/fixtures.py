@@ -0,0 +1,216 @@
+"""
+Synthetic system fixtures for the benchmark suite
+
+Everything an optimizer touches is generated here: temp directory trees of
+a chosen shape, a populated in-memory registry and a command runner that
+never starts a process. Fixtures are deterministic, so two runs of the
+same configuration do the same work.
+"""
+import os
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List
+
+from src.core.commands import Command, CommandResult, CommandRunner
+from src.core.registry import (
+    REG_BINARY, REG_DWORD, REG_MULTI_SZ, REG_QWORD, REG_SZ,
+    MemoryRegistryBackend, RegistryValue
+)
+
+@dataclass
+class TreeShape:
+    """
+    Shape of a synthetic directory tree
+
+    ``width`` branches hang off the root, each a chain of ``depth`` nested
+    directories. Small files are spread evenly over every directory; huge
+    files go in the root and are created sparse so fixtures do not need
+    gigabytes of free disk.
+    """
+    files: int
+    width: int = 10
+    depth: int = 1
+    file_size: int = 128
+    huge_files: int = 0
+    huge_size: int = 0
+
+SHAPES: Dict[str, TreeShape] = {
+    'tiny': TreeShape(files=10_000, width=100, depth=2, file_size=128),
+    'deep': TreeShape(files=10_000, width=8, depth=40, file_size=128),
+    'huge': TreeShape(files=16, width=1, depth=1, file_size=0,
+                      huge_files=16, huge_size=256 * 1024 * 1024),
+    'mixed': TreeShape(files=10_000, width=50, depth=6, file_size=4096,
+                       huge_files=4, huge_size=64 * 1024 * 1024),
+}
+
+@dataclass
+class TreeStats:
+    """What a generated tree contains"""
+    directories: int = 0
+    files: int = 0
+    bytes: int = 0
+
+def build_tree(root: str, shape: TreeShape) -> TreeStats:
+    """
+    Populate a directory with files in the given shape
+
+    Args:
+        root: Directory to fill; created if missing
+        shape: Number, size and placement of the files
+
+    Returns:
+        Counts of what was created
+    """
+    os.makedirs(root, exist_ok=True)
+    stats = TreeStats()
+
+    directories: List[str] = []
+    for branch in range(max(1, shape.width)):
+        path = root
+        for level in range(max(1, shape.depth)):
+            path = os.path.join(path, f"b{branch:04d}" if level == 0 else f"d{level:03d}")
+            directories.append(path)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    stats.directories = len(directories)
+
+    payload = b'x' * shape.file_size
+    for i in range(shape.files):
+        path = os.path.join(directories[i % len(directories)], f"f{i:07d}.tmp")
+        with open(path, 'wb') as f:
+            f.write(payload)
+    stats.files += shape.files
+    stats.bytes += shape.files * shape.file_size
+
+    for i in range(shape.huge_files):
+        with open(os.path.join(root, f"huge{i:03d}.bin"), 'wb') as f:
+            f.truncate(shape.huge_size)
+    stats.files += shape.huge_files
+    stats.bytes += shape.huge_files * shape.huge_size
+    return stats
+
+def backdate_files(root: str, every: int, days: float) -> List[str]:
+    """
+    Make every Nth file under root, in sorted path order, older by some days
+
+    Returns:
+        The files backdated
+    """
+    paths = sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names
+    )
+    mtime = time.time() - days * 24 * 60 * 60
+    backdated = paths[::every]
+    for path in backdated:
+        os.utime(path, (mtime, mtime))
+    return backdated
+
+@contextmanager
+def sandbox_environment(root: str) -> Iterator[Dict[str, str]]:
+    """
+    Point the Windows directory variables the optimizers read into root
+
+    Mirrors a default Windows layout, where TEMP and TMP are both
+    %LOCALAPPDATA%\\Temp. Optimizers must be created inside the block
+    because tasks resolve their paths at construction.
+
+    Yields:
+        Mapping of the variables that were set
+    """
+    local_app_data = os.path.join(root, 'LocalAppData')
+    windir = os.path.join(root, 'Windows')
+    temp = os.path.join(local_app_data, 'Temp')
+    variables = {
+        'LOCALAPPDATA': local_app_data,
+        'WINDIR': windir,
+        'TEMP': temp,
+        'TMP': temp,
+    }
+    for path in (temp, os.path.join(windir, 'Temp'),
+                 os.path.join(windir, 'SoftwareDistribution', 'Download')):
+        os.makedirs(path, exist_ok=True)
+
+    saved = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield variables
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def build_registry(keys: int, values_per_key: int = 10) -> Dict[str, Dict[str, RegistryValue]]:
+    """
+    Generate registry contents with a mix of value types
+
+    Args:
+        keys: Number of keys, spread over HKLM and HKCU
+        values_per_key: Values stored under each key
+
+    Returns:
+        Key path -> value name -> (type, data), as accepted by
+        MemoryRegistryBackend and stored in backups
+    """
+    generators = (
+        lambda k, v: (REG_DWORD, (k * 31 + v) & 0xFFFFFFFF),
+        lambda k, v: (REG_SZ, f"value-{k}-{v}"),
+        lambda k, v: (REG_QWORD, k * 1_000_003 + v),
+        lambda k, v: (REG_MULTI_SZ, [f"item-{k}", f"item-{v}"]),
+        lambda k, v: (REG_BINARY, bytes((k + v + i) & 0xFF for i in range(16))),
+    )
+    data = {}
+    for k in range(keys):
+        hive = 'HKLM' if k % 2 == 0 else 'HKCU'
+        key_path = rf"{hive}\SOFTWARE\RuddibabaBenchmark\Group{k // 1000:04d}\Key{k:07d}"
+        data[key_path] = {
+            f"Value{v:02d}": generators[(k + v) % len(generators)](k, v)
+            for v in range(values_per_key)
+        }
+    return data
+
+def memory_registry(keys: int, values_per_key: int = 10) -> MemoryRegistryBackend:
+    """An in-memory registry pre-populated by build_registry"""
+    return MemoryRegistryBackend(build_registry(keys, values_per_key))
+
+def backup_document(registry: Dict[str, Dict[str, RegistryValue]]) -> Dict[str, Dict]:
+    """
+    Registry contents in the shape BackupManager stores
+
+    Every value type is kept; backups tag REG_BINARY data so it round-trips.
+    """
+    encoded = {}
+    for key_path, values in registry.items():
+        encoded[key_path] = {
+            name: [value_type, data] for name, (value_type, data) in values.items()
+        }
+    return {'registry': encoded}
+
+class FakeCommandRunner(CommandRunner):
+    """
+    Command runner that records commands instead of starting processes
+
+    ``latency`` simulates the cost of one command. Unordered batches run
+    up to max_concurrency at a time, as the real runner would.
+    """
+
+    def __init__(self, latency: float = 0.0, stdout: str = "", max_concurrency: int = 4):
+        super().__init__(max_concurrency=max_concurrency)
+        self.latency = latency
+        self.stdout = stdout
+        self.executed: List[str] = []
+
+    def _execute(self, commands: List[Command], ordered: bool) -> List[CommandResult]:
+        self.executed.extend(str(command) for command in commands)
+        if self.latency:
+            rounds = len(commands) if ordered else math.ceil(len(commands) / self.max_concurrency)
+            time.sleep(self.latency * rounds)
+        return [
+            CommandResult(command, 0, self.stdout, duration=self.latency)
+            for command in commands
+        ]
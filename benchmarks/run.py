@@ -0,0 +1,404 @@
+"""
+Benchmark runner for Ruddibaba Optimizer
+
+Times the deletion tasks, cleanup policy evaluation, backup creation and
+restore, file backups through the chunk store, and the full run_all pipeline
+against synthetic fixtures, and writes the timings as JSON. Passing a
+previous results file with --baseline reports any benchmark whose median
+got slower than the tolerance allows and exits non-zero, so the suite can
+gate a release.
+
+Usage:
+    python -m benchmarks.run --shape tiny --shape deep --output results.json
+    python -m benchmarks.run --shape tiny --files 1000000 --repeat 1
+    python -m benchmarks.run --baseline previous.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from dataclasses import asdict, replace
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.backup import BackupManager
+from src.core.cache import TaskCache
+from src.core.columnar import ExtensionIn, LargerThan, OlderThan, ScanTable
+from src.core.optimizers import (
+    HardcoreOptimizer, OptimizationLevel, OptionalOptimizer, SafeOptimizer
+)
+from src.core.registry import MemoryRegistryBackend
+from .fixtures import (
+    SHAPES, FakeCommandRunner, TreeShape, backdate_files, backup_document, build_registry,
+    build_tree, sandbox_environment
+)
+
+SCHEMA_VERSION = 1
+
+OPTIMIZERS = {
+    OptimizationLevel.SAFE: SafeOptimizer,
+    OptimizationLevel.OPTIONAL: OptionalOptimizer,
+    OptimizationLevel.HARDCORE: HardcoreOptimizer
+}
+
+# A benchmark prepares its fixtures in a scratch directory, times the
+# operation under test and returns (seconds, work done)
+Benchmark = Callable[[str], Tuple[float, Dict[str, int]]]
+
+def _make_optimizer(level: OptimizationLevel, workdir: str, registry: Dict, latency: float):
+    return OPTIMIZERS[level](
+        level=level,
+        command_runner=FakeCommandRunner(latency=latency),
+        registry_backend=MemoryRegistryBackend(registry),
+        cache=TaskCache(os.path.join(workdir, 'task_cache.json'))
+    )
+
+def clear_temp_files_benchmark(shape: TreeShape) -> Benchmark:
+    """SafeOptimizer.clear_temp_files over a populated temp directory"""
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        with sandbox_environment(workdir) as env:
+            stats = build_tree(env['TEMP'], shape)
+            optimizer = _make_optimizer(OptimizationLevel.SAFE, workdir, {}, 0.0)
+            start = time.perf_counter()
+            optimizer.clear_temp_files()
+            elapsed = time.perf_counter() - start
+            _check_empty(env['TEMP'])
+        return elapsed, {'files': stats.files, 'bytes': stats.bytes}
+    return benchmark
+
+def clear_update_cache_benchmark(shape: TreeShape) -> Benchmark:
+    """SafeOptimizer.clear_windows_update_cache over a populated download cache"""
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        with sandbox_environment(workdir) as env:
+            cache_dir = os.path.join(env['WINDIR'], 'SoftwareDistribution', 'Download')
+            stats = build_tree(cache_dir, shape)
+            optimizer = _make_optimizer(OptimizationLevel.SAFE, workdir, {}, 0.0)
+            start = time.perf_counter()
+            optimizer.clear_windows_update_cache()
+            elapsed = time.perf_counter() - start
+            _check_empty(cache_dir)
+        return elapsed, {'files': stats.files, 'bytes': stats.bytes}
+    return benchmark
+
+def policy_filter_benchmark(shape: TreeShape) -> Benchmark:
+    """A combined age, size and extension policy over a scanned tree, a quarter of it old"""
+    min_size = 50 * 1024 * 1024
+    extensions = {'.tmp', '.log', '.dmp'}
+    policy = OlderThan(7) & (LargerThan(min_size) | ExtensionIn(extensions))
+
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        root = os.path.join(workdir, 'tree')
+        build_tree(root, shape)
+        old = backdate_files(root, every=4, days=30)
+        expected = sum(
+            1 for path in old
+            if os.path.getsize(path) > min_size or os.path.splitext(path)[1] in extensions
+        )
+        table = ScanTable.scan([root])
+        start = time.perf_counter()
+        selected = sum(1 for _ in table.indices(policy.mask(table)))
+        elapsed = time.perf_counter() - start
+        if selected != expected:
+            raise RuntimeError(f"Policy selected {selected} file(s), expected {expected}")
+        return elapsed, {'files': len(table), 'selected': selected, 'table_bytes': table.nbytes}
+    return benchmark
+
+def backup_create_benchmark(registry: Dict) -> Benchmark:
+    """BackupManager.create_backup of a large registry snapshot"""
+    document = backup_document(registry)
+    values = sum(len(v) for v in document['registry'].values())
+
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        manager = BackupManager(
+            backup_dir=os.path.join(workdir, 'backups'),
+            registry_backend=MemoryRegistryBackend()
+        )
+        start = time.perf_counter()
+        backup_file = manager.create_backup(document, 'benchmark')
+        elapsed = time.perf_counter() - start
+        return elapsed, {'values': values, 'bytes': os.path.getsize(backup_file)}
+    return benchmark
+
+def backup_restore_benchmark(registry: Dict) -> Benchmark:
+    """BackupManager.restore_backup of a large registry snapshot into an empty registry"""
+    document = backup_document(registry)
+    values = sum(len(v) for v in document['registry'].values())
+
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        backend = MemoryRegistryBackend()
+        manager = BackupManager(
+            backup_dir=os.path.join(workdir, 'backups'),
+            registry_backend=backend
+        )
+        backup_file = manager.create_backup(document, 'benchmark')
+        start = time.perf_counter()
+        restored = manager.restore_backup(backup_file)
+        elapsed = time.perf_counter() - start
+        if not restored or backend.writes != values:
+            raise RuntimeError(f"restore wrote {backend.writes} of {values} values")
+        return elapsed, {'values': values}
+    return benchmark
+
+def backup_files_benchmark(shape: TreeShape, repeat: bool = False) -> Benchmark:
+    """
+    BackupManager.create_backup of a tree of files through the chunk store
+
+    With repeat=True the tree is backed up once beforehand and the second,
+    unchanged backup is timed.
+    """
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        stats = build_tree(os.path.join(workdir, 'tree'), shape)
+        paths = [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(os.path.join(workdir, 'tree'))
+            for name in names
+        ]
+        manager = BackupManager(
+            backup_dir=os.path.join(workdir, 'backups'),
+            registry_backend=MemoryRegistryBackend()
+        )
+        if repeat:
+            manager.create_backup({'files': paths}, 'benchmark_base')
+        before = _tree_bytes(os.path.join(workdir, 'backups'))
+        start = time.perf_counter()
+        manager.create_backup({'files': paths}, 'benchmark')
+        elapsed = time.perf_counter() - start
+        written = _tree_bytes(os.path.join(workdir, 'backups')) - before
+        return elapsed, {'files': stats.files, 'bytes': stats.bytes, 'written': written}
+    return benchmark
+
+def run_all_benchmark(
+    level: OptimizationLevel,
+    shape: Optional[TreeShape],
+    registry: Dict,
+    latency: float,
+    warm: bool = False
+) -> Benchmark:
+    """
+    The full run_all pipeline at one level
+
+    A cold run starts from a populated temp tree (when a shape is given)
+    and a registry where no task is applied yet. A warm run repeats
+    run_all straight after a cold one, which measures probing and the
+    fingerprint cache.
+    """
+    def benchmark(workdir: str) -> Tuple[float, Dict[str, int]]:
+        with sandbox_environment(workdir) as env:
+            stats = build_tree(env['TEMP'], shape) if shape else None
+            optimizer = _make_optimizer(level, workdir, registry, latency)
+            if warm:
+                optimizer.run_all()
+            start = time.perf_counter()
+            results = optimizer.run_all(use_cache=warm)
+            elapsed = time.perf_counter() - start
+        work = {
+            'tasks': len(results),
+            'tasks_failed': sum(1 for ok in results.values() if not ok),
+            'commands': len(optimizer.commands.executed)
+        }
+        if stats:
+            work['files'] = stats.files
+        return elapsed, work
+    return benchmark
+
+def _tree_bytes(path: str) -> int:
+    """Total size of the files below path"""
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+def _check_empty(path: str) -> None:
+    """Fail the benchmark if the operation under test left files behind"""
+    for _, _, files in os.walk(path):
+        if files:
+            raise RuntimeError(f"{path} still contains files")
+
+def _shape(args: argparse.Namespace, name: str) -> TreeShape:
+    """A named tree shape with the command-line overrides applied"""
+    shape = SHAPES[name]
+    if args.files is not None:
+        shape = replace(shape, files=args.files)
+    return shape
+
+def build_suite(args: argparse.Namespace) -> Dict[str, Benchmark]:
+    """Instantiate every benchmark selected on the command line"""
+    registry = build_registry(args.registry_keys, args.registry_values)
+    suite: Dict[str, Benchmark] = {}
+    for shape_name in args.shape:
+        shape = _shape(args, shape_name)
+        suite[f"clear_temp_files[{shape_name}]"] = clear_temp_files_benchmark(shape)
+        suite[f"clear_windows_update_cache[{shape_name}]"] = clear_update_cache_benchmark(shape)
+        suite[f"policy_filter[{shape_name}]"] = policy_filter_benchmark(shape)
+        suite[f"run_all[safe,{shape_name}]"] = run_all_benchmark(
+            OptimizationLevel.SAFE, shape, registry, args.command_latency
+        )
+        suite[f"run_all_warm[safe,{shape_name}]"] = run_all_benchmark(
+            OptimizationLevel.SAFE, shape, registry, args.command_latency, warm=True
+        )
+    # Only the safe level deletes files, so the others do not depend on the shape
+    for level in (OptimizationLevel.OPTIONAL, OptimizationLevel.HARDCORE):
+        name = level.name.lower()
+        suite[f"run_all[{name}]"] = run_all_benchmark(
+            level, None, registry, args.command_latency
+        )
+        suite[f"run_all_warm[{name}]"] = run_all_benchmark(
+            level, None, registry, args.command_latency, warm=True
+        )
+    suite["backup_create"] = backup_create_benchmark(registry)
+    suite["backup_restore"] = backup_restore_benchmark(registry)
+    for shape_name in args.shape:
+        shape = _shape(args, shape_name)
+        suite[f"backup_files[{shape_name}]"] = backup_files_benchmark(shape)
+        suite[f"backup_files_repeat[{shape_name}]"] = backup_files_benchmark(shape, repeat=True)
+
+    if args.only:
+        suite = {
+            name: benchmark for name, benchmark in suite.items()
+            if any(pattern in name for pattern in args.only)
+        }
+    return suite
+
+def run_suite(suite: Dict[str, Benchmark], repeat: int, scratch: Optional[str]) -> Dict[str, Dict]:
+    """
+    Run each benchmark ``repeat`` times in a fresh scratch directory
+
+    Returns:
+        Benchmark name -> timings and work counters
+    """
+    results = {}
+    for name, benchmark in suite.items():
+        times: List[float] = []
+        work: Dict[str, int] = {}
+        for _ in range(repeat):
+            workdir = tempfile.mkdtemp(prefix='rbbench_', dir=scratch)
+            try:
+                elapsed, work = benchmark(workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            times.append(elapsed)
+
+        median = statistics.median(times)
+        entry = {
+            'times': times,
+            'min': min(times),
+            'median': median,
+            'mean': statistics.mean(times),
+            'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+            'work': work
+        }
+        if work.get('files') and median > 0:
+            entry['files_per_second'] = work['files'] / median
+        results[name] = entry
+        print(f"{name:<45} median {median * 1000:10.2f} ms  min {min(times) * 1000:10.2f} ms")
+    return results
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+    Find benchmarks whose median regressed against a baseline
+
+    Args:
+        results: Current benchmark results
+        baseline: 'benchmarks' section of an earlier results file
+        tolerance: Allowed slowdown as a fraction, e.g. 0.2 for 20%
+
+    Returns:
+        Human-readable descriptions of each regression
+    """
+    regressions = []
+    for name, entry in results.items():
+        previous = baseline.get(name)
+        if not previous or previous.get('median', 0) <= 0:
+            continue
+        ratio = entry['median'] / previous['median']
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{name}: {previous['median'] * 1000:.2f} ms -> "
+                f"{entry['median'] * 1000:.2f} ms ({(ratio - 1) * 100:+.0f}%)"
+            )
+    return regressions
+
+def _git_commit() -> Optional[str]:
+    """Commit the benchmarked tree was built from, if known"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Ruddibaba Optimizer benchmark suite")
+    parser.add_argument('--shape', action='append', choices=sorted(SHAPES),
+                        help="Temp tree shape to benchmark; repeatable (default: tiny)")
+    parser.add_argument('--files', type=int,
+                        help="Override the number of small files in every shape")
+    parser.add_argument('--registry-keys', type=int, default=10_000,
+                        help="Keys in the synthetic registry (default: 10000)")
+    parser.add_argument('--registry-values', type=int, default=10,
+                        help="Values per registry key (default: 10)")
+    parser.add_argument('--command-latency', type=float, default=0.0,
+                        help="Simulated seconds per external command (default: 0)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Repetitions per benchmark (default: 3)")
+    parser.add_argument('--only', action='append',
+                        help="Only run benchmarks whose name contains this; repeatable")
+    parser.add_argument('--scratch', help="Directory for fixtures (default: system temp)")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="Results file (default: benchmark_results.json)")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed median slowdown against the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+    args.shape = args.shape or ['tiny']
+    args.repeat = max(1, args.repeat)
+    return args
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run_suite(build_suite(args), args.repeat, args.scratch)
+    document = {
+        'schema': SCHEMA_VERSION,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'shapes': {name: asdict(_shape(args, name)) for name in args.shape},
+            'registry_keys': args.registry_keys,
+            'registry_values': args.registry_values,
+            'command_latency': args.command_latency,
+            'repeat': args.repeat
+        },
+        'benchmarks': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f).get('benchmarks', {})
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
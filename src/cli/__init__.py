@@ -2,5 +2,7 @@
 CLI commands for Ruddibaba Optimizer
 """
 from .optimize import app as optimize_app
+from .analyze import app as analyze_app
+from .backup import app as backup_app
 
-__all__ = ['optimize_app']
+__all__ = ['optimize_app', 'analyze_app', 'backup_app']
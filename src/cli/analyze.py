@@ -0,0 +1,162 @@
+"""
+Analysis commands for Ruddibaba Optimizer
+"""
+import os
+from typing import List, Optional
+import typer
+from rich.filesize import decimal
+from rich.table import Table
+
+from ..core.diskindex import FILES_PER_DIRECTORY, DiskIndex
+from ..core.duplicates import DEFAULT_MIN_SIZE, DuplicateAction, DuplicateFinder
+from ..core.logger import setup_logging
+from ..ui.console import console
+
+# Create Typer app
+app = typer.Typer(name="analyze", help="Analyze disk usage")
+
+# Initialize logger
+logger = setup_logging().get_logger(__name__)
+
+@app.command()
+def disk(
+    path: Optional[str] = typer.Argument(
+        None,
+        help="Volume or directory to analyze (default: the system drive)"
+    ),
+    top: int = typer.Option(
+        10,
+        "--top", "-n",
+        help=f"Entries to list per table (files: at most {FILES_PER_DIRECTORY})"
+    ),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Rescan every directory instead of only those changed since the last run"
+    ),
+    index_path: Optional[str] = typer.Option(
+        None,
+        "--index",
+        help="Index database (default: under %LOCALAPPDATA%)"
+    )
+):
+    """Index disk usage and list the largest directories and files"""
+    root = path or os.environ.get('SystemDrive', 'C:') + os.sep
+    index = DiskIndex(index_path)
+    try:
+        with console.status(f"Indexing {root}...", spinner="dots") as status:
+            def progress(stats) -> None:
+                status.update(
+                    f"Indexing {root}... {stats.directories:,} directories, "
+                    f"{stats.rescanned:,} rescanned"
+                )
+
+            stats = index.refresh(root, full=full, progress=progress)
+
+        total = index.size_of(root)
+        if total is None:
+            console.print(f"[red]Could not index {root}[/]")
+            raise typer.Exit(1)
+        console.print(
+            f"[bold]{root}:[/] {decimal(total)} in {stats.directories:,} directories "
+            f"[dim]({stats.rescanned:,} rescanned, {stats.errors:,} unreadable)[/]"
+        )
+
+        table = Table(title="Largest Subdirectories", show_header=True, header_style="bold magenta")
+        table.add_column("Directory", style="cyan")
+        table.add_column("Size", justify="right")
+        table.add_column("Share", justify="right")
+        for usage in index.children(root)[:top]:
+            share = usage.total_size / total if total else 0
+            table.add_row(usage.path, decimal(usage.total_size), f"{share:.1%}")
+        console.print(table)
+
+        table = Table(title="Top Space Consumers", show_header=True, header_style="bold magenta")
+        table.add_column("Directory", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Size of Files", justify="right")
+        for usage in index.largest_directories(root, top):
+            table.add_row(usage.path, f"{usage.files:,}", decimal(usage.size))
+        console.print(table)
+
+        table = Table(title="Largest Files", show_header=True, header_style="bold magenta")
+        table.add_column("File", style="cyan")
+        table.add_column("Size", justify="right")
+        for file_path, size in index.largest_files(root, min(top, FILES_PER_DIRECTORY)):
+            table.add_row(file_path, decimal(size))
+        console.print(table)
+
+        console.print(f"[dim]Index saved to: {index.path}[/]")
+    except typer.Exit:
+        raise
+    except Exception as e:
+        logger.exception("Error during disk analysis")
+        console.print(f"[red]Error: {str(e)}[/]")
+        raise typer.Exit(1)
+    finally:
+        index.close()
+
+@app.command()
+def duplicates(
+    paths: List[str] = typer.Argument(..., help="Directories to search"),
+    min_size_kb: int = typer.Option(
+        DEFAULT_MIN_SIZE // 1024,
+        "--min-size-kb",
+        help="Ignore files smaller than this"
+    ),
+    top: int = typer.Option(
+        10,
+        "--top", "-n",
+        help="Duplicate groups to list"
+    ),
+    action: Optional[DuplicateAction] = typer.Option(
+        None,
+        "--action",
+        help="Replace every copy but the first with a hard link, or delete it"
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force", "-f",
+        help="Apply the action without confirmation"
+    )
+):
+    """Find duplicate files and report the space they waste"""
+    finder = DuplicateFinder(min_size=min_size_kb * 1024)
+    try:
+        with console.status("Searching for duplicates...", spinner="dots"):
+            report = finder.find(paths)
+
+        console.print(
+            f"[bold]{len(report.groups):,} duplicate group(s)[/] among "
+            f"{report.files_scanned:,} files ({decimal(report.bytes_scanned)}); "
+            f"[bold]{decimal(report.reclaimable)} reclaimable[/]"
+        )
+        if not report.groups:
+            return
+
+        table = Table(title="Largest Duplicates", show_header=True, header_style="bold magenta")
+        table.add_column("Kept", style="cyan")
+        table.add_column("Copies", justify="right")
+        table.add_column("Reclaimable", justify="right")
+        for group in report.groups[:top]:
+            table.add_row(group.paths[0], str(len(group.paths) - 1), decimal(group.reclaimable))
+        console.print(table)
+
+        if action is None:
+            return
+        if not force and not typer.confirm(
+            f"\n{action.value.title()} {sum(len(g.paths) - 1 for g in report.groups):,} copies?"
+        ):
+            console.print("[yellow]Nothing was changed.[/]")
+            return
+        stats = finder.resolve(report, action)
+        console.print(f"[green]✓ Freed {decimal(stats.bytes)} from {stats.files:,} copies[/]")
+        if stats.errors:
+            console.print(f"[yellow]{stats.errors:,} copies were left in place; see the log for details[/]")
+    except Exception as e:
+        logger.exception("Error during duplicate search")
+        console.print(f"[red]Error: {str(e)}[/]")
+        raise typer.Exit(1)
+
+if __name__ == "__main__":
+    app()
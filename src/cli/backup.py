@@ -0,0 +1,189 @@
+"""
+Backup commands for Ruddibaba Optimizer
+"""
+import os
+from datetime import datetime
+from typing import Optional
+import typer
+from rich.filesize import decimal
+from rich.table import Table
+
+from ..core.backup import BackupManager
+from ..core.logger import setup_logging
+from ..ui.console import console
+
+# Create Typer app
+app = typer.Typer(name="backup", help="List, inspect and prune backups")
+
+# Initialize logger
+logger = setup_logging().get_logger(__name__)
+
+# Initialize backup manager
+backup_manager = BackupManager()
+
+def resolve_backup(backup: str) -> str:
+    """A backup given by path or by file name in the backup directory"""
+    if os.path.exists(backup):
+        return backup
+    return os.path.join(backup_manager.backup_dir, backup)
+
+@app.command("list")
+def list_backups(
+    level: Optional[str] = typer.Option(
+        None,
+        "--level", "-l",
+        help="Only backups taken before runs at this level: safe, optional, or hardcore"
+    ),
+    key: Optional[str] = typer.Option(
+        None,
+        "--key", "-k",
+        help="Only backups holding this registry key path or file path"
+    ),
+    limit: int = typer.Option(
+        20,
+        "--limit", "-n",
+        help="Backups to list, newest first"
+    )
+):
+    """List backups, newest first"""
+    try:
+        entries = backup_manager.list_backups(
+            level=level.lower() if level else None, key=key, limit=limit
+        )
+    except Exception as e:
+        logger.exception("Error reading the backup catalog")
+        console.print(f"[red]Error: {str(e)}[/]")
+        raise typer.Exit(1)
+    if not entries:
+        console.print("[yellow]No matching backups.[/]")
+        return
+
+    table = Table(title="Backups", show_header=True, header_style="bold magenta")
+    table.add_column("Backup", style="cyan")
+    table.add_column("Created")
+    table.add_column("Level")
+    table.add_column("Host")
+    table.add_column("Keys", justify="right")
+    table.add_column("Size", justify="right")
+    for entry in entries:
+        table.add_row(
+            os.path.basename(entry.path),
+            datetime.fromtimestamp(entry.created).strftime("%Y-%m-%d %H:%M"),
+            entry.level or "-",
+            entry.host or "-",
+            f"{entry.keys:,}",
+            decimal(entry.size)
+        )
+    console.print(table)
+
+@app.command()
+def show(
+    backup: str = typer.Argument(..., help="Backup file, or its name as shown by list"),
+    values: bool = typer.Option(
+        False,
+        "--values",
+        help="Also show the backed-up registry values, which reads the backup itself"
+    )
+):
+    """Show what a backup holds"""
+    backup_file = resolve_backup(backup)
+    try:
+        entry = backup_manager.catalog.get(backup_file)
+        if entry is None:
+            if not os.path.exists(backup_file):
+                console.print(f"[red]Backup not found: {backup}[/]")
+                raise typer.Exit(1)
+            entry = backup_manager.index_backup(backup_file)
+        sections = backup_manager.catalog.keys(backup_file)
+        data = backup_manager.load_backup(backup_file) if values else {}
+    except typer.Exit:
+        raise
+    except Exception as e:
+        logger.exception("Error reading backup")
+        console.print(f"[red]Error: {str(e)}[/]")
+        raise typer.Exit(1)
+
+    console.print(
+        f"[bold]{os.path.basename(entry.path)}[/]: "
+        f"{datetime.fromtimestamp(entry.created).strftime('%Y-%m-%d %H:%M:%S')}, "
+        f"level {entry.level or '-'}, host {entry.host or '-'}, {decimal(entry.size)}"
+    )
+    for section, keys in sections.items():
+        table = Table(title=section.title(), show_header=True, header_style="bold magenta")
+        table.add_column("Key" if section == 'registry' else "Path", style="cyan")
+        if values:
+            table.add_column("Values")
+        for key in keys:
+            if values:
+                table.add_row(key, str(data.get(section, {}).get(key, "")))
+            else:
+                table.add_row(key)
+        console.print(table)
+
+@app.command()
+def prune(
+    keep: Optional[int] = typer.Option(
+        None,
+        "--keep",
+        help="Keep at most this many backups per optimization level"
+    ),
+    max_age_days: Optional[float] = typer.Option(
+        None,
+        "--max-age-days",
+        help="Delete backups older than this"
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Only list the backups that would be deleted"
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force", "-f",
+        help="Delete without confirmation"
+    )
+):
+    """Delete old backups; the newest backup of each level is always kept"""
+    if keep is None and max_age_days is None:
+        console.print("[red]Give --keep, --max-age-days or both.[/]")
+        raise typer.Exit(1)
+    max_age = max_age_days * 24 * 60 * 60 if max_age_days is not None else None
+    try:
+        expired = backup_manager.prune_backups(keep=keep, max_age=max_age, dry_run=True)
+        if not expired:
+            console.print("[green]No backups to prune.[/]")
+            return
+
+        table = Table(title="Backups to Delete", show_header=True, header_style="bold magenta")
+        table.add_column("Backup", style="cyan")
+        table.add_column("Created")
+        table.add_column("Level")
+        table.add_column("Size", justify="right")
+        for entry in expired:
+            table.add_row(
+                os.path.basename(entry.path),
+                datetime.fromtimestamp(entry.created).strftime("%Y-%m-%d %H:%M"),
+                entry.level or "-",
+                decimal(entry.size)
+            )
+        console.print(table)
+
+        if dry_run:
+            return
+        if not force and not typer.confirm(f"\nDelete {len(expired):,} backup(s)?"):
+            console.print("[yellow]Nothing was deleted.[/]")
+            return
+        deleted = backup_manager.prune_backups(keep=keep, max_age=max_age)
+        console.print(
+            f"[green]✓ Deleted {len(deleted):,} backup(s), "
+            f"{decimal(sum(entry.size for entry in deleted))}[/]"
+        )
+        if len(deleted) < len(expired):
+            console.print("[yellow]Some backups could not be deleted; see the log for details[/]")
+    except Exception as e:
+        logger.exception("Error while pruning backups")
+        console.print(f"[red]Error: {str(e)}[/]")
+        raise typer.Exit(1)
+
+if __name__ == "__main__":
+    app()
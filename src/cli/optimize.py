@@ -1,9 +1,13 @@
 """
 Optimization commands for Ruddibaba Optimizer
 """
-from typing import Optional
+import os
+from datetime import datetime
+from typing import Dict, Optional
 import typer
 from rich.console import Console
+from rich.filesize import decimal
+from rich.live import Live
 from rich.table import Table
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
@@ -14,8 +18,21 @@ from ..core import (
     HardcoreOptimizer,
     OptimizationLevel
 )
+from ..core.optimizers import TaskStatus
 from ..core.logger import setup_logging
 from ..core.backup import BackupManager
+from ..core.command_host import HostedCommandRunner
+from ..core.deferred import default_reboot_deleter
+from ..core.diskindex import DiskIndex, default_index_path
+from ..core.duplicates import DuplicateAction
+from ..core.metrics import export_json, export_prometheus
+from ..core.profiling import TaskProfiler
+from ..core.quarantine import (
+    DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, QuarantinePurger, QuarantineStore
+)
+from ..core.throttle import (
+    DEFAULT_BYTES_PER_SECOND, DEFAULT_MAX_LOAD, DEFAULT_OPS_PER_SECOND, Throttle
+)
 from ..ui.console import console
 
 # Create Typer app
@@ -27,14 +44,27 @@ logger = setup_logging().get_logger(__name__)
 # Initialize backup manager
 backup_manager = BackupManager()
 
-def get_optimizer(level: OptimizationLevel):
+def get_optimizer(level: OptimizationLevel, **kwargs):
     """Get the appropriate optimizer for the given level"""
     optimizers = {
         OptimizationLevel.SAFE: SafeOptimizer,
         OptimizationLevel.OPTIONAL: OptionalOptimizer,
         OptimizationLevel.HARDCORE: HardcoreOptimizer
     }
-    return optimizers[level](level=level)
+    return optimizers[level](level=level, **kwargs)
+
+def display_profile(profiler: TaskProfiler, top_n: int = 5) -> None:
+    """Display the hottest functions and allocation sites per task"""
+    for summary in profiler.profiles.values():
+        table = Table(title=summary.name, show_header=True, header_style="bold magenta")
+        table.add_column("Function", style="cyan")
+        table.add_column("Calls", justify="right")
+        table.add_column("Cumulative (s)", justify="right")
+        for function, calls, _, cumulative in summary.hot_functions[:top_n]:
+            table.add_row(function, str(calls), f"{cumulative:.4f}")
+        for location, size, _ in summary.allocations[:top_n]:
+            table.add_row(f"[dim]alloc {location}[/]", "", f"[dim]{size:+d} B[/]")
+        console.print(table)
 
 def display_optimization_plan(optimizer) -> None:
     """Display the optimization plan to the user"""
@@ -59,6 +89,39 @@ def display_optimization_plan(optimizer) -> None:
     console.print(Panel(table, title="Optimization Plan", border_style="blue"))
     return True
 
+def preview_cleanup(optimizer) -> Dict:
+    """Scan cleanup tasks with live running totals and display what would be deleted"""
+    totals: Dict[str, tuple] = {}
+    
+    def render(final: bool = False) -> Table:
+        title = "Cleanup Preview" if final else "Scanning..."
+        table = Table(title=title, show_header=True, header_style="bold magenta")
+        table.add_column("Task", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Directories", justify="right")
+        table.add_column("Size", justify="right")
+        for name, (files, directories, size) in totals.items():
+            table.add_row(name, f"{files:,}", f"{directories:,}", decimal(size))
+        if len(totals) > 1:
+            table.add_row(
+                "[bold]Total[/]",
+                f"[bold]{sum(t[0] for t in totals.values()):,}[/]",
+                f"[bold]{sum(t[1] for t in totals.values()):,}[/]",
+                f"[bold]{decimal(sum(t[2] for t in totals.values()))}[/]"
+            )
+        return table
+    
+    with Live(render(), console=console, refresh_per_second=8, transient=True) as live:
+        def update(task, manifest) -> None:
+            totals[task.name] = (manifest.files, manifest.directories, manifest.bytes)
+            live.update(render())
+        
+        manifests = optimizer.preview(callback=update)
+    
+    if manifests:
+        console.print(render(final=True))
+    return manifests
+
 @app.command()
 def run(
     level: str = typer.Option(
@@ -74,6 +137,90 @@ def run(
         False, 
         "--force", "-f", 
         help="Run without confirmation"
+    ),
+    quarantine: bool = typer.Option(
+        False,
+        "--quarantine",
+        help="Move cleanup targets into a restorable quarantine instead of deleting them"
+    ),
+    quarantine_days: float = typer.Option(
+        DEFAULT_MAX_AGE / 86400,
+        "--quarantine-days",
+        help="Days quarantined files stay restorable before they are purged"
+    ),
+    quarantine_mb: int = typer.Option(
+        DEFAULT_MAX_BYTES // (1024 * 1024),
+        "--quarantine-mb",
+        help="Quarantine size in MB above which the oldest items are purged"
+    ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue interrupted cleanups from their last checkpoint"
+    ),
+    duplicates: Optional[DuplicateAction] = typer.Option(
+        None,
+        "--duplicates",
+        help="Replace duplicate downloads with hard links or delete them (default: only report)"
+    ),
+    background: bool = typer.Option(
+        False,
+        "--background",
+        help="Run at low priority, rate-limited, pausing while the system is busy"
+    ),
+    max_iops: int = typer.Option(
+        DEFAULT_OPS_PER_SECOND,
+        "--max-iops",
+        help="File operations per second in background mode"
+    ),
+    max_mbps: float = typer.Option(
+        DEFAULT_BYTES_PER_SECOND / (1024 * 1024),
+        "--max-mbps",
+        help="MB read, written or deleted per second in background mode"
+    ),
+    max_load: float = typer.Option(
+        DEFAULT_MAX_LOAD * 100,
+        "--max-load",
+        help="CPU load in percent above which background mode pauses"
+    ),
+    delete_on_reboot: bool = typer.Option(
+        False,
+        "--delete-on-reboot",
+        help="Schedule files still in use after cleanup for deletion at the next restart"
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Preview what cleanup tasks would delete, then confirm before changing anything"
+    ),
+    probe: bool = typer.Option(
+        True,
+        help="Skip tasks whose target state is already in place"
+    ),
+    cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Skip tasks whose inputs are unchanged since their last successful run"
+    ),
+    metrics_json: Optional[str] = typer.Option(
+        None,
+        "--metrics-json",
+        help="Write per-task metrics as JSON to this file"
+    ),
+    metrics_prom: Optional[str] = typer.Option(
+        None,
+        "--metrics-prom",
+        help="Write per-task metrics in Prometheus textfile-collector format to this file"
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Profile each task with cProfile and tracemalloc (runs tasks one at a time)"
+    ),
+    profile_dir: Optional[str] = typer.Option(
+        None,
+        "--profile-dir",
+        help="Directory for per-task pstats files and the profile summary"
     )
 ):
     """Run optimization tasks at the specified level"""
@@ -85,8 +232,33 @@ def run(
             console.print(f"[red]Error: Invalid optimization level '{level}'. Must be one of: safe, optional, hardcore[/]")
             raise typer.Exit(1)
         
-        # Get the appropriate optimizer
-        optimizer = get_optimizer(opt_level)
+        store = None
+        if quarantine:
+            store = QuarantineStore(
+                max_age=quarantine_days * 86400,
+                max_bytes=quarantine_mb * 1024 * 1024
+            )
+        
+        # Get the appropriate optimizer; profiling needs one task at a time
+        # so allocations can be attributed to a single task, and deletions
+        # and commands on the task's thread so cProfile sees them
+        options = {'quarantine': store, 'duplicate_action': duplicates}
+        # A disk index from 'analyze disk' lets cleanups start with the largest targets
+        if os.path.exists(default_index_path()):
+            options['disk_index'] = DiskIndex()
+        if profile:
+            options['max_workers'] = 1
+            options['deletion_workers'] = 1
+            options['command_runner'] = HostedCommandRunner(max_concurrency=1)
+        if delete_on_reboot:
+            options['reboot_deleter'] = default_reboot_deleter()
+        if background:
+            options['throttle'] = Throttle(
+                ops_per_second=max_iops,
+                bytes_per_second=max_mbps * 1024 * 1024,
+                max_load=max_load / 100
+            )
+        optimizer = get_optimizer(opt_level, **options)
         
         # Display optimization plan
         console.print(f"[bold]Optimization Level:[/] [cyan]{opt_level.name.title()}[/]")
@@ -94,8 +266,15 @@ def run(
         if not display_optimization_plan(optimizer):
             return
         
+        # Preview deletions; the confirmed manifests are what gets deleted
+        if dry_run:
+            preview_cleanup(optimizer)
+            if not typer.confirm("\nDo you want to apply these changes?"):
+                console.print("[yellow]Dry run finished; nothing was changed.[/]")
+                return
+        
         # Ask for confirmation
-        if not force:
+        elif not force:
             console.print("\n[bold yellow]WARNING:[/] These changes may affect system stability.\n")
             confirm = typer.confirm("Do you want to proceed with the optimization?")
             if not confirm:
@@ -107,8 +286,8 @@ def run(
         if backup:
             with console.status("Creating backup...", spinner="dots"):
                 try:
-                    # TODO: Implement actual backup of system state
-                    backup_data = {"optimization_level": level, "tasks": []}
+                    # Everything the tasks declare, read before any of them runs
+                    backup_data = optimizer.capture_state()
                     backup_file = backup_manager.create_backup(backup_data, f"pre_optimization_{level}")
                     console.print(f"[green]✓ Backup created: {backup_file}[/]")
                 except Exception as e:
@@ -116,6 +295,18 @@ def run(
                     if not typer.confirm("Continue without backup?"):
                         return
         
+        # Attach the profiler if requested
+        profiler = None
+        if profile:
+            profile_dir = profile_dir or os.path.join(
+                os.environ.get('LOCALAPPDATA', ''),
+                'RuddibabaOptimizer',
+                'profiles',
+                datetime.now().strftime("%Y%m%d_%H%M%S")
+            )
+            profiler = TaskProfiler(profile_dir)
+            profiler.attach(optimizer)
+        
         # Run optimizations
         with Progress(
             SpinnerColumn(),
@@ -129,18 +320,81 @@ def run(
                 progress.advance(task)
             
             # Run the optimizer with progress updates
-            results = optimizer.run_all(progress_callback=progress_callback)
+            results = optimizer.run_all(
+                progress_callback=progress_callback,
+                probe=probe,
+                use_cache=cache,
+                resume=resume
+            )
+        
+        if profiler:
+            profiler.detach(optimizer)
+        
+        # Reclaim space from expired quarantine items while results are shown
+        purger = None
+        if store:
+            purger = QuarantinePurger(store)
+            purger.start()
         
         # Display results
         success_count = sum(1 for r in results.values() if r)
         total_count = len(results)
+        compliant = [
+            name for name, status in optimizer.last_status.items()
+            if status is TaskStatus.COMPLIANT
+        ]
+        cached = [
+            name for name, status in optimizer.last_status.items()
+            if status is TaskStatus.CACHED
+        ]
         
         console.print(f"\n[bold]Optimization Complete![/]")
         console.print(f"[green]✓ {success_count} of {total_count} tasks completed successfully[/]")
+        for name in compliant:
+            console.print(f"[dim]  {name}: already compliant[/]")
+        for name in cached:
+            console.print(f"[dim]  {name}: unchanged since last run[/]")
+        
+        deferred = [r for r in optimizer.last_results.values() if r.files_deferred]
+        if deferred:
+            console.print(
+                f"[dim]  {sum(r.files_deferred for r in deferred):,} file(s) in use were left in place "
+                f"({decimal(sum(r.bytes_deferred for r in deferred))})"
+                f"{'; they will be deleted at the next restart' if delete_on_reboot else ''}[/]"
+            )
+        
+        report = optimizer.duplicates
+        if report and report.groups:
+            console.print(
+                f"[dim]  Duplicates: {len(report.groups)} group(s), "
+                f"{decimal(report.reclaimable)} reclaimable[/]"
+            )
         
         if backup_file:
             console.print(f"\n[dim]Backup saved to: {backup_file}[/]")
         
+        if profiler:
+            display_profile(profiler)
+            console.print(f"[dim]Profiles written to: {profiler.output_dir}[/]")
+        
+        if purger:
+            try:
+                with console.status("Purging expired quarantine items...", spinner="dots"):
+                    purger.join()
+            except KeyboardInterrupt:
+                purger.stop()
+                console.print("[yellow]Purge interrupted; it will continue on the next run.[/]")
+            if purger.freed:
+                console.print(f"[dim]Freed {decimal(purger.freed)} from quarantine[/]")
+        
+        # Export metrics if requested
+        if metrics_json:
+            export_json(optimizer.last_results, metrics_json, opt_level.name.lower())
+            console.print(f"[dim]Metrics written to: {metrics_json}[/]")
+        if metrics_prom:
+            export_prometheus(optimizer.last_results, metrics_prom, opt_level.name.lower())
+            console.print(f"[dim]Metrics written to: {metrics_prom}[/]")
+        
     except Exception as e:
         logger.exception("Error during optimization")
         console.print(f"[red]Error: {str(e)}[/]")
@@ -154,5 +408,40 @@ def list():
         console.print(f"\n[bold magenta]=== {level.name.title()} Optimizations ===[/]")
         display_optimization_plan(optimizer)
 
+@app.command("quarantine-list")
+def quarantine_list():
+    """List quarantined cleanup items that can still be restored"""
+    items = backup_manager.list_quarantined()
+    if not items:
+        console.print("[yellow]Quarantine is empty.[/]")
+        return
+    
+    table = Table(title="Quarantine", show_header=True, header_style="bold magenta")
+    table.add_column("ID", style="cyan")
+    table.add_column("Original Location")
+    table.add_column("Quarantined")
+    table.add_column("Entries", justify="right")
+    table.add_column("Size", justify="right")
+    for item in items:
+        table.add_row(
+            item.id,
+            item.original_path,
+            datetime.fromtimestamp(item.created).strftime("%Y-%m-%d %H:%M"),
+            str(item.entries),
+            decimal(item.size) if item.size is not None else "-"
+        )
+    console.print(table)
+
+@app.command("quarantine-restore")
+def quarantine_restore(
+    item_id: str = typer.Argument(..., help="ID of the item, as shown by quarantine-list")
+):
+    """Restore a quarantined item to its original location"""
+    if backup_manager.restore_quarantined(item_id):
+        console.print(f"[green]✓ Restored {item_id}[/]")
+    else:
+        console.print(f"[red]Could not fully restore {item_id}; see the log for details[/]")
+        raise typer.Exit(1)
+
 if __name__ == "__main__":
     app()
@@ -1,22 +1,47 @@
 """
 Backup and restore functionality for Ruddibaba Optimizer
+
+Backups are written record by record in the compressed, indexed format of
+backupfile, so a single registry key or file can be restored without
+reading the rest. Older plain JSON backups still restore. File contents
+are kept in a content-addressed ChunkStore under the backups directory,
+so a backup holds only chunk references and repeated backups of
+unchanged files cost next to nothing. A BackupCatalog indexes every
+backup by time, level, host and contained keys, so listing and pruning
+backups never opens them.
 """
 import os
 import json
+import time
+import socket
 import shutil
 import tempfile
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
-import winreg
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from .backupcatalog import KEYED_SECTIONS, BackupCatalog, BackupEntry, select_expired
+from .backupfile import BackupReader, BackupWriter, is_backup_file
+from .chunkstore import ChunkStore, FileRecord
+from .quarantine import QuarantineItem, QuarantineStore
+from .registry import RegistryBackend, RegistryTransaction, default_registry_backend, split_key_path
 
 class BackupManager:
     """Manages backup and restore operations for system optimizations"""
     
-    def __init__(self, backup_dir: Optional[str] = None):
+    def __init__(
+        self,
+        backup_dir: Optional[str] = None,
+        registry_backend: Optional[RegistryBackend] = None,
+        quarantine: Optional[QuarantineStore] = None
+    ):
         """Initialize the backup manager"""
         self.logger = logging.getLogger(__name__)
+        self.registry_backend = registry_backend or default_registry_backend()
+        self._quarantine = quarantine
+        self._chunks: Optional[ChunkStore] = None
+        self._catalog: Optional[BackupCatalog] = None
         self.backup_dir = backup_dir or os.path.join(
             os.environ.get('LOCALAPPDATA', ''),
             'RuddibabaOptimizer',
@@ -28,6 +53,12 @@ class BackupManager:
         """
         Create a backup of the current system state
         
+        When backup_data['files'] is a list of paths, those files are
+        saved in the chunk store and the list is replaced by their chunk
+        records. Unreferenced chunks are then collected incrementally.
+        The backup is stamped with its creation time and host, and added
+        to the catalog.
+        
         Args:
             backup_data: Dictionary containing data to back up
             backup_name: Name for the backup
@@ -37,24 +68,40 @@ class BackupManager:
         """
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(self.backup_dir, f"{backup_name}_{timestamp}.json")
+            backup_file = os.path.join(self.backup_dir, f"{backup_name}_{timestamp}.rbk")
+            
+            records: Dict[str, FileRecord] = {}
+            if isinstance(backup_data.get('files'), list):
+                records = self.chunks.store(backup_data['files'])
+                backup_data = dict(backup_data, files=records)
+            backup_data = dict(backup_data, created=time.time(), host=socket.gethostname())
             
-            with open(backup_file, 'w') as f:
-                json.dump(backup_data, f, indent=2)
+            with BackupWriter(backup_file, default=_encode) as writer:
+                writer.write_dict(backup_data)
                 
             self.logger.info(f"Created backup at: {backup_file}")
+            try:
+                self.catalog.add(backup_file, backup_data, _catalog_keys(backup_data))
+            except Exception as e:
+                # The next sync indexes it from the file instead
+                self.logger.warning(f"Could not add {backup_file} to the catalog: {str(e)}")
+            if records:
+                self._write_refs(backup_file, records)
+                self.collect_chunks()
             return backup_file
             
         except Exception as e:
             self.logger.error(f"Failed to create backup: {str(e)}")
             raise
     
-    def restore_backup(self, backup_file: str) -> bool:
+    def restore_backup(self, backup_file: str, keys: Optional[Iterable[str]] = None) -> bool:
         """
         Restore system state from a backup file
         
         Args:
             backup_file: Path to the backup file to restore from
+            keys: Only restore these registry key paths and file paths;
+                in the compressed format only their blocks are read
             
         Returns:
             bool: True if restore was successful, False otherwise
@@ -63,19 +110,32 @@ class BackupManager:
             if not os.path.exists(backup_file):
                 self.logger.error(f"Backup file not found: {backup_file}")
                 return False
-                
-            with open(backup_file, 'r') as f:
-                backup_data = json.load(f)
             
             self.logger.info(f"Restoring from backup: {backup_file}")
             
-            # Restore registry values
-            if 'registry' in backup_data:
-                self._restore_registry(backup_data['registry'])
-                
-            # Restore files
-            if 'files' in backup_data:
-                self._restore_files(backup_data['files'])
+            if is_backup_file(backup_file):
+                with BackupReader(backup_file, object_hook=_decode) as reader:
+                    if keys is None:
+                        registry = ((k, v) for _, k, v in reader.records('registry'))
+                        files = ((k, v) for _, k, v in reader.records('files'))
+                    else:
+                        keys = list(keys)
+                        registry = _lookup(reader, 'registry', keys)
+                        files = _lookup(reader, 'files', keys)
+                    self._restore_registry(registry)
+                    self._restore_files(files)
+            else:
+                # Plain JSON backups from earlier versions
+                with open(backup_file, 'r') as f:
+                    backup_data = json.load(f, object_hook=_decode)
+                registry = backup_data.get('registry', {})
+                files = backup_data.get('files', {})
+                if keys is not None:
+                    keys = set(keys)
+                    registry = {k: v for k, v in registry.items() if k in keys}
+                    files = {k: v for k, v in files.items() if k in keys}
+                self._restore_registry(registry.items())
+                self._restore_files(files.items())
                 
             self.logger.info("Backup restore completed successfully")
             return True
@@ -84,35 +144,220 @@ class BackupManager:
             self.logger.error(f"Failed to restore backup: {str(e)}")
             return False
     
-    def _restore_registry(self, registry_data: Dict[str, Any]) -> None:
-        """Restore registry values from backup"""
-        for key_path, values in registry_data.items():
+    def load_backup(self, backup_file: str) -> Dict[str, Any]:
+        """The full contents of a backup, in either format"""
+        if is_backup_file(backup_file):
+            with BackupReader(backup_file, object_hook=_decode) as reader:
+                return reader.to_dict()
+        with open(backup_file, 'r') as f:
+            return json.load(f, object_hook=_decode)
+    
+    @property
+    def quarantine(self) -> QuarantineStore:
+        """The quarantine store, created on first use"""
+        if self._quarantine is None:
+            self._quarantine = QuarantineStore()
+        return self._quarantine
+    
+    @property
+    def chunks(self) -> ChunkStore:
+        """The chunk store holding backed-up file contents, created on first use"""
+        if self._chunks is None:
+            self._chunks = ChunkStore(os.path.join(self.backup_dir, 'chunks'))
+        return self._chunks
+    
+    @property
+    def catalog(self) -> BackupCatalog:
+        """The backup catalog, created on first use"""
+        if self._catalog is None:
+            self._catalog = BackupCatalog(os.path.join(self.backup_dir, 'catalog.sqlite3'))
+        return self._catalog
+    
+    def list_backups(
+        self,
+        level: Optional[str] = None,
+        key: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[BackupEntry]:
+        """
+        Backups in the backup directory, newest first
+        
+        Args:
+            level: Only backups taken before runs at this level
+            key: Only backups holding this registry key path or file path
+            limit: At most this many backups
+        """
+        self.catalog.sync(self.backup_dir, self.index_backup)
+        return self.catalog.list(level=level, key=key, limit=limit)
+    
+    def index_backup(self, backup_file: str) -> BackupEntry:
+        """Add a backup file to the catalog, reading only what the catalog needs"""
+        if is_backup_file(backup_file):
+            with BackupReader(backup_file, object_hook=_decode) as reader:
+                sections = reader.sections()
+                metadata = {
+                    name: reader.get(name) for name in ('created', 'optimization_level', 'host')
+                    if name in sections
+                }
+                keys = [(section, key) for section in KEYED_SECTIONS for key in reader.keys(section)]
+            return self.catalog.add(backup_file, metadata, keys)
+        backup_data = self.load_backup(backup_file)
+        return self.catalog.add(backup_file, backup_data, _catalog_keys(backup_data))
+    
+    def prune_backups(
+        self,
+        keep: Optional[int] = None,
+        max_age: Optional[float] = None,
+        dry_run: bool = False
+    ) -> List[BackupEntry]:
+        """
+        Delete backups outside a retention policy
+        
+        The newest backup of each optimization level is always kept.
+        Chunks only the deleted backups referred to are collected after.
+        
+        Args:
+            keep: Keep at most this many backups per level
+            max_age: Delete backups older than this many seconds
+            dry_run: Only report what would be deleted
+            
+        Returns:
+            The backups deleted, or that would be, oldest first
+        """
+        expired = select_expired(self.list_backups(), keep=keep, max_age=max_age)
+        if dry_run:
+            return expired
+        
+        deleted: List[BackupEntry] = []
+        for entry in expired:
             try:
-                # Handle different registry hives
-                if key_path.startswith('HKCU'):
-                    hive = winreg.HKEY_CURRENT_USER
-                    sub_key = key_path[5:]  # Remove 'HKCU\' prefix
-                elif key_path.startswith('HKLM'):
-                    hive = winreg.HKEY_LOCAL_MACHINE
-                    sub_key = key_path[5:]  # Remove 'HKLM\' prefix
-                else:
-                    self.logger.warning(f"Unsupported registry hive in {key_path}")
-                    continue
-                
-                # Create or open the registry key
-                with winreg.CreateKey(hive, sub_key) as key:
-                    for value_name, (value_type, value_data) in values.items():
-                        winreg.SetValueEx(key, value_name, 0, value_type, value_data)
-                        
-            except Exception as e:
-                self.logger.error(f"Failed to restore registry key {key_path}: {str(e)}")
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.error(f"Failed to delete backup {entry.path}: {str(e)}")
+                continue
+            self.catalog.remove(entry.path)
+            deleted.append(entry)
+        if deleted:
+            self.catalog.vacuum()
+            self.logger.info(f"Pruned {len(deleted)} backup(s)")
+            self.collect_chunks()
+        return deleted
     
-    def _restore_files(self, files_data: Dict[str, str]) -> None:
-        """Restore files from backup"""
-        for dest_path, source_path in files_data.items():
+    def collect_chunks(self) -> int:
+        """
+        Remove chunks no remaining backup refers to, a few shards at a time
+        
+        Every backup with files has a small reference file next to the
+        chunk store, so this never parses the backups themselves.
+        Reference files of deleted backups are removed first.
+        
+        Returns:
+            Chunks removed
+        """
+        refs_dir = os.path.join(self.chunks.root, 'refs')
+        referenced: List[FileRecord] = []
+        try:
+            names = os.listdir(refs_dir)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            refs_path = os.path.join(refs_dir, name)
+            if not os.path.exists(os.path.join(self.backup_dir, name)):
+                os.remove(refs_path)
+                continue
+            try:
+                with open(refs_path, 'r') as f:
+                    referenced.append({'chunks': json.load(f)})
+            except (OSError, ValueError) as e:
+                # Without its references nothing can safely be collected
+                self.logger.warning(f"Skipping chunk collection; unreadable {refs_path}: {str(e)}")
+                return 0
+        return self.chunks.collect(referenced)
+    
+    def list_quarantined(self) -> List[QuarantineItem]:
+        """List files moved into quarantine that can still be restored"""
+        return self.quarantine.list()
+    
+    def restore_quarantined(self, item_id: str) -> bool:
+        """
+        Restore a quarantined item to its original location
+        
+        Args:
+            item_id: ID of the item, as listed by list_quarantined
+            
+        Returns:
+            bool: True if every entry was restored, False otherwise
+        """
+        try:
+            return self.quarantine.restore(item_id)
+        except Exception as e:
+            self.logger.error(f"Failed to restore quarantined item {item_id}: {str(e)}")
+            return False
+    
+    def _restore_registry(self, registry_data: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Restore registry values from backup, given as (key path, values) pairs"""
+        transaction = RegistryTransaction(self.registry_backend)
+        for key_path, values in registry_data:
+            try:
+                split_key_path(key_path)
+            except ValueError:
+                self.logger.warning(f"Unsupported registry hive in {key_path}")
+                continue
+            
+            for value_name, (value_type, value_data) in values.items():
+                transaction.set(key_path, value_name, value_type, value_data)
+        
+        # Failures are logged per key by the transaction
+        transaction.commit()
+    
+    def _write_refs(self, backup_file: str, records: Dict[str, FileRecord]) -> None:
+        """Record the chunks a backup refers to, for collect_chunks"""
+        refs_dir = os.path.join(self.chunks.root, 'refs')
+        os.makedirs(refs_dir, exist_ok=True)
+        chunks = sorted({digest for record in records.values() for digest in record['chunks']})
+        with open(os.path.join(refs_dir, os.path.basename(backup_file)), 'w') as f:
+            json.dump(chunks, f)
+    
+    def _restore_files(self, files_data: Iterable[Tuple[str, Any]]) -> None:
+        """Restore files from backup, as (path, chunk record or path of a copy) pairs"""
+        for dest_path, source in files_data:
             try:
-                if os.path.exists(source_path):
+                if isinstance(source, dict):
+                    self.chunks.restore(source, dest_path)
+                elif os.path.exists(source):
                     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                    shutil.copy2(source_path, dest_path)
+                    shutil.copy2(source, dest_path)
             except Exception as e:
                 self.logger.error(f"Failed to restore file {dest_path}: {str(e)}")
+
+# Tag of bytes in JSON; registry and file data never map a name to a string
+BYTES_TAG = '__bytes__'
+
+def _encode(value: Any) -> Any:
+    """JSON form of registry data such as REG_BINARY bytes"""
+    if isinstance(value, bytes):
+        return {BYTES_TAG: value.hex()}
+    raise TypeError(f"Cannot back up {type(value).__name__} values")
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    """Inverse of _encode, applied to every JSON object on load"""
+    if len(obj) == 1 and isinstance(obj.get(BYTES_TAG), str):
+        return bytes.fromhex(obj[BYTES_TAG])
+    return obj
+
+def _catalog_keys(backup_data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """The (section, key) pairs of a backup dictionary the catalog indexes"""
+    return [
+        (section, key) for section in KEYED_SECTIONS
+        if isinstance(backup_data.get(section), dict)
+        for key in backup_data[section]
+    ]
+
+def _lookup(reader: BackupReader, section: str, keys: List[str]) -> Iterator[Tuple[str, Any]]:
+    """The records of a section with the given keys, skipping keys it lacks"""
+    present = set(reader.keys(section))
+    for key in keys:
+        if key in present:
+            yield key, reader.get(section, key)
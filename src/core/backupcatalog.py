@@ -0,0 +1,318 @@
+"""
+SQLite catalog of backups for Ruddibaba Optimizer
+
+BackupCatalog keeps one row per backup file with its creation time,
+optimization level, host and size, plus the registry keys and file paths
+it contains. Listing backups, finding the latest one for a level or
+finding every backup that holds a given key are then single indexed
+queries, however many backups scheduled runs have left behind. Backup
+files are only opened to index them once; sync() picks up backups the
+catalog does not know yet, such as those written before it existed, and
+drops rows of backup files deleted by hand.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Top-level sections of a backup whose keys are indexed
+KEYED_SECTIONS = ('registry', 'files')
+
+BACKUP_EXTENSIONS = ('.rbk', '.json')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    created REAL NOT NULL,
+    level TEXT,
+    host TEXT,
+    size INTEGER NOT NULL,
+    keys INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS backups_created ON backups (created);
+CREATE INDEX IF NOT EXISTS backups_level ON backups (level, created);
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    section TEXT NOT NULL,
+    key TEXT NOT NULL,
+    UNIQUE (section, key)
+);
+CREATE INDEX IF NOT EXISTS keys_key ON keys (key);
+CREATE TABLE IF NOT EXISTS backup_keys (
+    backup INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    PRIMARY KEY (backup, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS backup_keys_key ON backup_keys (key);
+"""
+
+@dataclass
+class BackupEntry:
+    """Catalog row of one backup"""
+    path: str
+    name: str
+    created: float
+    level: Optional[str]
+    host: Optional[str]
+    size: int
+    # Registry keys and files it holds
+    keys: int
+
+class BackupCatalog:
+    """Index of the backups in one backup directory"""
+
+    def __init__(self, path: str):
+        """
+        Open or create the catalog
+
+        Args:
+            path: Database file
+        """
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # The GUI creates backups from worker threads
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("CREATE TEMP TABLE added (section TEXT NOT NULL, key TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        path: str,
+        metadata: Dict[str, Any],
+        keys: Iterable[Tuple[str, str]]
+    ) -> BackupEntry:
+        """
+        Index a backup, replacing any earlier row for the same file
+
+        Args:
+            path: Backup file
+            metadata: Top-level scalars of the backup: 'created',
+                'optimization_level' and 'host' are used when present
+            keys: (section, key) pairs the backup contains
+
+        Returns:
+            The new catalog row
+        """
+        info = os.stat(path)
+        keys = list(keys)
+        entry = BackupEntry(
+            path=os.path.abspath(path),
+            name=_backup_name(path),
+            created=float(metadata.get('created') or info.st_mtime),
+            level=metadata.get('optimization_level'),
+            host=metadata.get('host'),
+            size=info.st_size,
+            keys=len(keys)
+        )
+        with self._lock:
+            try:
+                self._delete(entry.path)
+                backup_id = self._conn.execute(
+                    "INSERT INTO backups (path, name, created, level, host, size, keys) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry.path, entry.name, entry.created, entry.level,
+                     entry.host, entry.size, entry.keys)
+                ).lastrowid
+                # Set-based inserts through a staging table are several
+                # times faster than one key lookup per row
+                self._conn.execute("DELETE FROM added")
+                self._conn.executemany("INSERT INTO added VALUES (?, ?)", keys)
+                self._conn.execute("INSERT OR IGNORE INTO keys (section, key) SELECT section, key FROM added")
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO backup_keys "
+                    "SELECT ?, keys.id FROM added JOIN keys USING (section, key)",
+                    (backup_id,)
+                )
+                self._conn.execute("DELETE FROM added")
+            finally:
+                self._conn.commit()
+        return entry
+
+    def remove(self, path: str) -> None:
+        """Drop a backup from the catalog"""
+        with self._lock:
+            try:
+                self._delete(os.path.abspath(path))
+            finally:
+                self._conn.commit()
+
+    def get(self, path: str) -> Optional[BackupEntry]:
+        """The catalog row of a backup file, or None if it is not indexed"""
+        return next(iter(self._select("WHERE path = ?", (os.path.abspath(path),))), None)
+
+    def list(
+        self,
+        level: Optional[str] = None,
+        key: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[BackupEntry]:
+        """
+        Indexed backups, newest first
+
+        Args:
+            level: Only backups taken before runs at this level
+            key: Only backups holding this registry key or file
+            limit: At most this many backups
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        if level is not None:
+            clauses.append("level = ?")
+            params.append(level)
+        if key is not None:
+            clauses.append(
+                "id IN (SELECT backup_keys.backup FROM backup_keys "
+                "JOIN keys ON keys.id = backup_keys.key WHERE keys.key = ?)"
+            )
+            params.append(key)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        where += "ORDER BY created DESC"
+        if limit is not None:
+            where += " LIMIT ?"
+            params.append(limit)
+        return self._select(where, params)
+
+    def latest(self, level: Optional[str] = None) -> Optional[BackupEntry]:
+        """The newest backup, optionally of one level"""
+        entries = self.list(level=level, limit=1)
+        return entries[0] if entries else None
+
+    def keys(self, path: str) -> Dict[str, List[str]]:
+        """The keys of one backup by section, from the catalog alone"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT keys.section, keys.key FROM backups "
+                "JOIN backup_keys ON backup_keys.backup = backups.id "
+                "JOIN keys ON keys.id = backup_keys.key "
+                "WHERE backups.path = ? ORDER BY keys.section, keys.key",
+                (os.path.abspath(path),)
+            ).fetchall()
+        sections: Dict[str, List[str]] = {}
+        for section, key in rows:
+            sections.setdefault(section, []).append(key)
+        return sections
+
+    def sync(self, backup_dir: str, indexer: Callable[[str], Any]) -> Tuple[int, int]:
+        """
+        Bring the catalog in line with the backup files on disk
+
+        Only files the catalog has no row for are opened.
+
+        Args:
+            backup_dir: Directory holding the backups
+            indexer: Called with a backup file to index it; failures are
+                logged and the file is left out
+
+        Returns:
+            (backups added, rows of missing backups dropped)
+        """
+        try:
+            on_disk = {
+                os.path.abspath(entry.path) for entry in os.scandir(backup_dir)
+                if entry.is_file() and entry.name.endswith(BACKUP_EXTENSIONS)
+            }
+        except OSError as e:
+            self.logger.warning(f"Could not list backups in {backup_dir}: {str(e)}")
+            return 0, 0
+        prefix = os.path.join(os.path.abspath(backup_dir), '')
+        with self._lock:
+            known = {
+                path for (path,) in self._conn.execute(
+                    "SELECT path FROM backups WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+                )
+            }
+
+        added = 0
+        for path in sorted(on_disk - known):
+            try:
+                indexer(path)
+                added += 1
+            except Exception as e:
+                self.logger.warning(f"Could not index backup {path}: {str(e)}")
+        missing = known - on_disk
+        for path in missing:
+            self.remove(path)
+        if added or missing:
+            self.logger.info(f"Backup catalog: indexed {added}, dropped {len(missing)} missing")
+        return added, len(missing)
+
+    def vacuum(self) -> None:
+        """Drop keys no backup refers to any more"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "DELETE FROM keys WHERE NOT EXISTS "
+                    "(SELECT 1 FROM backup_keys WHERE backup_keys.key = keys.id)"
+                )
+            finally:
+                self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _select(self, where: str, params: Iterable[Any]) -> List[BackupEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path, name, created, level, host, size, keys FROM backups {where}",
+                tuple(params)
+            ).fetchall()
+        return [BackupEntry(*row) for row in rows]
+
+    def _delete(self, path: str) -> None:
+        row = self._conn.execute("SELECT id FROM backups WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM backup_keys WHERE backup = ?", row)
+            self._conn.execute("DELETE FROM backups WHERE id = ?", row)
+
+def select_expired(
+    entries: List[BackupEntry],
+    keep: Optional[int] = None,
+    max_age: Optional[float] = None,
+    now: Optional[float] = None
+) -> List[BackupEntry]:
+    """
+    The backups a retention policy removes
+
+    Each level is treated on its own, so frequent safe runs never push
+    out the only backup taken before a hardcore run, and the newest
+    backup of each level is always kept.
+
+    Args:
+        entries: Catalog rows, in any order
+        keep: Keep at most this many backups per level
+        max_age: Remove backups older than this many seconds
+
+    Returns:
+        Rows to remove, oldest first
+    """
+    now = time.time() if now is None else now
+    by_level: Dict[Optional[str], List[BackupEntry]] = {}
+    for entry in entries:
+        by_level.setdefault(entry.level, []).append(entry)
+
+    expired: List[BackupEntry] = []
+    for level_entries in by_level.values():
+        level_entries.sort(key=lambda entry: entry.created, reverse=True)
+        for position, entry in enumerate(level_entries[1:], start=1):
+            if keep is not None and position >= keep:
+                expired.append(entry)
+            elif max_age is not None and now - entry.created > max_age:
+                expired.append(entry)
+    return sorted(expired, key=lambda entry: entry.created)
+
+def _backup_name(path: str) -> str:
+    """The name a backup was created with, without its timestamp suffix"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.rsplit('_', 2)
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        return parts[0]
+    return stem
@@ -0,0 +1,225 @@
+"""
+Compressed, seekable backup file format for Ruddibaba Optimizer
+
+A backup is a sequence of records, each a section name, a key within the
+section and a JSON value: ("registry", key path, values) or ("files", path,
+chunk record). Top-level scalars such as the optimization level are
+records with no key. Records are written one at a time, as JSON lines
+grouped into blocks of about BLOCK_SIZE bytes, and each block is zlib
+compressed on its own. An index at the end of the file maps every
+section and key to its block, so a single registry key or file can be
+read by decompressing one block.
+
+Layout::
+
+    MAGIC
+    block*                  zlib-compressed JSON lines
+    index                   zlib-compressed JSON
+    index offset (8 bytes, little-endian), MAGIC
+"""
+import os
+import json
+import uuid
+import zlib
+import struct
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b'RBK1'
+
+# Uncompressed bytes of records per block
+BLOCK_SIZE = 64 * 1024
+
+COMPRESSION_LEVEL = 6
+
+_TRAILER = struct.Struct('<Q')
+
+# (section, key, value); key is None for a top-level scalar
+Record = Tuple[str, Optional[str], Any]
+
+def is_backup_file(path: str) -> bool:
+    """Whether path is in this format rather than a plain JSON backup"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class BackupWriter:
+    """Writes a backup record by record; the file appears only on close()"""
+
+    def __init__(self, path: str, default: Optional[Callable[[Any], Any]] = None):
+        """
+        Initialize the writer
+
+        Args:
+            path: Backup file to create
+            default: JSON fallback for values such as bytes, as for json.dumps
+        """
+        self.path = path
+        self.default = default
+        self._temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        self._file = open(self._temp_path, 'wb')
+        self._file.write(MAGIC)
+        self._blocks: List[Tuple[int, int]] = []
+        self._index: Dict[str, Dict[str, int]] = {}
+        self._lines: List[bytes] = []
+        self._buffered = 0
+
+    def __enter__(self) -> 'BackupWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, section: str, key: Optional[str], value: Any) -> None:
+        """Add one record"""
+        line = json.dumps([section, key, value], default=self.default).encode('utf-8') + b'\n'
+        self._index.setdefault(section, {})[key if key is not None else ''] = len(self._blocks)
+        self._lines.append(line)
+        self._buffered += len(line)
+        if self._buffered >= BLOCK_SIZE:
+            self._flush_block()
+
+    def write_dict(self, data: Dict[str, Any]) -> None:
+        """Add a backup dictionary: dict entries become keyed sections"""
+        for section, value in data.items():
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    self.write(section, key, item)
+            else:
+                self.write(section, None, value)
+
+    def close(self) -> None:
+        """Write the index and move the finished file into place"""
+        self._flush_block()
+        index_offset = self._file.tell()
+        self._file.write(zlib.compress(
+            json.dumps({'blocks': self._blocks, 'keys': self._index}).encode('utf-8'),
+            COMPRESSION_LEVEL
+        ))
+        self._file.write(_TRAILER.pack(index_offset) + MAGIC)
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self) -> None:
+        """Discard everything written"""
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def _flush_block(self) -> None:
+        if not self._lines:
+            return
+        data = zlib.compress(b''.join(self._lines), COMPRESSION_LEVEL)
+        self._blocks.append((self._file.tell(), len(data)))
+        self._file.write(data)
+        self._lines = []
+        self._buffered = 0
+
+class BackupReader:
+    """Reads a backup record by record, or one key at a time"""
+
+    def __init__(self, path: str, object_hook: Optional[Callable[[Dict], Any]] = None):
+        """
+        Open a backup and read its index
+
+        Args:
+            path: Backup file
+            object_hook: Applied to decoded JSON objects, as for json.loads
+
+        Raises:
+            ValueError: If the file is not a complete backup in this format
+        """
+        self.path = path
+        self.object_hook = object_hook
+        self._file = open(path, 'rb')
+        try:
+            trailer_size = _TRAILER.size + len(MAGIC)
+            self._file.seek(-trailer_size, os.SEEK_END)
+            trailer = self._file.read(trailer_size)
+            if self._read_at(0, len(MAGIC)) != MAGIC or not trailer.endswith(MAGIC):
+                raise ValueError(f"{path} is not a complete backup file")
+            index_offset = _TRAILER.unpack(trailer[:_TRAILER.size])[0]
+            end = self._file.seek(0, os.SEEK_END) - trailer_size
+            index = json.loads(zlib.decompress(self._read_at(index_offset, end - index_offset)))
+        except (OSError, zlib.error):
+            self._file.close()
+            raise ValueError(f"{path} is not a complete backup file")
+        except ValueError:
+            self._file.close()
+            raise
+        self._blocks: List[List[int]] = index['blocks']
+        self._keys: Dict[str, Dict[str, int]] = index['keys']
+        self._cached: Tuple[int, List[Record]] = (-1, [])
+
+    def __enter__(self) -> 'BackupReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def sections(self) -> List[str]:
+        return list(self._keys)
+
+    def keys(self, section: str) -> List[str]:
+        """Keys of a keyed section, from the index alone"""
+        return [key for key in self._keys.get(section, {}) if key]
+
+    def records(self, section: Optional[str] = None) -> Iterator[Record]:
+        """
+        Every record in file order, decompressing one block at a time
+
+        Args:
+            section: Only records of this section; blocks without any are skipped
+        """
+        if section is None:
+            numbers = range(len(self._blocks))
+        else:
+            numbers = sorted(set(self._keys.get(section, {}).values()))
+        for number in numbers:
+            for record in self._block(number):
+                if section is None or record[0] == section:
+                    yield record
+
+    def get(self, section: str, key: Optional[str] = None) -> Any:
+        """
+        The value of one record, decompressing only its block
+
+        Raises:
+            KeyError: If the backup has no such record
+        """
+        number = self._keys.get(section, {}).get(key if key is not None else '')
+        if number is not None:
+            # A key written twice is indexed at its last block; the last record wins
+            for record_section, record_key, value in reversed(self._block(number)):
+                if record_section == section and record_key == key:
+                    return value
+        raise KeyError(f"{section}/{key}" if key is not None else section)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The whole backup as a dictionary, as it was written"""
+        data: Dict[str, Any] = {}
+        for section, key, value in self.records():
+            if key is None:
+                data[section] = value
+            else:
+                data.setdefault(section, {})[key] = value
+        return data
+
+    def _block(self, number: int) -> List[Record]:
+        if self._cached[0] != number:
+            offset, length = self._blocks[number]
+            lines = zlib.decompress(self._read_at(offset, length)).splitlines()
+            self._cached = (number, [
+                tuple(json.loads(line, object_hook=self.object_hook)) for line in lines
+            ])
+        return self._cached[1]
+
+    def _read_at(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
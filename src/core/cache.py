@@ -0,0 +1,134 @@
+"""
+Persistent task fingerprint cache for Ruddibaba Optimizer
+
+After a task succeeds, a fingerprint of the inputs it acted on (registry
+values, service start types, directory mtimes) is stored on disk. On the
+next run, a task whose fingerprint is unchanged and not expired is skipped
+without doing any work.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from .state import RegistryState
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+def default_cache_path() -> str:
+    """Location of the cache file under the application data directory"""
+    return os.path.join(
+        os.environ.get('LOCALAPPDATA', ''),
+        'RuddibabaOptimizer',
+        'cache',
+        'task_fingerprints.json'
+    )
+
+def fingerprint(desired: RegistryState, current: RegistryState, paths: Iterable[str]) -> str:
+    """
+    Hash the inputs a task depends on
+
+    Args:
+        desired: State the task declares, so definition changes invalidate entries
+        current: Current registry values for the task's declared keys
+        paths: Directories whose modification times should be included
+
+    Returns:
+        Hex digest identifying the inputs
+    """
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+
+    relevant = {
+        key_path: {name: current.get(key_path, {}).get(name) for name in values}
+        for key_path, values in desired.items()
+    }
+    payload = json.dumps(
+        {'desired': desired, 'current': relevant, 'mtimes': mtimes},
+        sort_keys=True,
+        default=_encode
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _encode(value: Any) -> Any:
+    """JSON fallback for registry data such as REG_BINARY bytes"""
+    if isinstance(value, bytes):
+        return value.hex()
+    return repr(value)
+
+class TaskCache:
+    """Maps task names to the fingerprint recorded after their last success"""
+
+    def __init__(self, path: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Initialize the cache
+
+        Args:
+            path: Cache file (default: under %LOCALAPPDATA%\\RuddibabaOptimizer\\cache)
+            max_age: Seconds after which an entry is ignored
+        """
+        self.path = path or default_cache_path()
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Ignoring unreadable task cache {self.path}: {str(e)}")
+                self._entries = {}
+        return self._entries
+
+    def is_fresh(self, task_name: str, task_fingerprint: str) -> bool:
+        """Whether the task last succeeded against the same inputs, recently enough"""
+        with self._lock:
+            entry = self._load().get(task_name)
+        if not entry or entry.get('fingerprint') != task_fingerprint:
+            return False
+        return time.time() - entry.get('timestamp', 0) <= self.max_age
+
+    def put(self, task_name: str, task_fingerprint: str) -> None:
+        """Record the fingerprint of a task that just succeeded"""
+        with self._lock:
+            self._load()[task_name] = {
+                'fingerprint': task_fingerprint,
+                'timestamp': time.time()
+            }
+
+    def invalidate(self, task_name: Optional[str] = None) -> None:
+        """Forget one task, or every task if no name is given"""
+        with self._lock:
+            entries = self._load()
+            if task_name is None:
+                entries.clear()
+            else:
+                entries.pop(task_name, None)
+
+    def save(self) -> None:
+        """Write the cache to disk, dropping expired entries"""
+        with self._lock:
+            now = time.time()
+            entries = {
+                name: entry for name, entry in self._load().items()
+                if now - entry.get('timestamp', 0) <= self.max_age
+            }
+            self._entries = entries
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
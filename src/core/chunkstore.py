@@ -0,0 +1,227 @@
+"""
+Content-addressed chunk store for file backups in Ruddibaba Optimizer
+
+Backed-up files are split into CHUNK_SIZE chunks. Each chunk is stored
+once, named after its BLAKE2b hash, so a backup only records each file's
+size, mtime and list of chunk hashes. Backing up an unchanged file again
+writes nothing. The store keeps an index of the chunks last recorded for
+each path, keyed by size and mtime, so an unchanged file is not even read.
+
+Chunks no longer referenced by any backup are removed by collect(). Each
+call sweeps only a few of the 256 shard directories and remembers where
+it stopped, so the cost is spread across backups.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+# Shard directories swept per collect() call
+DEFAULT_GC_SHARDS = 16
+
+# Chunks younger than this are never collected, so a backup still being
+# written cannot lose chunks it has stored but not yet referenced
+GC_GRACE_PERIOD = 60 * 60
+
+# How a backup describes one file: {'size', 'mtime', 'chunks'}
+FileRecord = Dict[str, Any]
+
+class ChunkStore:
+    """Deduplicated storage of file contents, by chunk hash"""
+
+    def __init__(self, root: str, chunk_size: int = CHUNK_SIZE, max_workers: int = 4):
+        """
+        Initialize the store
+
+        Args:
+            root: Store directory
+            chunk_size: Bytes per chunk for files stored from now on
+            max_workers: Files read and hashed concurrently
+        """
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_workers = max(1, max_workers)
+        self.index_path = os.path.join(root, 'index.json')
+        self.gc_path = os.path.join(root, 'gc.json')
+        self.logger = logging.getLogger(__name__)
+        self._index: Optional[Dict[str, FileRecord]] = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def store(self, paths: Iterable[str]) -> Dict[str, FileRecord]:
+        """
+        Store files, reading only those changed since they were last stored
+
+        Args:
+            paths: Files to store; missing or unreadable files are skipped
+
+        Returns:
+            A record per stored file, for restore()
+        """
+        records: Dict[str, FileRecord] = {}
+        changed: List[Tuple[str, os.stat_result]] = []
+        with self._lock:
+            index = self._load_index()
+        # Unchanged files only cost a stat, so they are not worth a thread
+        for path in paths:
+            try:
+                info = os.stat(path)
+            except OSError as e:
+                self.logger.warning(f"Cannot back up {path}: {str(e)}")
+                continue
+            cached = index.get(path)
+            if cached and cached['size'] == info.st_size and cached['mtime'] == info.st_mtime_ns:
+                records[path] = cached
+            else:
+                changed.append((path, info))
+        if not changed:
+            return records
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(changed))) as pool:
+            for (path, _), record in zip(changed, pool.map(self._store_file, changed)):
+                if record is not None:
+                    records[path] = record
+        self._save_index()
+        return records
+
+    def restore(self, record: FileRecord, path: str) -> None:
+        """
+        Write a stored file back to path, with its recorded mtime
+
+        Raises:
+            OSError: If a chunk is missing or the file cannot be written
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.restore"
+        try:
+            with open(temp_path, 'wb') as f:
+                for digest in record['chunks']:
+                    with open(self._chunk_path(digest), 'rb') as chunk:
+                        f.write(chunk.read())
+            os.utime(temp_path, ns=(record['mtime'], record['mtime']))
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def collect(self, referenced: Iterable[FileRecord], shards: int = DEFAULT_GC_SHARDS) -> int:
+        """
+        Remove unreferenced chunks from the next few shard directories
+
+        Chunks listed in the store's own index stay too, since unchanged
+        files reuse them without being read again.
+
+        Args:
+            referenced: Records of every backup that is kept
+            shards: Shard directories to sweep in this call
+
+        Returns:
+            Chunks removed
+        """
+        live: Set[str] = set()
+        for record in referenced:
+            live.update(record['chunks'])
+        with self._lock:
+            for record in self._load_index().values():
+                live.update(record['chunks'])
+
+        cursor = self._load_cursor()
+        cutoff = time.time() - GC_GRACE_PERIOD
+        removed = 0
+        for step in range(min(shards, 256)):
+            shard = f"{(cursor + step) % 256:02x}"
+            try:
+                entries = list(os.scandir(os.path.join(self.root, shard)))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name in live:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    self.logger.debug(f"Could not collect chunk {entry.path}: {str(e)}")
+        self._save_cursor((cursor + min(shards, 256)) % 256)
+        if removed:
+            self.logger.info(f"Collected {removed} unreferenced chunk(s)")
+        return removed
+
+    def _store_file(self, job: Tuple[str, os.stat_result]) -> Optional[FileRecord]:
+        path, info = job
+        chunks: List[str] = []
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(self.chunk_size)
+                    if not data:
+                        break
+                    chunks.append(self._put(data))
+        except OSError as e:
+            self.logger.warning(f"Cannot back up {path}: {str(e)}")
+            return None
+        record = {'size': info.st_size, 'mtime': info.st_mtime_ns, 'chunks': chunks}
+        with self._lock:
+            self._load_index()[path] = record
+        return record
+
+    def _put(self, data: bytes) -> str:
+        """Store one chunk unless it is already present; returns its hash"""
+        digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+        chunk_path = self._chunk_path(digest)
+        if os.path.exists(chunk_path):
+            return digest
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        temp_path = f"{chunk_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, chunk_path)
+        return digest
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load_index(self) -> Dict[str, FileRecord]:
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r') as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {}
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Ignoring unreadable chunk index {self.index_path}: {str(e)}")
+                self._index = {}
+        return self._index
+
+    def _save_index(self) -> None:
+        with self._lock:
+            index = self._load_index()
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'w') as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(index))
+            os.replace(temp_path, self.index_path)
+
+    def _load_cursor(self) -> int:
+        try:
+            with open(self.gc_path, 'r') as f:
+                return int(json.load(f).get('next_shard', 0)) % 256
+        except (OSError, ValueError, AttributeError):
+            return 0
+
+    def _save_cursor(self, shard: int) -> None:
+        temp_path = f"{self.gc_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'next_shard': shard}, f)
+        os.replace(temp_path, self.gc_path)
@@ -0,0 +1,545 @@
+"""
+Parallel file deletion for Ruddibaba Optimizer
+
+The engine streams entries from a TreeScanner, which reuses the type and
+size information each DirEntry already carries; on Windows that comes from
+the directory listing itself, so no file needs a separate stat call.
+Entries are handed to a thread pool in batches while scanning continues,
+and a directory is removed once every batch up to it has been processed.
+Only a fixed number of batches is in flight, so memory use does not depend
+on the size of the tree.
+
+Every device gets its own scanner, worker pool and adaptive concurrency
+limit (see iosched), so targets on different drives are cleared in
+parallel and each drive runs at the queue depth it handles best.
+
+Files held open by other programs are retried at the end of the pass and,
+if still locked, remembered so later runs skip them (see deferred).
+
+For previews, iter_candidates streams the same entries without deleting
+anything. The resulting DeletionManifest can then be deleted as-is, so
+what gets removed is exactly what was shown.
+"""
+import os
+import json
+import stat
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .columnar import Policy, filter_candidates
+from .deferred import (
+    DEFAULT_RETRY_DELAYS, DeferredQueue, LockedFileStore, RebootDeleter, is_locked_error
+)
+from .iosched import AdaptiveLimit, group_by_device
+from .journal import CleanupJournal
+from .scanner import Candidate, TreeScanner, batched
+from .throttle import Throttle
+
+DEFAULT_WORKERS = 8
+
+# Concurrent batches per device before any latency has been observed
+INITIAL_CONCURRENCY = 2
+
+# Manifest entries kept in memory before spilling to a temporary file
+MANIFEST_MEMORY_ENTRIES = 10000
+
+@dataclass
+class DeletionStats:
+    """What a deletion pass removed"""
+    files: int = 0
+    bytes: int = 0
+    directories: int = 0
+    errors: int = 0
+    # Files left in place because another program held them open
+    deferred: int = 0
+    deferred_bytes: int = 0
+
+class DeletionManifest:
+    """
+    Everything a cleanup task found to delete during a preview
+
+    Small manifests stay in memory; past MANIFEST_MEMORY_ENTRIES entries
+    they are written to an anonymous temporary file, so previewing a huge
+    tree does not hold it in memory. Entries are replayed in the order
+    they were added.
+    """
+
+    def __init__(self, memory_entries: int = MANIFEST_MEMORY_ENTRIES):
+        self.files = 0
+        self.directories = 0
+        self.bytes = 0
+        self._memory_entries = memory_entries
+        self._buffer: List[Candidate] = []
+        self._spill = None
+
+    @property
+    def entries(self) -> int:
+        return self.files + self.directories
+
+    def add(self, candidate: Candidate) -> None:
+        if candidate.is_dir:
+            self.directories += 1
+        else:
+            self.files += 1
+            self.bytes += candidate.size
+        self._buffer.append(candidate)
+        if len(self._buffer) >= self._memory_entries:
+            self._flush()
+
+    def __iter__(self) -> Iterator[Candidate]:
+        if self._spill is None:
+            yield from self._buffer
+            return
+        self._flush()
+        self._spill.seek(0)
+        for line in self._spill:
+            path, size, is_dir, mtime = json.loads(line)
+            yield Candidate(path, size, is_dir, mtime)
+
+    def close(self) -> None:
+        """Discard the entries and any temporary file"""
+        self._buffer = []
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _flush(self) -> None:
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.writelines(
+            json.dumps([c.path, c.size, c.is_dir, c.mtime]) + '\n' for c in self._buffer
+        )
+        self._buffer = []
+
+def canonical_roots(paths: Iterable[str]) -> List[str]:
+    """
+    Resolve, deduplicate and un-nest a set of directories
+
+    TEMP, TMP and %LOCALAPPDATA%\\Temp are usually the same directory under
+    different spellings. Paths are resolved through links and compared
+    case-insensitively where the platform is, and a path inside another
+    listed path is dropped because sweeping the outer one covers it.
+
+    Args:
+        paths: Directories, in order of preference
+
+    Returns:
+        Canonical paths in their original order, without duplicates
+    """
+    canonical: List[str] = []
+    seen = set()
+    for path in paths:
+        if not path:
+            continue
+        resolved = os.path.realpath(path)
+        key = os.path.normcase(resolved)
+        if key not in seen:
+            seen.add(key)
+            canonical.append(resolved)
+
+    def nested(path: str) -> bool:
+        key = os.path.normcase(path)
+        return any(
+            key.startswith(os.path.join(os.path.normcase(other), ''))
+            for other in canonical if other != path
+        )
+    return [path for path in canonical if not nested(path)]
+
+@dataclass
+class SweepTarget:
+    """One set of directories for DeletionEngine.sweep"""
+    roots: List[str]
+    # Selects the files to delete; None deletes everything
+    policy: Optional[Policy] = None
+    journal: Optional[CleanupJournal] = None
+
+def iter_candidates(
+    roots: Iterable[str],
+    scanner: Optional[TreeScanner] = None,
+    policy: Optional[Policy] = None
+) -> Iterator[Candidate]:
+    """
+    Stream everything DeletionEngine.clear would delete, without deleting
+
+    Args:
+        roots: Directories to scan; canonicalized with canonical_roots
+        scanner: Scanner to use (default: a TreeScanner with default limits)
+        policy: Files to include, as for SweepTarget
+
+    Yields:
+        One Candidate per file, link or subdirectory, directories last
+    """
+    scanner = scanner or TreeScanner()
+    candidates = scanner.walk(root for root in canonical_roots(roots) if os.path.isdir(root))
+    if policy is None:
+        return candidates
+    return (
+        candidate
+        for batch in batched(candidates, scanner.batch_size)
+        for candidate in filter_candidates(policy, batch)
+    )
+
+class DeletionEngine:
+    """
+    Deletes the contents of directory trees using worker threads per device
+
+    Files that cannot be deleted (access denied) are skipped and counted in
+    DeletionStats.errors; files in use are retried once the pass is done
+    and counted in DeletionStats.deferred if still locked. Either way their
+    parent directories are left in place. Symbolic links and junctions are
+    removed, never followed.
+    Per device, at most two batches per worker are in flight at any time.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_WORKERS,
+        scanner: Optional[TreeScanner] = None,
+        throttle: Optional[Throttle] = None,
+        locked: Optional[LockedFileStore] = None,
+        reboot: Optional[RebootDeleter] = None,
+        retry_delays: Sequence[float] = DEFAULT_RETRY_DELAYS
+    ):
+        """
+        Initialize the engine
+
+        Args:
+            max_workers: Most threads deleting files on any one device; with
+                1, files on a single device are deleted on the calling thread
+            scanner: Scanner whose limits and batch size each device's
+                scanner uses
+            throttle: Limits every deletion waits on, shared across devices
+            locked: Files locked on earlier runs, skipped while unchanged;
+                files still locked after the retries are added to it
+            reboot: Schedules files still locked after the retries for
+                deletion at the next restart
+            retry_delays: Seconds to wait before each retry of locked files
+        """
+        self.max_workers = max(1, max_workers)
+        self.scanner = scanner or TreeScanner()
+        self.throttle = throttle
+        self.locked = locked
+        self.reboot = reboot
+        self.retry_delays = retry_delays
+        self.logger = logging.getLogger(__name__)
+
+    def clear(
+        self,
+        roots: Iterable[str],
+        remove_roots: bool = False,
+        journal: Optional[CleanupJournal] = None,
+        policy: Optional[Policy] = None
+    ) -> DeletionStats:
+        """
+        Delete everything inside the given directories
+
+        Args:
+            roots: Directories to empty; canonicalized with canonical_roots
+            remove_roots: Also remove the directories themselves
+            journal: Checkpoint journal to record progress in; directories
+                it lists as already handled are skipped
+            policy: Files to delete, as for SweepTarget
+
+        Returns:
+            Totals across all roots, for this call only
+        """
+        roots = list(roots)
+        stats = self.sweep({'': SweepTarget(roots, policy, journal)})['']
+        if remove_roots:
+            for root in canonical_roots(roots):
+                _remove_directory(root, stats, self.logger)
+        return stats
+
+    def sweep(self, targets: Dict[str, SweepTarget]) -> Dict[str, DeletionStats]:
+        """
+        Delete several targets in a single pass
+
+        Roots are grouped by device. Each device is scanned and cleared
+        by its own lane, with targets in the order given, and lanes run
+        in parallel. Within a lane, workers are still deleting one target
+        while the scanner moves on to the next. Locked files are retried
+        once every lane has finished.
+
+        Args:
+            targets: Targets by name
+
+        Returns:
+            Totals per target name, for this call only
+        """
+        stats = {name: DeletionStats() for name in targets}
+        lock = threading.Lock()
+        deferred = DeferredQueue()
+        lanes: Dict[int, List[Tuple[str, List[str]]]] = {}
+        for name, target in targets.items():
+            roots = [root for root in canonical_roots(target.roots) if os.path.isdir(root)]
+            for device, device_roots in group_by_device(roots).items():
+                lanes.setdefault(device, []).append((name, device_roots))
+
+        def batches(
+            work: List[Tuple[str, List[str]]],
+            scanner: TreeScanner
+        ) -> Iterator[Tuple[str, List[Candidate]]]:
+            for name, roots in work:
+                target = targets[name]
+                exclude = frozenset(target.journal.completed) if target.journal else None
+                errors_before = scanner.errors
+                for batch in scanner.walk_batches(roots, exclude):
+                    if target.policy is not None:
+                        # Evaluated a whole batch at a time over its columns
+                        batch = filter_candidates(target.policy, batch)
+                        if not batch:
+                            continue
+                    yield name, batch
+                with lock:
+                    stats[name].errors += scanner.errors - errors_before
+
+        def run_lane(work: List[Tuple[str, List[str]]]) -> None:
+            scanner = TreeScanner(self.scanner.max_open_dirs, self.scanner.batch_size)
+            self._delete_stream(batches(work, scanner), stats, journals, lock, deferred)
+
+        journals = {name: target.journal for name, target in targets.items() if target.journal}
+        try:
+            if len(lanes) == 1:
+                run_lane(next(iter(lanes.values())))
+            elif lanes:
+                with ThreadPoolExecutor(max_workers=len(lanes)) as pool:
+                    for future in [pool.submit(run_lane, work) for work in lanes.values()]:
+                        future.result()
+            self._retry_deferred(deferred, stats, journals)
+        finally:
+            for journal in journals.values():
+                journal.flush()
+
+        for name, totals in stats.items():
+            self.logger.info(
+                f"Deleted {totals.files} file(s), {totals.bytes} byte(s)"
+                f"{f' for {name}' if name else ''}; "
+                f"{totals.errors} item(s) could not be removed, "
+                f"{totals.deferred} file(s) in use left for later"
+            )
+        return stats
+
+    def delete(self, manifest: DeletionManifest) -> DeletionStats:
+        """
+        Delete exactly the files and directories listed in a manifest
+
+        Entries that disappeared since the manifest was built are ignored;
+        anything created since is left alone, and its directory with it.
+
+        Args:
+            manifest: Manifest produced by a preview; closed afterwards
+
+        Returns:
+            Totals for what was actually removed
+        """
+        stats = {'': DeletionStats()}
+        deferred = DeferredQueue()
+        try:
+            batches = (('', batch) for batch in batched(manifest, self.scanner.batch_size))
+            self._delete_stream(batches, stats, {}, threading.Lock(), deferred)
+            self._retry_deferred(deferred, stats, {})
+        finally:
+            manifest.close()
+
+        self.logger.info(
+            f"Deleted {stats[''].files} file(s), {stats[''].bytes} byte(s) from a manifest of "
+            f"{manifest.files}; {stats[''].errors} item(s) could not be removed, "
+            f"{stats[''].deferred} file(s) in use left for later"
+        )
+        return stats['']
+
+    def _delete_stream(
+        self,
+        batches: Iterator[Tuple[str, List[Candidate]]],
+        stats: Dict[str, DeletionStats],
+        journals: Dict[str, CleanupJournal],
+        lock: threading.Lock,
+        deferred: DeferredQueue
+    ) -> None:
+        """
+        Delete a post-ordered stream of named batches in parallel
+
+        Batches are numbered as they are submitted. Files are deleted as
+        soon as a worker picks up their batch, but directories are only
+        removed once every earlier batch has finished, since those hold
+        their contents. A batch keeps its slot until then, which bounds the
+        work in flight. How many batches are deleting at once is set by an
+        AdaptiveLimit from the per-file latency of finished batches.
+        Totals and journal entries go to the target each batch is named
+        after. Files found locked go to the deferred queue; files the
+        locked-file store lists as unchanged are not tried at all.
+        """
+        slots = threading.Semaphore(self.max_workers * 2)
+        limit = AdaptiveLimit(INITIAL_CONCURRENCY, maximum=self.max_workers)
+        finished: Dict[int, Tuple[str, List[str]]] = {}
+        next_to_retire = [0]
+
+        def run_batch(number: int, name: str, batch: List[Candidate]) -> None:
+            files = bytes_deleted = errors = queued = 0
+            skipped = skipped_bytes = 0
+            directories: List[str] = []
+            start = time.perf_counter()
+            throttled = 0.0
+            try:
+                for candidate in batch:
+                    if candidate.is_dir:
+                        directories.append(candidate.path)
+                        continue
+                    locked = self.locked
+                    if locked is not None and locked.is_locked(candidate.path, candidate.mtime):
+                        skipped += 1
+                        skipped_bytes += candidate.size
+                        continue
+                    if self.throttle is not None:
+                        throttled += self.throttle.acquire(1, candidate.size)
+                    try:
+                        _unlink(candidate.path)
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        if is_locked_error(e):
+                            deferred.add(name, candidate)
+                            queued += 1
+                            continue
+                        self.logger.debug(f"Could not delete {candidate.path}: {str(e)}")
+                        errors += 1
+                        continue
+                    files += 1
+                    bytes_deleted += candidate.size
+            finally:
+                # Time spent throttled says nothing about the device
+                operations = files + errors + queued
+                elapsed = time.perf_counter() - start - throttled
+                limit.release(elapsed / operations if operations else None)
+                with lock:
+                    totals = stats[name]
+                    totals.files += files
+                    totals.bytes += bytes_deleted
+                    totals.errors += errors
+                    totals.deferred += skipped
+                    totals.deferred_bytes += skipped_bytes
+                    if name in journals:
+                        journals[name].record(files, bytes_deleted, [])
+                    finished[number] = (name, directories)
+                    # Retire batches in order; removal happens under the
+                    # lock so children always go before their parents
+                    while next_to_retire[0] in finished:
+                        owner, paths = finished.pop(next_to_retire[0])
+                        retained = [
+                            path for path in paths
+                            if not _remove_directory(path, stats[owner], self.logger)
+                        ]
+                        if retained and owner in journals:
+                            journals[owner].record(0, 0, retained)
+                        next_to_retire[0] += 1
+                        slots.release()
+
+        if self.max_workers == 1:
+            # Inline, so deletions run at the calling thread's priority
+            for number, (name, batch) in enumerate(batches):
+                slots.acquire()
+                limit.acquire()
+                run_batch(number, name, batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for number, (name, batch) in enumerate(batches):
+                    slots.acquire()
+                    limit.acquire()
+                    pool.submit(run_batch, number, name, batch)
+        self.logger.debug(f"Deletion concurrency settled at {limit.limit} batch(es)")
+
+    def _retry_deferred(
+        self,
+        deferred: DeferredQueue,
+        stats: Dict[str, DeletionStats],
+        journals: Dict[str, CleanupJournal]
+    ) -> None:
+        """
+        Retry locked files after each of the retry delays
+
+        Files still locked after the last retry are counted as deferred,
+        remembered in the locked-file store and scheduled for deletion at
+        restart, where those are configured. Their directories stay until
+        a later run.
+        """
+        pending = deferred.drain()
+        for delay in self.retry_delays:
+            if not pending:
+                break
+            time.sleep(delay)
+            still_locked = []
+            for name, candidate in pending:
+                try:
+                    _unlink(candidate.path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    if is_locked_error(e):
+                        still_locked.append((name, candidate))
+                    else:
+                        self.logger.debug(f"Could not delete {candidate.path}: {str(e)}")
+                        stats[name].errors += 1
+                    continue
+                stats[name].files += 1
+                stats[name].bytes += candidate.size
+                if name in journals:
+                    journals[name].record(1, candidate.size, [])
+            pending = still_locked
+
+        scheduled = 0
+        for name, candidate in pending:
+            stats[name].deferred += 1
+            stats[name].deferred_bytes += candidate.size
+            if self.locked is not None:
+                self.locked.add(candidate.path, candidate.mtime)
+            if self.reboot is not None and self.reboot.schedule(candidate.path):
+                scheduled += 1
+        if self.reboot is not None and pending:
+            self.logger.info(
+                f"Scheduled {scheduled} of {len(pending)} locked file(s) for deletion at restart"
+            )
+
+def _remove_directory(path: str, stats: DeletionStats, logger: logging.Logger) -> bool:
+    """Remove an empty directory, returning False if it is still there"""
+    try:
+        os.rmdir(path)
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        # Usually not empty because something inside was locked or is new
+        logger.debug(f"Could not remove directory {path}: {str(e)}")
+        return False
+    stats.directories += 1
+    return True
+
+def _unlink(path: str) -> None:
+    """Remove a file or link, clearing the read-only attribute if needed"""
+    try:
+        os.unlink(path)
+    except IsADirectoryError:
+        # Directory symlink or junction
+        os.rmdir(path)
+    except PermissionError as e:
+        # A file held open by another program; clearing attributes won't help
+        if is_locked_error(e):
+            raise
+        if os.path.isdir(path):
+            os.rmdir(path)
+            return
+        # Only Windows refuses to delete read-only files; elsewhere the
+        # directory's permissions decide and chmod would only damage the file
+        if os.name != 'nt':
+            raise
+        mode = os.stat(path).st_mode
+        os.chmod(path, mode | stat.S_IWRITE)
+        try:
+            os.unlink(path)
+        except OSError:
+            os.chmod(path, mode)
+            raise
@@ -0,0 +1,266 @@
+"""
+Columnar scan results and vectorized cleanup policies for Ruddibaba Optimizer
+
+A ScanTable stores scanned files as parallel typed arrays instead of one
+Python object per file. Sizes, mtimes and atimes are arrays of numbers.
+Directory paths and extensions are interned, so each file holds only
+their ids. File names are concatenated into a single byte buffer. Each
+file costs 36 bytes plus its name, so a million files take around 50 MB.
+
+A Policy such as ``OlderThan(7) & ExtensionIn({'.tmp', '.log'})`` is
+evaluated over whole columns at once and yields a mask with one flag per
+file. With numpy installed the columns are used as zero-copy arrays and
+a policy over a million files takes a few milliseconds. Without numpy the
+same policies run as loops over the arrays, which is slower but needs
+nothing beyond the standard library.
+"""
+import os
+import time
+import fnmatch
+import operator
+from array import array
+from itertools import compress
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+try:
+    import numpy
+except ImportError:  # optional; policies fall back to plain loops
+    numpy = None
+
+from .scanner import Candidate, TreeScanner
+
+# One flag per file: a numpy bool array, or a bytearray of 0 and 1
+Mask = Any
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+class ScanTable:
+    """Files found by a scan, stored column by column"""
+
+    def __init__(self):
+        self.size = array('q')
+        self.mtime = array('d')
+        self.atime = array('d')
+        # Ids into directories and extensions
+        self.directory = array('i')
+        self.extension = array('i')
+        self.directories: List[str] = []
+        self.extensions: List[str] = []
+        self._directory_ids: Dict[str, int] = {}
+        self._extension_ids: Dict[str, int] = {}
+        # Name i is _names[_name_offsets[i]:_name_offsets[i + 1]], UTF-8
+        self._names = bytearray()
+        self._name_offsets = array('I', [0])
+
+    @classmethod
+    def from_candidates(cls, candidates: Iterable[Candidate]) -> 'ScanTable':
+        """Table of the files among candidates; directories are skipped"""
+        table = cls()
+        table.extend(candidates)
+        return table
+
+    @classmethod
+    def scan(cls, roots: Iterable[str], scanner: Optional[TreeScanner] = None) -> 'ScanTable':
+        """Table of every file below the given directories"""
+        return cls.from_candidates((scanner or TreeScanner()).walk(roots))
+
+    def __len__(self) -> int:
+        return len(self.size)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the table, excluding interned strings"""
+        columns = (self.size, self.mtime, self.atime, self.directory, self.extension, self._name_offsets)
+        return sum(column.itemsize * len(column) for column in columns) + len(self._names)
+
+    def append(self, path: str, size: int, mtime: float = 0.0, atime: float = 0.0) -> None:
+        """Add one file"""
+        directory, name = os.path.split(path)
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+        extension = os.path.splitext(name)[1].lower()
+        extension_id = self._extension_ids.get(extension)
+        if extension_id is None:
+            extension_id = self._extension_ids[extension] = len(self.extensions)
+            self.extensions.append(extension)
+
+        self.size.append(size)
+        self.mtime.append(mtime)
+        self.atime.append(atime)
+        self.directory.append(directory_id)
+        self.extension.append(extension_id)
+        self._names += name.encode('utf-8', 'surrogatepass')
+        self._name_offsets.append(len(self._names))
+
+    def extend(self, candidates: Iterable[Candidate]) -> None:
+        """Add the files among candidates"""
+        for candidate in candidates:
+            if not candidate.is_dir:
+                self.append(candidate.path, candidate.size, candidate.mtime, candidate.atime)
+
+    def name(self, index: int) -> str:
+        start, end = self._name_offsets[index], self._name_offsets[index + 1]
+        return self._names[start:end].decode('utf-8', 'surrogatepass')
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.directories[self.directory[index]], self.name(index))
+
+    def indices(self, mask: Mask) -> Iterator[int]:
+        """Positions of the files a mask selects"""
+        return compress(range(len(self)), mask)
+
+    def candidates(self, mask: Mask) -> Iterator[Candidate]:
+        """The files a mask selects, as Candidates"""
+        for index in self.indices(mask):
+            yield Candidate(
+                self.path(index), self.size[index],
+                mtime=self.mtime[index], atime=self.atime[index]
+            )
+
+    def select(self, policy: 'Policy') -> Iterator[Candidate]:
+        """The files a policy selects"""
+        return self.candidates(policy.mask(self))
+
+    def column(self, name: str):
+        """A column as a zero-copy numpy array, or the raw array without numpy"""
+        values = getattr(self, name)
+        if numpy is None:
+            return values
+        if not values:
+            return numpy.zeros(0, dtype=values.typecode)
+        return numpy.frombuffer(values, dtype=values.typecode)
+
+class Policy:
+    """
+    A file selection evaluated over a whole ScanTable at once
+
+    Policies combine with ``&``, ``|`` and ``~``.
+    """
+
+    def mask(self, table: ScanTable) -> Mask:
+        """One flag per file of the table"""
+        raise NotImplementedError
+
+    def __and__(self, other: 'Policy') -> 'Policy':
+        return _Combined(operator.and_, self, other)
+
+    def __or__(self, other: 'Policy') -> 'Policy':
+        return _Combined(operator.or_, self, other)
+
+    def __invert__(self) -> 'Policy':
+        return _Inverted(self)
+
+class OlderThan(Policy):
+    """Files not modified for the given number of days"""
+
+    def __init__(self, days: float):
+        self.days = days
+
+    def mask(self, table: ScanTable) -> Mask:
+        return _less(table.column('mtime'), time.time() - self.days * SECONDS_PER_DAY)
+
+class NotAccessedFor(Policy):
+    """
+    Files not read for the given number of days
+
+    Windows updates last-access times lazily, or not at all when they are
+    disabled on the volume, so this is best combined with OlderThan.
+    """
+
+    def __init__(self, days: float):
+        self.days = days
+
+    def mask(self, table: ScanTable) -> Mask:
+        return _less(table.column('atime'), time.time() - self.days * SECONDS_PER_DAY)
+
+class LargerThan(Policy):
+    """Files larger than the given number of bytes"""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def mask(self, table: ScanTable) -> Mask:
+        column = table.column('size')
+        if numpy is not None:
+            return column > self.size
+        return bytearray(value > self.size for value in column)
+
+class ExtensionIn(Policy):
+    """Files whose extension, compared case-insensitively, is in the given set"""
+
+    def __init__(self, extensions: Iterable[str]):
+        self.extensions = {extension.lower() for extension in extensions}
+
+    def mask(self, table: ScanTable) -> Mask:
+        # Only the interned extensions are compared as strings
+        ids = [i for i, extension in enumerate(table.extensions) if extension in self.extensions]
+        column = table.column('extension')
+        if numpy is not None:
+            return numpy.isin(column, ids)
+        ids_set: Set[int] = set(ids)
+        return bytearray(value in ids_set for value in column)
+
+class NameMatches(Policy):
+    """
+    Files whose name matches one of the given wildcard patterns
+
+    Patterns are matched name by name; prefer ExtensionIn where a pattern
+    is only an extension.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = [pattern.lower() for pattern in patterns]
+
+    def mask(self, table: ScanTable) -> Mask:
+        flags = bytearray(
+            any(fnmatch.fnmatchcase(table.name(i).lower(), pattern) for pattern in self.patterns)
+            for i in range(len(table))
+        )
+        if numpy is not None:
+            return numpy.frombuffer(bytes(flags), dtype=bool)
+        return flags
+
+class _Combined(Policy):
+    def __init__(self, combine, left: Policy, right: Policy):
+        self.combine = combine
+        self.left = left
+        self.right = right
+
+    def mask(self, table: ScanTable) -> Mask:
+        left, right = self.left.mask(table), self.right.mask(table)
+        if numpy is not None:
+            return self.combine(left, right)
+        return bytearray(map(self.combine, left, right))
+
+class _Inverted(Policy):
+    def __init__(self, policy: Policy):
+        self.policy = policy
+
+    def mask(self, table: ScanTable) -> Mask:
+        mask = self.policy.mask(table)
+        if numpy is not None:
+            return ~mask
+        return bytearray(mask.translate(_FLIP))
+
+# Byte translation table swapping 0 and 1
+_FLIP = bytes([1, 0]) + bytes(254)
+
+def _less(column, threshold: float) -> Mask:
+    if numpy is not None:
+        return column < threshold
+    return bytearray(value < threshold for value in column)
+
+def filter_candidates(policy: Policy, batch: List[Candidate]) -> List[Candidate]:
+    """
+    Keep the directories of a batch and the files a policy selects
+
+    The batch's files are evaluated as one table and its order is preserved,
+    so a post-ordered batch stays post-ordered.
+    """
+    table = ScanTable.from_candidates(batch)
+    if not len(table):
+        return batch
+    flags = iter(policy.mask(table))
+    return [candidate for candidate in batch if candidate.is_dir or next(flags)]
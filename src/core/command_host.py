@@ -0,0 +1,331 @@
+"""
+Persistent command host for Ruddibaba Optimizer
+
+Instead of starting a new process per command, commands are written to a
+long-lived shell over stdin. Each command is followed by a sentinel line
+carrying its exit code, which frames its output on stdout and stderr.
+"""
+import os
+import sys
+import time
+import queue
+import shlex
+import signal
+import locale
+import logging
+import threading
+import subprocess
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from .commands import Command, CommandResult, CommandRunner
+
+def default_shell() -> List[str]:
+    """Shell used by the host: cmd.exe on Windows, /bin/sh as a local stand-in elsewhere"""
+    if sys.platform == 'win32':
+        # /Q: echo off (no prompt), /D: skip AutoRun, /V:ON: delayed expansion for !ERRORLEVEL!
+        return ['cmd.exe', '/Q', '/D', '/V:ON', '/K']
+    return ['/bin/sh']
+
+def kill_process_tree(process: subprocess.Popen) -> None:
+    """Forcefully terminate a process and everything it started"""
+    try:
+        if sys.platform == 'win32':
+            subprocess.run(
+                ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW
+            )
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if process.poll() is None:
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+class CommandHost:
+    """
+    A long-lived shell that executes commands sent over stdin.
+
+    The host is started on first use and restarted transparently if it
+    exits or has to be killed because a command overran its deadline.
+    A host runs one command at a time.
+    """
+
+    def __init__(self, shell: Optional[List[str]] = None):
+        self.shell = shell or default_shell()
+        self.dialect = 'cmd' if os.path.basename(self.shell[0]).lower().startswith('cmd') else 'sh'
+        self.starts = 0
+        self.logger = logging.getLogger(__name__)
+        self._process: Optional[subprocess.Popen] = None
+        self._stdout: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._stderr: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the host process is running"""
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        """Start the host process if it is not already running"""
+        if self.alive:
+            return
+        self._discard()
+
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        else:
+            kwargs['start_new_session'] = True
+
+        # cmd.exe reads and writes the OEM code page, not the ANSI one
+        encoding = 'oem' if sys.platform == 'win32' else locale.getpreferredencoding(False)
+        self._process = subprocess.Popen(
+            self.shell,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding=encoding,
+            errors='replace',
+            bufsize=1,
+            **kwargs
+        )
+        self._stdout = queue.Queue()
+        self._stderr = queue.Queue()
+        for stream, lines in ((self._process.stdout, self._stdout),
+                              (self._process.stderr, self._stderr)):
+            threading.Thread(
+                target=self._pump, args=(stream, lines), name="command-host-reader", daemon=True
+            ).start()
+        self.starts += 1
+        if self.starts > 1:
+            self.logger.info(f"Restarted command host ({' '.join(self.shell)})")
+
+    def execute(self, command: Command, timeout: float) -> CommandResult:
+        """
+        Run a command in the host and wait for its framed result
+
+        Args:
+            command: Command to run
+            timeout: Seconds to wait before killing the host
+
+        Returns:
+            Result with the command's exit code and captured output
+        """
+        with self._lock:
+            start = time.monotonic()
+            try:
+                self.start()
+            except OSError as e:
+                return CommandResult(command, None, stderr=str(e))
+
+            token = f"__RBHOST_{uuid.uuid4().hex}__"
+            try:
+                frame = self._frame(command, token)
+            except ValueError as e:
+                return CommandResult(command, None, stderr=str(e))
+            try:
+                self._process.stdin.write(frame)
+                self._process.stdin.flush()
+            except (OSError, ValueError) as e:
+                self._discard()
+                return CommandResult(command, None, stderr=f"command host unavailable: {e}",
+                                     duration=time.monotonic() - start)
+
+            deadline = start + timeout
+            stdout, returncode = self._read_frame(self._stdout, token, deadline)
+            stderr, stderr_status = self._read_frame(self._stderr, token, deadline)
+            duration = time.monotonic() - start
+
+            if returncode is _TIMED_OUT or stderr_status is _TIMED_OUT:
+                self._discard()
+                return CommandResult(command, None, stdout, stderr, duration=duration,
+                                     timed_out=True)
+            if returncode is _EXITED or stderr_status is _EXITED:
+                self._discard()
+                return CommandResult(command, None, stdout, stderr or "command host exited",
+                                     duration=duration)
+            return CommandResult(command, returncode, stdout, stderr, duration=duration)
+
+    def close(self) -> None:
+        """Shut the host down"""
+        with self._lock:
+            if self.alive:
+                try:
+                    self._process.stdin.write("exit\n")
+                    self._process.stdin.flush()
+                    self._process.wait(timeout=2)
+                except (OSError, ValueError, subprocess.TimeoutExpired):
+                    pass
+            self._discard()
+
+    def _frame(self, command: Command, token: str) -> str:
+        """
+        Build the shell line that runs a command and reports its exit code
+
+        Raises:
+            ValueError: If an argument cannot be passed to cmd.exe safely
+        """
+        if self.dialect == 'cmd':
+            line = " ".join(_cmd_quote(arg) for arg in command.args)
+            return (f"{line} <NUL & echo {token} !ERRORLEVEL! "
+                    f"& echo {token} 1>&2\n")
+        line = " ".join(shlex.quote(arg) for arg in command.args)
+        return (f"{line} </dev/null; printf '%s %d\\n' {token} \"$?\"; "
+                f"printf '%s\\n' {token} >&2\n")
+
+    def _read_frame(self, lines: "queue.Queue[Optional[str]]", token: str, deadline: float):
+        """Collect output lines up to the sentinel; returns (text, exit code or marker)"""
+        collected = []
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                line = lines.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                return "".join(collected), _TIMED_OUT
+            if line is None:
+                return "".join(collected), _EXITED
+
+            index = line.find(token)
+            if index < 0:
+                collected.append(line)
+                continue
+
+            collected.append(line[:index])
+            fields = line[index + len(token):].split()
+            try:
+                returncode = int(fields[0]) if fields else 0
+            except ValueError:
+                returncode = -1
+            return "".join(collected), returncode
+
+    def _discard(self) -> None:
+        """Kill and forget the current host process"""
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            kill_process_tree(self._process)
+        for stream in (self._process.stdin, self._process.stdout, self._process.stderr):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+        self._process = None
+
+    @staticmethod
+    def _pump(stream, lines: "queue.Queue[Optional[str]]") -> None:
+        """Forward lines from a pipe to a queue; None marks end of stream"""
+        try:
+            for line in iter(stream.readline, ''):
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        lines.put(None)
+
+_TIMED_OUT = object()
+_EXITED = object()
+
+# Expanded by cmd.exe even inside quotes (% always, ! under /V:ON), or
+# able to end the line or a quoted argument early
+_CMD_UNSAFE = frozenset('%!"\r\n\0')
+
+# Split or redirect the line unless quoted or ^-escaped
+_CMD_METACHARACTERS = frozenset('^&|<>()')
+
+def _cmd_quote(arg: str) -> str:
+    """
+    Quote one argument for a line typed into cmd.exe
+
+    Arguments with spaces are quoted as for list2cmdline, which also keeps
+    cmd from acting on metacharacters inside them; elsewhere those are
+    ^-escaped. Characters cmd expands even within quotes are refused.
+
+    Raises:
+        ValueError: If the argument contains such a character
+    """
+    unsafe = sorted(_CMD_UNSAFE.intersection(arg))
+    if unsafe:
+        raise ValueError(f"Cannot pass {arg!r} to cmd.exe: contains {''.join(map(repr, unsafe))}")
+    quoted = subprocess.list2cmdline([arg])
+    if quoted.startswith('"'):
+        return quoted
+    return "".join(f"^{char}" if char in _CMD_METACHARACTERS else char for char in quoted)
+
+class HostedCommandRunner(CommandRunner):
+    """
+    CommandRunner that sends commands to a pool of persistent hosts.
+
+    Hosts are started lazily, at most ``max_concurrency`` of them, so a
+    run pays the shell startup cost once per host rather than once per
+    command. With a single host, commands are sent from the calling
+    thread, so a profiler enabled there sees them.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        default_timeout: float = 60.0,
+        shell: Optional[List[str]] = None
+    ):
+        super().__init__(max_concurrency=max_concurrency, default_timeout=default_timeout)
+        self.shell = shell
+        self._hosts: List[CommandHost] = []
+        self._idle: "queue.Queue[CommandHost]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                        thread_name_prefix="command-host")
+
+    def _execute(self, commands: Sequence[Command], ordered: bool) -> List[CommandResult]:
+        if self.max_concurrency == 1:
+            return [self._run_hosted(c) for c in commands]
+        if ordered:
+            return self._pool.submit(lambda: [self._run_hosted(c) for c in commands]).result()
+        futures = [self._pool.submit(self._run_hosted, c) for c in commands]
+        return [future.result() for future in futures]
+
+    def _run_hosted(self, command: Command) -> CommandResult:
+        """Run one command on an idle host, starting a new host if allowed"""
+        host = self._acquire()
+        try:
+            timeout = command.timeout if command.timeout is not None else self.default_timeout
+            return host.execute(command, timeout)
+        finally:
+            self._idle.put(host)
+
+    def _acquire(self) -> CommandHost:
+        with self._lock:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if len(self._hosts) < self.max_concurrency:
+                host = CommandHost(self.shell)
+                self._hosts.append(host)
+                return host
+        return self._idle.get()
+
+    @property
+    def process_starts(self) -> int:
+        """Total number of host processes started, including restarts"""
+        return sum(host.starts for host in self._hosts)
+
+    def close(self) -> None:
+        """Shut down all hosts"""
+        for host in self._hosts:
+            host.close()
+
+_shared_runner: Optional[CommandRunner] = None
+_shared_lock = threading.Lock()
+
+def get_command_runner() -> CommandRunner:
+    """Get the process-wide shared command runner, backed by persistent hosts"""
+    global _shared_runner
+    with _shared_lock:
+        if _shared_runner is None:
+            _shared_runner = HostedCommandRunner()
+        return _shared_runner
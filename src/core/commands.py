@@ -0,0 +1,231 @@
+"""
+Shared asynchronous command runner for Ruddibaba Optimizer
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import locale
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
+
+@dataclass
+class Command:
+    """A single external command, run without a shell"""
+    args: List[str]
+    timeout: Optional[float] = None
+    check: bool = True
+
+    def __str__(self) -> str:
+        return subprocess.list2cmdline(self.args)
+
+@dataclass
+class CommandResult:
+    """Outcome of running a Command"""
+    command: Command
+    returncode: Optional[int]
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command exited with status 0"""
+        return self.returncode == 0 and not self.timed_out
+
+class CommandError(Exception):
+    """Raised when one or more checked commands fail"""
+
+    def __init__(self, failures: List[CommandResult]):
+        self.failures = failures
+        details = "; ".join(
+            f"'{r.command}' "
+            + ("timed out" if r.timed_out else f"exited with {r.returncode}")
+            for r in failures
+        )
+        super().__init__(f"{len(failures)} command(s) failed: {details}")
+
+class CommandRunner:
+    """
+    Runs external commands on a private asyncio event loop.
+
+    The loop lives on a background thread so the runner can be shared by
+    tasks running on the scheduler's worker threads. At most
+    ``max_concurrency`` processes run at once, and every command is killed
+    once its deadline passes.
+    """
+
+    def __init__(self, max_concurrency: int = 4, default_timeout: float = 60.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self.logger = logging.getLogger(__name__)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def run(
+        self,
+        commands: Sequence[Command],
+        ordered: bool = False,
+        check: bool = True
+    ) -> List[CommandResult]:
+        """
+        Run a group of commands and wait for all of them
+
+        Args:
+            commands: Commands to run
+            ordered: Run one after another instead of concurrently
+            check: Raise CommandError if any command with check=True fails
+
+        Returns:
+            Results in the same order as the commands
+        """
+        results = self._execute(commands, ordered)
+
+        log = getattr(self._local, 'log', None)
+        if log is not None:
+            log.extend(results)
+
+        for result in results:
+            if not result.ok:
+                self.logger.warning(
+                    f"Command '{result.command}' "
+                    + ("timed out" if result.timed_out else f"exited with {result.returncode}")
+                    + (f": {result.stderr.strip()}" if result.stderr.strip() else "")
+                )
+
+        if check:
+            failures = [r for r in results if r.command.check and not r.ok]
+            if failures:
+                raise CommandError(failures)
+        return results
+
+    @contextmanager
+    def recording(self) -> Iterator[List[CommandResult]]:
+        """Collect the results of every command run on this thread"""
+        previous = getattr(self._local, 'log', None)
+        log: List[CommandResult] = []
+        self._local.log = log
+        try:
+            yield log
+        finally:
+            self._local.log = previous
+
+    def run_one(self, *args: str, timeout: Optional[float] = None, check: bool = True) -> CommandResult:
+        """Run a single command given as an argument list"""
+        return self.run([Command(list(args), timeout=timeout, check=check)], check=check)[0]
+
+    def _execute(self, commands: Sequence[Command], ordered: bool) -> List[CommandResult]:
+        """Run commands on the event loop and collect their results"""
+        coro = self._run_ordered(commands) if ordered else self._run_concurrent(commands)
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result()
+
+    def close(self) -> None:
+        """Stop the background event loop"""
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+                self._semaphore = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop on first use"""
+        with self._lock:
+            if self._loop is None:
+                if sys.platform == 'win32':
+                    loop = asyncio.ProactorEventLoop()
+                else:
+                    loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever,
+                    name="command-runner",
+                    daemon=True
+                ).start()
+                self._loop = loop
+            return self._loop
+
+    async def _run_concurrent(self, commands: Sequence[Command]) -> List[CommandResult]:
+        return list(await asyncio.gather(*(self._run_command(c) for c in commands)))
+
+    async def _run_ordered(self, commands: Sequence[Command]) -> List[CommandResult]:
+        return [await self._run_command(c) for c in commands]
+
+    async def _run_command(self, command: Command) -> CommandResult:
+        """Run one command under the concurrency limit and its deadline"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = command.timeout if command.timeout is not None else self.default_timeout
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        else:
+            kwargs['start_new_session'] = True
+
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command.args,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    **kwargs
+                )
+            except OSError as e:
+                return CommandResult(command, None, stderr=str(e),
+                                     duration=time.monotonic() - start)
+
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                # Kill the whole tree: a grandchild that inherited our pipes
+                # (net.exe -> net1.exe) would otherwise keep them open
+                await self._kill_tree(process)
+                try:
+                    await asyncio.wait_for(process.wait(), 5)
+                except asyncio.TimeoutError:
+                    pass
+                return CommandResult(
+                    command, None, duration=time.monotonic() - start, timed_out=True
+                )
+
+            return CommandResult(
+                command, process.returncode, _decode(stdout), _decode(stderr),
+                duration=time.monotonic() - start
+            )
+
+    async def _kill_tree(self, process: asyncio.subprocess.Process) -> None:
+        """Forcefully terminate a process and everything it started"""
+        try:
+            if sys.platform == 'win32':
+                killer = await asyncio.create_subprocess_exec(
+                    'taskkill', '/F', '/T', '/PID', str(process.pid),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    creationflags=subprocess.CREATE_NO_WINDOW
+                )
+                await killer.wait()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+def _decode(data: Optional[bytes]) -> str:
+    """Decode process output using the console's preferred encoding"""
+    if not data:
+        return ""
+    return data.decode(locale.getpreferredencoding(False), errors="replace")
@@ -0,0 +1,157 @@
+"""
+Deferred deletion of locked files for Ruddibaba Optimizer
+
+On a busy machine many files in temp and cache directories are held open
+by running programs, and deleting them fails with a sharing violation on
+every run. The DeletionEngine sets such files aside in a DeferredQueue
+instead of counting an error, and retries them after a short backoff once
+everything else is done. Files still locked then go into a
+LockedFileStore, keyed by path and mtime, and later runs skip them
+without touching the disk until the file changes or the entry expires.
+A RebootDeleter can have Windows delete them at the next restart.
+"""
+import os
+import sys
+import json
+import time
+import errno
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from .scanner import Candidate
+
+# Seconds to wait before each retry of the files still locked
+DEFAULT_RETRY_DELAYS = (0.5, 1.0)
+
+# Seconds a file that stayed locked is skipped before it is tried again
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+ERROR_SHARING_VIOLATION = 32
+ERROR_LOCK_VIOLATION = 33
+
+MOVEFILE_DELAY_UNTIL_REBOOT = 0x4
+
+def default_locked_path() -> str:
+    """Location of the locked-file list under the application data directory"""
+    return os.path.join(
+        os.environ.get('LOCALAPPDATA', ''),
+        'RuddibabaOptimizer',
+        'cache',
+        'locked_files.json'
+    )
+
+def is_locked_error(error: OSError) -> bool:
+    """Whether a failed deletion failed because another process holds the file"""
+    if getattr(error, 'winerror', None) in (ERROR_SHARING_VIOLATION, ERROR_LOCK_VIOLATION):
+        return True
+    return error.errno in (errno.EBUSY, errno.ETXTBSY)
+
+class DeferredQueue:
+    """Locked files set aside during a deletion pass, with their target names"""
+
+    def __init__(self):
+        self._entries: List[Tuple[str, Candidate]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, name: str, candidate: Candidate) -> None:
+        with self._lock:
+            self._entries.append((name, candidate))
+
+    def drain(self) -> List[Tuple[str, Candidate]]:
+        """Take every queued file, leaving the queue empty"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+        return entries
+
+class LockedFileStore:
+    """Files that stayed locked through a whole run, by path and mtime"""
+
+    def __init__(self, path: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Initialize the store
+
+        Args:
+            path: Store file (default: under %LOCALAPPDATA%\\RuddibabaOptimizer\\cache)
+            max_age: Seconds after which a file is tried again even if unchanged
+        """
+        self.path = path or default_locked_path()
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Ignoring unreadable locked-file list {self.path}: {str(e)}")
+                self._entries = {}
+        return self._entries
+
+    def is_locked(self, path: str, mtime: float) -> bool:
+        """Whether the file stayed locked last time and has not changed since"""
+        with self._lock:
+            entry = self._load().get(path)
+        if not entry or entry.get('mtime') != mtime:
+            return False
+        return time.time() - entry.get('timestamp', 0) <= self.max_age
+
+    def add(self, path: str, mtime: float) -> None:
+        """Remember a file that could not be deleted because it is in use"""
+        with self._lock:
+            self._load()[path] = {'mtime': mtime, 'timestamp': time.time()}
+
+    def save(self) -> None:
+        """Write the store to disk, dropping expired entries"""
+        with self._lock:
+            now = time.time()
+            entries = {
+                path: entry for path, entry in self._load().items()
+                if now - entry.get('timestamp', 0) <= self.max_age
+            }
+            self._entries = entries
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
+
+class RebootDeleter(ABC):
+    """Schedules files for deletion when the system next starts"""
+
+    @abstractmethod
+    def schedule(self, path: str) -> bool:
+        """Schedule one file, returning False if that was refused"""
+
+class WinRebootDeleter(RebootDeleter):
+    """
+    Uses MoveFileEx with MOVEFILE_DELAY_UNTIL_REBOOT
+
+    Windows records the file under PendingFileRenameOperations, which
+    requires administrator rights, and deletes it early in the next boot,
+    before any program can open it.
+    """
+
+    def __init__(self):
+        import ctypes
+        self._move_file = ctypes.windll.kernel32.MoveFileExW
+
+    def schedule(self, path: str) -> bool:
+        return bool(self._move_file(path, None, MOVEFILE_DELAY_UNTIL_REBOOT))
+
+def default_reboot_deleter() -> Optional[RebootDeleter]:
+    """A RebootDeleter for this platform, or None where there is none"""
+    if sys.platform != 'win32':
+        logging.getLogger(__name__).debug("Delete-on-reboot is only available on Windows")
+        return None
+    return WinRebootDeleter()
@@ -0,0 +1,317 @@
+"""
+Persistent, incremental disk-usage index for Ruddibaba Optimizer
+
+DiskIndex keeps a SQLite table with one row per directory: the size and
+number of the files directly inside it, the total size of its subtree and
+its mtime when it was last listed. It also keeps each directory's largest
+files. Creating, deleting or renaming an entry updates its directory's
+mtime. A refresh therefore stats every directory but lists only the ones
+whose mtime changed. Files that grow in place do not touch their
+directory's mtime, so a full rescan (``full=True``) is still needed to
+catch them.
+"""
+import os
+import heapq
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .scanner import is_link
+
+# Largest files kept per directory, which bounds the K of largest_files
+FILES_PER_DIRECTORY = 32
+
+# Directories written between commits, so an interrupted refresh keeps its progress
+COMMIT_INTERVAL = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    total_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE INDEX IF NOT EXISTS directories_size ON directories (size);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+"""
+
+def default_index_path() -> str:
+    """Location of the disk index under the application data directory"""
+    return os.path.join(
+        os.environ.get('LOCALAPPDATA', ''),
+        'RuddibabaOptimizer',
+        'diskindex.sqlite3'
+    )
+
+@dataclass
+class DirectoryUsage:
+    """Indexed space use of one directory"""
+    path: str
+    # Files directly inside the directory
+    size: int
+    files: int
+    # The whole subtree
+    total_size: int
+
+@dataclass
+class RefreshStats:
+    """What a refresh visited"""
+    directories: int = 0
+    rescanned: int = 0
+    removed: int = 0
+    errors: int = 0
+
+class _Frame:
+    """A directory on the refresh stack"""
+    __slots__ = ('path', 'size', 'children', 'total_size')
+
+    def __init__(self, path: str, size: int, children: List[Tuple[str, Optional[float]]]):
+        self.path = path
+        self.size = size
+        self.children = children
+        self.total_size = size
+
+class DiskIndex:
+    """Directory-size index of one or more trees"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open or create the index
+
+        Args:
+            path: Database file (default: under %LOCALAPPDATA%)
+        """
+        self.path = path or default_index_path()
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Cleanup tasks query the index from scheduler threads
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def refresh(
+        self,
+        root: str,
+        full: bool = False,
+        progress: Optional[Callable[[RefreshStats], None]] = None
+    ) -> RefreshStats:
+        """
+        Bring the index of a tree up to date
+
+        Args:
+            root: Volume or directory to index
+            full: List every directory, not only those whose mtime changed
+            progress: Called with the running totals every 1000 directories
+
+        Returns:
+            Counts of directories visited, listed and dropped
+        """
+        root = os.path.realpath(root)
+        stats = RefreshStats()
+        with self._lock:
+            try:
+                first = self._visit(root, None, full, stats)
+                stack = [first] if first else []
+                reported = committed = 0
+                while stack:
+                    frame = stack[-1]
+                    if frame.children:
+                        path, mtime = frame.children.pop()
+                        child = self._visit(path, mtime, full, stats)
+                        if child is not None:
+                            stack.append(child)
+                        if progress and stats.directories - reported >= 1000:
+                            reported = stats.directories
+                            progress(stats)
+                        continue
+                    # Post-order: every child's total is known by now
+                    stack.pop()
+                    self._conn.execute(
+                        "UPDATE directories SET total_size = ? WHERE path = ?",
+                        (frame.total_size, frame.path)
+                    )
+                    if stack:
+                        stack[-1].total_size += frame.total_size
+                    if stats.directories - committed >= COMMIT_INTERVAL:
+                        committed = stats.directories
+                        self._conn.commit()
+            finally:
+                self._conn.commit()
+        self.logger.info(
+            f"Indexed {root}: {stats.directories} directory(ies), "
+            f"{stats.rescanned} rescanned, {stats.removed} removed"
+        )
+        return stats
+
+    def size_of(self, path: str) -> Optional[int]:
+        """Indexed total size of a directory, or None if it is not indexed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_size FROM directories WHERE path = ?",
+                (os.path.realpath(path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def rank(self, paths: Iterable[str]) -> List[str]:
+        """Paths ordered by indexed total size, largest first; unindexed paths last"""
+        return sorted(paths, key=lambda path: self.size_of(path) or 0, reverse=True)
+
+    def children(self, path: str) -> List[DirectoryUsage]:
+        """Indexed subdirectories of a directory, largest subtree first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, files, total_size FROM directories "
+                "WHERE parent = ? ORDER BY total_size DESC",
+                (os.path.realpath(path),)
+            ).fetchall()
+        return [DirectoryUsage(*row) for row in rows]
+
+    def largest_directories(self, root: str, k: int = 10) -> Iterator[DirectoryUsage]:
+        """
+        The directories under root holding the most data directly inside them
+
+        Rows are read in size order and the query stops after k matches,
+        so the tree is never loaded as a whole.
+        """
+        low, high = _subtree_range(os.path.realpath(root))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, files, total_size FROM directories "
+                "WHERE (path = ? OR (path >= ? AND path < ?)) "
+                "ORDER BY size DESC LIMIT ?",
+                (os.path.realpath(root), low, high, k)
+            ).fetchall()
+        return (DirectoryUsage(*row) for row in rows)
+
+    def largest_files(self, root: str, k: int = 10) -> Iterator[Tuple[str, int]]:
+        """
+        The largest files under root, as (path, size)
+
+        Exact for k up to FILES_PER_DIRECTORY, since every file in the
+        global top k is also among the largest of its own directory.
+        """
+        root = os.path.realpath(root)
+        low, high = _subtree_range(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size FROM files "
+                "WHERE directory = ? OR (directory >= ? AND directory < ?) "
+                "ORDER BY size DESC LIMIT ?",
+                (root, low, high, k)
+            ).fetchall()
+        return iter(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _visit(
+        self,
+        path: str,
+        mtime: Optional[float],
+        full: bool,
+        stats: RefreshStats
+    ) -> Optional[_Frame]:
+        """Load an unchanged directory from the index, or list it again"""
+        if mtime is None:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError as e:
+                self.logger.debug(f"Could not stat {path}: {str(e)}")
+                stats.errors += 1
+                self._remove(path, stats)
+                return None
+        stats.directories += 1
+
+        row = self._conn.execute(
+            "SELECT mtime, size FROM directories WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row[0] == mtime and not full:
+            children = self._conn.execute(
+                "SELECT path FROM directories WHERE parent = ?", (path,)
+            ).fetchall()
+            return _Frame(path, row[1], [(child, None) for (child,) in children])
+
+        size = files = 0
+        largest: List[Tuple[int, str]] = []
+        children: List[Tuple[str, Optional[float]]] = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False) and not is_link(entry):
+                            children.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+                            continue
+                        entry_size = entry.stat(follow_symlinks=False).st_size
+                    except OSError as e:
+                        self.logger.debug(f"Could not read {entry.path}: {str(e)}")
+                        stats.errors += 1
+                        continue
+                    size += entry_size
+                    files += 1
+                    # Streaming top-k: the heap never holds more than k files
+                    if len(largest) < FILES_PER_DIRECTORY:
+                        heapq.heappush(largest, (entry_size, entry.path))
+                    elif entry_size > largest[0][0]:
+                        heapq.heapreplace(largest, (entry_size, entry.path))
+        except OSError as e:
+            self.logger.debug(f"Could not scan {path}: {str(e)}")
+            stats.errors += 1
+            return None
+        stats.rescanned += 1
+
+        known = {
+            child for (child,) in self._conn.execute(
+                "SELECT path FROM directories WHERE parent = ?", (path,)
+            )
+        }
+        current = {child for child, _ in children}
+        for gone in known - current:
+            self._remove(gone, stats)
+        # New subdirectories get a placeholder so an interrupted refresh
+        # still finds them through this, now up-to-date, directory
+        self._conn.executemany(
+            "INSERT INTO directories VALUES (?, ?, -1, 0, 0, 0)",
+            [(child, path) for child in current - known]
+        )
+        self._conn.execute("DELETE FROM files WHERE directory = ?", (path,))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+            [(file_path, path, file_size) for file_size, file_path in largest]
+        )
+        parent = os.path.dirname(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)",
+            (path, parent if parent != path else None, mtime, size, files, size)
+        )
+        return _Frame(path, size, children)
+
+    def _remove(self, path: str, stats: RefreshStats) -> None:
+        """Drop a directory and everything below it from the index"""
+        low, high = _subtree_range(path)
+        cursor = self._conn.execute(
+            "DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, low, high)
+        )
+        stats.removed += max(cursor.rowcount, 0)
+        self._conn.execute(
+            "DELETE FROM files WHERE directory = ? OR (directory >= ? AND directory < ?)",
+            (path, low, high)
+        )
+
+def _subtree_range(path: str) -> Tuple[str, str]:
+    """Bounds of the paths strictly below path, for a range query"""
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
@@ -0,0 +1,303 @@
+"""
+Staged duplicate-file detection for Ruddibaba Optimizer
+
+Files are narrowed down in three stages, each much cheaper than the next:
+
+1. A TreeScanner walk buckets files by size, which comes free with the
+   directory listing. A file with a unique size has no duplicate.
+2. The first and last EDGE_SIZE bytes of each remaining file are hashed.
+   Copies of installers and downloads usually differ in their headers or
+   trailers, if they differ at all.
+3. Only files still matching are hashed in full, through mmap, by a
+   process pool, so large files are hashed on every core without being
+   copied into Python memory.
+
+Hard links to the same file count as one file, since linking them again
+would free nothing.
+"""
+import os
+import mmap
+import uuid
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .cleanup import DeletionStats, canonical_roots
+from .quarantine import QuarantineStore
+from .scanner import TreeScanner
+from .throttle import Throttle
+
+# Bytes hashed at each end of a file in the second stage
+EDGE_SIZE = 4096
+
+# Files smaller than this are not worth a hard link or the hashing
+DEFAULT_MIN_SIZE = 1024 * 1024
+
+# Bytes hashed per update when hashing a whole file
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+class DuplicateAction(Enum):
+    """What to do with every copy but the first in a duplicate group"""
+    HARDLINK = 'hardlink'
+    DELETE = 'delete'
+
+@dataclass
+class DuplicateGroup:
+    """Files with identical contents; the first path is the one kept"""
+    size: int
+    paths: List[str]
+
+    @property
+    def reclaimable(self) -> int:
+        """Bytes freed by keeping a single copy"""
+        return self.size * (len(self.paths) - 1)
+
+@dataclass
+class DuplicateReport:
+    """Result of a duplicate search"""
+    groups: List[DuplicateGroup] = field(default_factory=list)
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    # Files hashed at each end, and in full
+    edge_hashed: int = 0
+    fully_hashed: int = 0
+
+    @property
+    def reclaimable(self) -> int:
+        """Bytes freed by keeping a single copy of every group"""
+        return sum(group.reclaimable for group in self.groups)
+
+class DuplicateFinder:
+    """Finds files with identical contents below a set of directories"""
+
+    def __init__(
+        self,
+        min_size: int = DEFAULT_MIN_SIZE,
+        processes: Optional[int] = None,
+        scanner: Optional[TreeScanner] = None,
+        throttle: Optional[Throttle] = None
+    ):
+        """
+        Initialize the finder
+
+        Args:
+            min_size: Smallest file size considered
+            processes: Worker processes for full hashes (default: one per
+                CPU); 1 hashes in the calling process
+            scanner: Scanner to walk the directories with
+            throttle: Limits every file read waits on
+        """
+        self.min_size = max(1, min_size)
+        self.processes = processes or os.cpu_count() or 1
+        self.scanner = scanner or TreeScanner()
+        self.throttle = throttle
+        self.logger = logging.getLogger(__name__)
+
+    def find(self, roots: Iterable[str]) -> DuplicateReport:
+        """
+        Find duplicate files
+
+        Args:
+            roots: Directories to search; canonicalized with canonical_roots
+
+        Returns:
+            Duplicate groups, largest reclaimable space first
+        """
+        report = DuplicateReport()
+        by_size: Dict[int, List[str]] = {}
+        roots = [root for root in canonical_roots(roots) if os.path.isdir(root)]
+        for candidate in self.scanner.walk(roots):
+            if candidate.is_dir or candidate.size < self.min_size:
+                continue
+            report.files_scanned += 1
+            report.bytes_scanned += candidate.size
+            by_size.setdefault(candidate.size, []).append(candidate.path)
+        buckets = [(size, paths) for size, paths in by_size.items() if len(paths) > 1]
+        by_size.clear()
+
+        # Reading a few KB is I/O bound, so threads are enough
+        by_edges: Dict[Tuple[int, str], List[str]] = {}
+        jobs = [(path, size) for size, paths in buckets for path in paths]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for (path, size), key in zip(jobs, pool.map(self._edge_key, jobs)):
+                if key is None:
+                    continue
+                report.edge_hashed += 1
+                by_edges.setdefault((size, key), []).append(path)
+
+        groups: List[DuplicateGroup] = []
+        full_jobs: List[Tuple[str, int]] = []
+        for (size, _), paths in by_edges.items():
+            paths = _distinct_files(paths)
+            if len(paths) < 2:
+                continue
+            if size <= 2 * EDGE_SIZE:
+                # The edges covered the whole file
+                groups.append(DuplicateGroup(size, sorted(paths)))
+            else:
+                full_jobs.extend((path, size) for path in paths)
+
+        by_hash: Dict[Tuple[int, str], List[str]] = {}
+        for (path, size), digest in zip(full_jobs, self._hash_all(full_jobs)):
+            if digest is None:
+                continue
+            report.fully_hashed += 1
+            by_hash.setdefault((size, digest), []).append(path)
+        groups.extend(
+            DuplicateGroup(size, sorted(paths))
+            for (size, _), paths in by_hash.items() if len(paths) > 1
+        )
+
+        report.groups = sorted(groups, key=lambda group: group.reclaimable, reverse=True)
+        self.logger.info(
+            f"Found {len(report.groups)} duplicate group(s) among {report.files_scanned} "
+            f"file(s); {report.reclaimable} byte(s) reclaimable "
+            f"({report.edge_hashed} edge-hashed, {report.fully_hashed} fully hashed)"
+        )
+        return report
+
+    def resolve(
+        self,
+        report: DuplicateReport,
+        action: DuplicateAction,
+        only: Optional[Set[str]] = None,
+        quarantine: Optional[QuarantineStore] = None
+    ) -> DeletionStats:
+        """
+        Keep the first path of every group and replace or delete the others
+
+        A copy whose size changed since the search is left alone. Hard
+        links replace the copy atomically, and only work within a volume.
+
+        Args:
+            report: Result of find()
+            action: What to do with each copy
+            only: Copies that may be handled, such as those confirmed in a
+                preview; any other copy is left in place
+            quarantine: When set, deleted copies are moved here instead,
+                one item per directory
+
+        Returns:
+            Copies handled and bytes freed; errors counts copies left in place
+        """
+        stats = DeletionStats()
+        quarantined: Dict[str, List[str]] = {}
+        for group in report.groups:
+            keeper = group.paths[0]
+            for path in group.paths[1:]:
+                if only is not None and path not in only:
+                    continue
+                try:
+                    if os.stat(path).st_size != group.size:
+                        stats.errors += 1
+                        continue
+                    if action is DuplicateAction.HARDLINK:
+                        _replace_with_link(keeper, path)
+                    elif quarantine is not None:
+                        quarantined.setdefault(os.path.dirname(path), []).append(path)
+                        continue
+                    else:
+                        os.remove(path)
+                except OSError as e:
+                    self.logger.debug(f"Could not {action.value} {path}: {str(e)}")
+                    stats.errors += 1
+                    continue
+                stats.files += 1
+                stats.bytes += group.size
+
+        sizes = {path: group.size for group in report.groups for path in group.paths}
+        for directory, paths in quarantined.items():
+            try:
+                quarantine.quarantine_entries(directory, [os.path.basename(p) for p in paths])
+            except OSError as e:
+                self.logger.debug(f"Could not quarantine copies in {directory}: {str(e)}")
+            for path in paths:
+                if os.path.lexists(path):
+                    stats.errors += 1
+                else:
+                    stats.files += 1
+                    stats.bytes += sizes[path]
+        self.logger.info(
+            f"Duplicates {action.value}: {stats.files} file(s), {stats.bytes} byte(s) freed, "
+            f"{stats.errors} left in place"
+        )
+        return stats
+
+    def _edge_key(self, job: Tuple[str, int]) -> Optional[str]:
+        if self.throttle is not None:
+            self.throttle.acquire(1, min(job[1], 2 * EDGE_SIZE))
+        return _edge_key(job)
+
+    def _hash_all(self, jobs: List[Tuple[str, int]]) -> List[Optional[str]]:
+        """Full hashes, in a process pool when there is enough work to share"""
+        if self.processes <= 1 or len(jobs) < 2:
+            return [self._hash_file(path, size) for path, size in jobs]
+        with ProcessPoolExecutor(max_workers=min(self.processes, len(jobs))) as pool:
+            if self.throttle is None:
+                return list(pool.map(_hash_file, [path for path, _ in jobs], chunksize=4))
+            # Files are handed out only as fast as the throttle allows
+            futures = []
+            for path, size in jobs:
+                self.throttle.acquire(1, size)
+                futures.append(pool.submit(_hash_file, path))
+            return [future.result() for future in futures]
+
+    def _hash_file(self, path: str, size: int) -> Optional[str]:
+        if self.throttle is not None:
+            self.throttle.acquire(1, size)
+        return _hash_file(path)
+
+def _edge_key(job: Tuple[str, int]) -> Optional[str]:
+    """Hash of the first and last EDGE_SIZE bytes of a file, or None if unreadable"""
+    path, size = job
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            digest.update(f.read(EDGE_SIZE))
+            if size > EDGE_SIZE:
+                f.seek(max(EDGE_SIZE, size - EDGE_SIZE))
+                digest.update(f.read(EDGE_SIZE))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _hash_file(path: str) -> Optional[str]:
+    """Hash of a whole file read through mmap, or None if unreadable; runs in worker processes"""
+    digest = hashlib.blake2b()
+    try:
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view, \
+                memoryview(view) as data:
+            for offset in range(0, len(data), HASH_CHUNK_SIZE):
+                digest.update(data[offset:offset + HASH_CHUNK_SIZE])
+    except (OSError, ValueError):
+        return None
+    return digest.hexdigest()
+
+def _distinct_files(paths: List[str]) -> List[str]:
+    """Drop paths that are hard links to a file already listed"""
+    seen = set()
+    distinct = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        key = (info.st_dev, info.st_ino)
+        if key not in seen:
+            seen.add(key)
+            distinct.append(path)
+    return distinct
+
+def _replace_with_link(target: str, path: str) -> None:
+    """Atomically replace path with a hard link to target"""
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.link"
+    os.link(target, temp_path)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,92 @@
+"""
+Per-device I/O scheduling helpers for Ruddibaba Optimizer
+
+Deleting or scanning files on a spinning disk slows down once too many
+operations are queued, because the head has to seek between them. An
+NVMe drive only reaches full speed with many operations queued. No single
+worker count suits both. Cleanup therefore gives every device its own
+queue, grouped with group_by_device. Each queue's concurrency is set by
+an AdaptiveLimit that follows the latency the device actually shows.
+"""
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Fraction above the best latency seen that still counts as uncongested
+LATENCY_TOLERANCE = 0.25
+
+# Latency this many times the best seen means the device is overloaded
+CONGESTION_FACTOR = 2.0
+
+# How fast the remembered best latency drifts up, per window, so one
+# unusually fast window (a cache hit) does not hold the limit down forever
+BEST_LATENCY_DECAY = 1.05
+
+def device_of(path: str) -> int:
+    """Identifier of the volume holding path; -1 if it cannot be determined"""
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return -1
+
+def group_by_device(paths: Iterable[str]) -> Dict[int, List[str]]:
+    """Paths grouped by volume, each group in its original order"""
+    groups: Dict[int, List[str]] = {}
+    for path in paths:
+        groups.setdefault(device_of(path), []).append(path)
+    return groups
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that follows observed per-operation latency
+
+    Callers acquire a slot before starting work and release it with the
+    per-operation latency they saw. After every ``window`` releases, the
+    limit grows by one while latency stays within LATENCY_TOLERANCE of the
+    best window so far. It halves once latency exceeds CONGESTION_FACTOR
+    times the best. This is additive increase, multiplicative decrease
+    against queueing delay.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 32, window: int = 8):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window = max(1, window)
+        self.in_flight = 0
+        self.best_latency: Optional[float] = None
+        self._samples: List[float] = []
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a free slot"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """
+        Free a slot
+
+        Args:
+            latency: Seconds per operation for the work done in the slot,
+                or None if nothing representative was done
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self._samples.append(latency)
+                if len(self._samples) >= self.window:
+                    self._adapt(sum(self._samples) / len(self._samples))
+                    self._samples = []
+            self._condition.notify_all()
+
+    def _adapt(self, latency: float) -> None:
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        if latency <= self.best_latency * (1 + LATENCY_TOLERANCE):
+            self.limit = min(self.limit + 1, self.maximum)
+        elif latency > self.best_latency * CONGESTION_FACTOR:
+            self.limit = max(self.limit // 2, self.minimum)
+        self.best_latency *= BEST_LATENCY_DECAY
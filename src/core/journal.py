@@ -0,0 +1,164 @@
+"""
+Checkpoint journal for long cleanup operations in Ruddibaba Optimizer
+
+A cleanup task appends its progress to a small JSON-lines file as it goes:
+files and bytes freed, and the directories it finished but could not
+remove (typically because something inside was locked). Directories that
+were removed need no record since a rescan will not find them. If the
+cleanup is interrupted, the next run can load the journal and skip
+everything it already handled. The file is deleted once the task
+completes.
+
+Writes are buffered and flushed every ``flush_interval`` seconds or
+``flush_entries`` records, so journaling adds almost nothing to the
+deletion loop while losing at most a second of progress on a crash.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import List, Set
+
+def default_journal_dir() -> str:
+    """Location of cleanup journals under the application data directory"""
+    return os.path.join(
+        os.environ.get('LOCALAPPDATA', ''),
+        'RuddibabaOptimizer',
+        'journal'
+    )
+
+class CleanupJournal:
+    """Progress journal for one cleanup task"""
+
+    def __init__(self, path: str, flush_interval: float = 1.0, flush_entries: int = 1000):
+        """
+        Initialize the journal
+
+        Args:
+            path: Journal file
+            flush_interval: Seconds between writes to disk
+            flush_entries: Buffered directory records that force a write
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_entries = flush_entries
+        self.files = 0
+        self.bytes = 0
+        self.completed: Set[str] = set()
+        self.logger = logging.getLogger(__name__)
+        self._pending_files = 0
+        self._pending_bytes = 0
+        self._pending_dirs: List[str] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_task(cls, task_name: str, journal_dir: str, resume: bool) -> 'CleanupJournal':
+        """
+        Open the journal of a task
+
+        Args:
+            task_name: Task whose progress is journaled
+            journal_dir: Directory holding journal files
+            resume: Load the previous checkpoint; otherwise start afresh
+        """
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', task_name)
+        journal = cls(os.path.join(journal_dir, f"{safe_name}.jsonl"))
+        if resume:
+            journal.load()
+        else:
+            journal.discard()
+        return journal
+
+    @property
+    def resumed(self) -> bool:
+        """Whether a previous checkpoint was loaded"""
+        return bool(self.files or self.completed)
+
+    def load(self) -> None:
+        """Read the previous checkpoint, ignoring a torn last line"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.files += record.get('files', 0)
+                    self.bytes += record.get('bytes', 0)
+                    self.completed.update(record.get('dirs', []))
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            self.logger.warning(f"Ignoring unreadable journal {self.path}: {str(e)}")
+            return
+        if self.resumed:
+            self.logger.info(
+                f"Resuming from checkpoint: {self.files} file(s), {self.bytes} byte(s) "
+                f"already freed, {len(self.completed)} directory(ies) already handled"
+            )
+
+    def record(self, files: int, bytes_freed: int, directories: List[str]) -> None:
+        """
+        Add progress; written to disk at the next flush
+
+        Args:
+            files: Files deleted since the last call
+            bytes_freed: Bytes freed since the last call
+            directories: Directories finished but left in place
+        """
+        with self._lock:
+            self.files += files
+            self.bytes += bytes_freed
+            self.completed.update(directories)
+            self._pending_files += files
+            self._pending_bytes += bytes_freed
+            self._pending_dirs.extend(directories)
+            due = (
+                len(self._pending_dirs) >= self.flush_entries
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if due:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Write buffered progress to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def complete(self) -> None:
+        """The task finished; nothing is left to resume"""
+        with self._lock:
+            self._pending_files = self._pending_bytes = 0
+            self._pending_dirs = []
+        self.discard()
+
+    def discard(self) -> None:
+        """Delete the journal file"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Could not remove journal {self.path}: {str(e)}")
+
+    def _flush_locked(self) -> None:
+        self._last_flush = time.monotonic()
+        if not (self._pending_files or self._pending_dirs):
+            return
+        record = {'files': self._pending_files, 'bytes': self._pending_bytes}
+        if self._pending_dirs:
+            record['dirs'] = self._pending_dirs
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            # Progress is still applied; only the ability to resume suffers
+            self.logger.warning(f"Could not write journal {self.path}: {str(e)}")
+        self._pending_files = self._pending_bytes = 0
+        self._pending_dirs = []
@@ -0,0 +1,137 @@
+"""
+Per-task run metrics and metric exporters for Ruddibaba Optimizer
+"""
+import os
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from enum import Enum, auto
+from typing import Dict, List, Optional, Tuple
+
+class TaskStatus(Enum):
+    """Outcome of a task in the last run"""
+    APPLIED = auto()
+    COMPLIANT = auto()
+    CACHED = auto()
+    FAILED = auto()
+
+@dataclass
+class TaskResult:
+    """What a single task did during a run and what it cost"""
+    name: str
+    status: Optional[TaskStatus] = None
+    wall_time: float = 0.0
+    # Process-wide when tasks run one at a time, else the task's thread only
+    cpu_time: float = 0.0
+    files_deleted: int = 0
+    bytes_deleted: int = 0
+    files_deferred: int = 0
+    bytes_deferred: int = 0
+    registry_written: int = 0
+    registry_skipped: int = 0
+    commands: List[Tuple[str, Optional[int]]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        """Whether the task ended in a good state"""
+        return self.status is not TaskStatus.FAILED
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable representation"""
+        data = asdict(self)
+        data['status'] = self.status.name.lower() if self.status else None
+        data['success'] = self.success
+        data['commands'] = [
+            {'command': command, 'returncode': returncode}
+            for command, returncode in self.commands
+        ]
+        return data
+
+def export_json(results: Dict[str, TaskResult], path: str, level: str) -> None:
+    """
+    Write task results as a JSON document
+
+    Args:
+        results: Task results from BaseOptimizer.last_results
+        path: Output file
+        level: Optimization level name, recorded alongside the results
+    """
+    document = {
+        'level': level,
+        'timestamp': time.time(),
+        'tasks': [result.to_dict() for result in results.values()]
+    }
+    _write_atomic(path, json.dumps(document, indent=2))
+
+def export_prometheus(results: Dict[str, TaskResult], path: str, level: str) -> None:
+    """
+    Write task results in the Prometheus text exposition format
+
+    The file is replaced atomically so the node_exporter textfile
+    collector never reads a partial file.
+
+    Args:
+        results: Task results from BaseOptimizer.last_results
+        path: Output file, normally ending in .prom
+        level: Optimization level name, added as a label
+    """
+    metrics = [
+        ('ruddibaba_task_success', 'Whether the task ended in a good state',
+         lambda r: int(r.success)),
+        ('ruddibaba_task_wall_seconds', 'Wall-clock time spent running the task',
+         lambda r: r.wall_time),
+        ('ruddibaba_task_cpu_seconds',
+         'CPU time used by the task; includes worker pools only when tasks run one at a time',
+         lambda r: r.cpu_time),
+        ('ruddibaba_task_files_deleted', 'Files deleted by the task',
+         lambda r: r.files_deleted),
+        ('ruddibaba_task_bytes_deleted', 'Bytes reclaimed by the task',
+         lambda r: r.bytes_deleted),
+        ('ruddibaba_task_files_deferred', 'Files left in place because they were in use',
+         lambda r: r.files_deferred),
+        ('ruddibaba_task_bytes_deferred', 'Bytes in files left in place because they were in use',
+         lambda r: r.bytes_deferred),
+        ('ruddibaba_task_registry_values_written', 'Registry values changed by the task',
+         lambda r: r.registry_written),
+        ('ruddibaba_task_registry_values_skipped', 'Registry values already at their target',
+         lambda r: r.registry_skipped),
+        ('ruddibaba_task_commands', 'External commands run by the task',
+         lambda r: len(r.commands)),
+        ('ruddibaba_task_commands_failed', 'External commands that exited non-zero or timed out',
+         lambda r: sum(1 for _, code in r.commands if code != 0)),
+    ]
+
+    lines = [
+        "# HELP ruddibaba_task_status Outcome of the task in the last run",
+        "# TYPE ruddibaba_task_status gauge"
+    ]
+    for result in results.values():
+        for status in TaskStatus:
+            labels = (f'task="{_escape(result.name)}",level="{_escape(level)}",'
+                      f'status="{status.name.lower()}"')
+            lines.append(f"ruddibaba_task_status{{{labels}}} {int(result.status is status)}")
+
+    for metric, help_text, value in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for result in results.values():
+            labels = f'task="{_escape(result.name)}",level="{_escape(level)}"'
+            lines.append(f"{metric}{{{labels}}} {value(result)}")
+
+    lines.append("# HELP ruddibaba_last_run_timestamp_seconds Time the last run finished")
+    lines.append("# TYPE ruddibaba_last_run_timestamp_seconds gauge")
+    lines.append(f'ruddibaba_last_run_timestamp_seconds{{level="{_escape(level)}"}} {time.time():.3f}')
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _write_atomic(path: str, content: str) -> None:
+    """Write a file via a temporary file and rename"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
@@ -2,10 +2,29 @@
 Optimization modules for Ruddibaba Optimizer
 """
 from enum import Enum, auto
-from typing import List, Dict, Optional, Callable
-from dataclasses import dataclass
+from typing import Any, Iterable, List, Dict, Optional, Callable, Union
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import time
 import logging
+import threading
+
+from ..cache import TaskCache, fingerprint
+from ..cleanup import DEFAULT_WORKERS, DeletionManifest, iter_candidates
+from ..commands import CommandRunner
+from ..deferred import LockedFileStore, RebootDeleter
+from ..diskindex import DiskIndex
+from ..duplicates import DuplicateAction, DuplicateReport
+from ..journal import CleanupJournal, default_journal_dir
+from ..quarantine import QuarantineStore
+from ..metrics import TaskResult, TaskStatus
+from ..command_host import get_command_runner
+from ..registry import RegistryBackend, RegistryTransaction, default_registry_backend
+from ..scanner import Candidate
+from ..scheduler import TaskScheduler, path_resource
+from ..state import RegistryState, read_state, state_matches
+from ..throttle import Throttle, enter_background_mode
 
 class OptimizationLevel(Enum):
     """Optimization levels for the optimizer"""
@@ -22,12 +41,73 @@ class OptimizationTask:
     level: OptimizationLevel
     requires_admin: bool = False
     enabled: bool = True
+    depends_on: List[str] = field(default_factory=list)
+    resources: List[str] = field(default_factory=list)
+    # Registry-visible state the task establishes, compared by the probe
+    state: RegistryState = field(default_factory=dict)
+    # Cheap check of anything not covered by state: True if compliant,
+    # False if drifted, None if unknown
+    probe: Optional[Callable[[], Optional[bool]]] = None
+    # Directories whose mtimes are part of the task's cache fingerprint
+    watch_paths: List[str] = field(default_factory=list)
+    # For cleanup tasks: streams what the task would delete, for previews
+    plan: Optional[Callable[[], Iterable[Candidate]]] = None
+    # Files the task rewrites or deletes, saved in the pre-run backup; a
+    # callable is asked for them when the backup is taken
+    backup_files: Union[List[str], Callable[[], List[str]]] = field(default_factory=list)
+
+TaskHook = Callable[..., None]
 
 class BaseOptimizer:
     """Base class for all optimizers"""
     
-    def __init__(self, level: OptimizationLevel):
+    # Hooks registered with register_hook apply to every optimizer instance
+    _global_hooks: Dict[str, List[TaskHook]] = {'pre_task': [], 'post_task': []}
+    
+    def __init__(
+        self,
+        level: OptimizationLevel,
+        max_workers: int = 4,
+        command_runner: Optional[CommandRunner] = None,
+        registry_backend: Optional[RegistryBackend] = None,
+        cache: Optional[TaskCache] = None,
+        journal_dir: Optional[str] = None,
+        quarantine: Optional[QuarantineStore] = None,
+        disk_index: Optional[DiskIndex] = None,
+        duplicate_action: Optional[DuplicateAction] = None,
+        throttle: Optional[Throttle] = None,
+        locked_files: Optional[LockedFileStore] = None,
+        reboot_deleter: Optional[RebootDeleter] = None,
+        deletion_workers: int = DEFAULT_WORKERS
+    ):
         self.level = level
+        self.max_workers = max_workers
+        self.commands = command_runner or get_command_runner()
+        self.registry_backend = registry_backend or default_registry_backend()
+        self.registry = RegistryTransaction(self.registry_backend)
+        self.cache = cache if cache is not None else TaskCache()
+        self.journal_dir = journal_dir or default_journal_dir()
+        self.resume = False
+        # When set, cleanup tasks move files here instead of deleting them
+        self.quarantine = quarantine
+        # When set, cleanup sweeps start with the largest indexed targets
+        self.disk_index = disk_index
+        # Applied to duplicate files found by dedupe tasks; None only reports them
+        self.duplicate_action = duplicate_action
+        self.duplicates: Optional[DuplicateReport] = None
+        # When set, runs at background priority within these limits
+        self.throttle = throttle
+        # Files in use that cleanups skip until they change
+        self.locked_files = locked_files if locked_files is not None else LockedFileStore()
+        # When set, files still in use after a cleanup are deleted at restart
+        self.reboot_deleter = reboot_deleter
+        # Threads deleting files per device; 1 deletes on the task's own thread
+        self.deletion_workers = deletion_workers
+        self.last_results: Dict[str, TaskResult] = {}
+        self.manifests: Dict[str, DeletionManifest] = {}
+        self.sweep = CleanupSweep(self)
+        self._local = threading.local()
+        self._hooks: Dict[str, List[TaskHook]] = {'pre_task': [], 'post_task': []}
         self.tasks: List[OptimizationTask] = []
         self.logger = logging.getLogger(__name__)
         self._setup_tasks()
@@ -36,6 +116,58 @@ class BaseOptimizer:
         """Setup optimization tasks. Should be implemented by subclasses."""
         pass
     
+    @classmethod
+    def register_hook(cls, event: str, hook: TaskHook) -> TaskHook:
+        """
+        Register a hook for every optimizer
+        
+        Pre-task hooks are called as hook(optimizer, task) on the worker
+        thread just before the task runs; post-task hooks are called as
+        hook(optimizer, task, result) right after it finishes. Exceptions
+        raised by hooks are logged and otherwise ignored.
+        
+        Args:
+            event: 'pre_task' or 'post_task'
+            hook: Callable to register
+            
+        Returns:
+            The hook, unchanged
+        """
+        if event not in cls._global_hooks:
+            raise ValueError(f"Unknown hook event '{event}'")
+        cls._global_hooks[event].append(hook)
+        return hook
+    
+    @classmethod
+    def unregister_hook(cls, event: str, hook: TaskHook) -> None:
+        """Remove a hook registered with register_hook"""
+        if hook in cls._global_hooks.get(event, []):
+            cls._global_hooks[event].remove(hook)
+    
+    def add_hook(self, event: str, hook: TaskHook) -> None:
+        """Register a hook for this optimizer only (see register_hook)"""
+        if event not in self._hooks:
+            raise ValueError(f"Unknown hook event '{event}'")
+        self._hooks[event].append(hook)
+    
+    def remove_hook(self, event: str, hook: TaskHook) -> None:
+        """Remove a hook added with add_hook"""
+        if hook in self._hooks.get(event, []):
+            self._hooks[event].remove(hook)
+    
+    def _call_hooks(self, event: str, *args) -> None:
+        """Call every hook for an event, isolating hook failures"""
+        for hook in self._global_hooks[event] + self._hooks[event]:
+            try:
+                hook(self, *args)
+            except Exception as e:
+                self.logger.warning(f"{event} hook {hook!r} failed: {str(e)}")
+    
+    @property
+    def last_status(self) -> Dict[str, TaskStatus]:
+        """Status of each task in the last run"""
+        return {name: result.status for name, result in self.last_results.items()}
+    
     def get_available_tasks(self) -> List[OptimizationTask]:
         """Get all available tasks for the current optimization level"""
         return [
@@ -43,20 +175,352 @@ class BaseOptimizer:
             if task.level.value <= self.level.value and task.enabled
         ]
     
-    def run_all(self) -> Dict[str, bool]:
-        """Run all enabled tasks for the current optimization level"""
-        results = {}
+    def preview(
+        self,
+        callback: Optional[Callable[[OptimizationTask, DeletionManifest], None]] = None,
+        interval: int = 1000
+    ) -> Dict[str, DeletionManifest]:
+        """
+        Scan what every cleanup task would delete, without deleting anything
+        
+        The manifests are kept, and the next run_all deletes exactly what
+        they list instead of scanning again.
+        
+        Args:
+            callback: Called as callback(task, manifest) every ``interval``
+                entries and once when a task's scan finishes
+            interval: Entries between callback invocations
+            
+        Returns:
+            Dictionary mapping cleanup task names to their manifests
+        """
+        manifests = {}
         for task in self.get_available_tasks():
+            if task.plan is None:
+                continue
+            manifest = DeletionManifest()
+            for candidate in task.plan():
+                manifest.add(candidate)
+                if callback and manifest.entries % interval == 0:
+                    callback(task, manifest)
+            if callback:
+                callback(task, manifest)
+            manifests[task.name] = manifest
+        self.manifests = manifests
+        return manifests
+    
+    def open_journal(self, task_name: str) -> CleanupJournal:
+        """
+        The checkpoint journal of a cleanup task
+        
+        When the run was started with resume=True the previous checkpoint is
+        loaded; otherwise any stale journal is discarded.
+        """
+        return CleanupJournal.for_task(task_name, self.journal_dir, self.resume)
+    
+    def take_manifest(self, task_name: str) -> Optional[DeletionManifest]:
+        """The previewed manifest for a task, if any; it can only be used once"""
+        return self.manifests.pop(task_name, None)
+    
+    def cleanup_task(self, name: str) -> OptimizationTask:
+        """
+        Build the task for a target of the cleanup catalog
+        
+        Targets that delete everything under their roots are probed and
+        cached by their directories; filtered targets, whose files age
+        into scope without touching the directories, always run.
+        """
+        target = get_target(name)
+        roots = target.roots()
+        return OptimizationTask(
+            name=target.name,
+            description=target.description,
+            function=lambda: self.clear_target(target.name),
+            level=target.level,
+            requires_admin=target.requires_admin,
+            resources=[SWEEP_RESOURCE] + [path_resource(root) for root in roots],
+            probe=None if target.filtered else (lambda: dirs_empty(target.roots())),
+            watch_paths=[] if target.filtered else roots,
+            plan=lambda: iter_candidates(target.roots(), policy=target.policy())
+        )
+    
+    def clear_target(self, name: str) -> None:
+        """Run a catalog cleanup target, sweeping other scheduled targets with it"""
+        stats = self.sweep.run(name)
+        self.record_deleted(stats.files, stats.bytes)
+        self.record_deferred(stats.deferred, stats.deferred_bytes)
+    
+    def probe_all(
+        self,
+        tasks: Optional[List[OptimizationTask]] = None,
+        current: Optional[RegistryState] = None
+    ) -> Dict[str, Optional[bool]]:
+        """
+        Check which tasks are already compliant, in one batched pass
+
+        The declared state of every task is read with a single batched
+        registry read, then any custom probes run concurrently.
+
+        Args:
+            tasks: Tasks to probe (default: all available tasks)
+            current: Registry values already read for these tasks, if any
+
+        Returns:
+            Dictionary mapping task names to True (compliant), False
+            (drifted) or None (cannot tell)
+        """
+        if tasks is None:
+            tasks = self.get_available_tasks()
+        if current is None:
+            current = self._read_state(tasks)
+
+        def probe(task: OptimizationTask) -> Optional[bool]:
+            if task.state and not state_matches(task.state, current):
+                return False
+            if task.probe is None:
+                return True if task.state else None
             try:
-                self.logger.info(f"Running task: {task.name}")
-                task.function()
-                results[task.name] = True
+                return task.probe()
             except Exception as e:
-                self.logger.error(f"Error running task {task.name}: {str(e)}")
-                results[task.name] = False
-        return results
+                self.logger.debug(f"Probe for task {task.name} failed: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            return dict(zip([t.name for t in tasks], pool.map(probe, tasks)))
+
+    def capture_state(self, tasks: Optional[List[OptimizationTask]] = None) -> Dict[str, Any]:
+        """
+        Read everything the tasks are about to change, for a backup
+
+        The registry values, service start types and power settings that
+        the tasks declare in their state are read in one batched, parallel
+        pass. Values that do not exist yet are left out, since restoring
+        cannot remove them. Declared backup files are listed for
+        BackupManager to store.
+
+        Args:
+            tasks: Tasks about to run (default: all available tasks)
+
+        Returns:
+            Backup data in the format BackupManager.restore_backup restores
+        """
+        if tasks is None:
+            tasks = self.get_available_tasks()
+        start = time.perf_counter()
+        current = self._read_state(tasks)
+        self.logger.info(
+            f"Captured {sum(len(values) for values in current.values())} registry value(s) "
+            f"for {len(tasks)} task(s) in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        data = {
+            'optimization_level': self.level.name.lower(),
+            'tasks': [task.name for task in tasks],
+            'registry': current
+        }
+        files = sorted({
+            path for task in tasks
+            for path in (task.backup_files() if callable(task.backup_files) else task.backup_files)
+        })
+        if files:
+            data['files'] = files
+        return data
+
+    def _read_state(self, tasks: List[OptimizationTask]) -> RegistryState:
+        """Read the current values of every task's declared state in one pass"""
+        return read_state(self.registry_backend, [t.state for t in tasks], self.max_workers)
+
+    def _fingerprint(self, task: OptimizationTask, current: RegistryState) -> Optional[str]:
+        """Cache fingerprint of a task's inputs, or None if it declares none"""
+        if not task.state and not task.watch_paths:
+            return None
+        return fingerprint(task.state, current, task.watch_paths)
+
+    def run_all(
+        self,
+        progress_callback: Optional[Callable[[], None]] = None,
+        probe: bool = True,
+        use_cache: bool = True,
+        resume: bool = False
+    ) -> Dict[str, bool]:
+        """
+        Run all enabled tasks for the current optimization level
+
+        Independent tasks run concurrently; tasks sharing a resource or
+        declaring a dependency are ordered by the scheduler. Registry
+        writes staged by the tasks are committed together once all tasks
+        have finished. With a throttle the process drops to background
+        priority first, and every task waits for the system to be idle
+        enough before it starts.
+
+        Args:
+            progress_callback: Optional callable invoked after each task finishes
+            probe: Skip tasks whose probe reports them already compliant
+            use_cache: Skip tasks whose inputs are unchanged since their last success
+            resume: Continue interrupted cleanups from their last checkpoint
+
+        Returns:
+            Dictionary mapping task names to success; details are in last_results
+        """
+        tasks = self.get_available_tasks()
+        self.resume = resume
+        if self.throttle is not None and not enter_background_mode():
+            self.logger.warning("Could not lower process priority; running throttled only")
+        self.last_results = {task.name: TaskResult(task.name) for task in tasks}
+        current = self._read_state(tasks) if (probe or use_cache) else {}
+
+        # A confirmed preview is deleted whatever the cache or probes say
+        pending = tasks
+        if use_cache:
+            pending = []
+            for task in tasks:
+                task_fingerprint = self._fingerprint(task, current)
+                if (task.name not in self.manifests and task_fingerprint
+                        and self.cache.is_fresh(task.name, task_fingerprint)):
+                    self.logger.info(f"Task {task.name}: unchanged since last run")
+                    self.last_results[task.name].status = TaskStatus.CACHED
+                    if progress_callback:
+                        progress_callback()
+                else:
+                    pending.append(task)
+
+        if probe:
+            compliance = self.probe_all(
+                [task for task in pending if task.name not in self.manifests], current
+            )
+            remaining = []
+            for task in pending:
+                if compliance.get(task.name):
+                    self.logger.info(f"Task {task.name}: already compliant")
+                    self.last_results[task.name].status = TaskStatus.COMPLIANT
+                    if progress_callback:
+                        progress_callback()
+                else:
+                    remaining.append(task)
+            pending = remaining
+
+        def on_complete(task: OptimizationTask, success: bool) -> None:
+            self.last_results[task.name].status = (
+                TaskStatus.APPLIED if success else TaskStatus.FAILED
+            )
+            if progress_callback:
+                progress_callback()
+
+        self.sweep.reset([task.name for task in pending if SWEEP_RESOURCE in task.resources])
+        scheduler = TaskScheduler(max_workers=self.max_workers)
+        results = scheduler.run(pending, self._run_task, on_complete)
+        if self.throttle is not None:
+            self.logger.info(f"Throttled for {self.throttle.waited:.1f}s in total")
+
+        commit = self.registry.commit()
+        for name, counts in commit.owners.items():
+            result = self.last_results.get(name)
+            if result is None:
+                continue
+            result.registry_written = counts['written']
+            result.registry_skipped = counts['skipped']
+            if counts['failed'] and name in results:
+                results[name] = False
+                result.status = TaskStatus.FAILED
+                result.error = result.error or "registry write failed"
+
+        # Manifests of tasks that were skipped are stale by the next run
+        for manifest in self.manifests.values():
+            manifest.close()
+        self.manifests = {}
+        self._update_cache(tasks)
+        return {task.name: results.get(task.name, True) for task in tasks}
+
+    def _update_cache(self, tasks: List[OptimizationTask]) -> None:
+        """
+        Record fingerprints of tasks that applied or were found compliant
+
+        A task whose declared state still differs afterwards is not
+        recorded, so a command that reported success without changing
+        anything is probed again next time.
+        """
+        done = [
+            task for task in tasks
+            if self.last_status.get(task.name) in (TaskStatus.APPLIED, TaskStatus.COMPLIANT)
+        ]
+        current = self._read_state(done)
+        for task in done:
+            if task.state and not state_matches(task.state, current):
+                self.logger.info(f"Task {task.name}: state not reached, not caching")
+                continue
+            task_fingerprint = self._fingerprint(task, current)
+            if task_fingerprint:
+                self.cache.put(task.name, task_fingerprint)
+        try:
+            self.cache.save()
+        except OSError as e:
+            self.logger.warning(f"Failed to save task cache: {str(e)}")
+
+    def _run_task(self, task: OptimizationTask) -> bool:
+        """Run a single task, logging and swallowing any error"""
+        result = self.last_results.setdefault(task.name, TaskResult(task.name))
+        self._local.result = result
+        if self.throttle is not None:
+            self.throttle.wait_for_load()
+        self._call_hooks('pre_task', task)
+        result.wall_time = result.cpu_time = 0.0
+        start, cpu_start = time.perf_counter(), self.cpu_time()
+        commands: List = []
+        success = False
+        try:
+            self.logger.info(f"Running task: {task.name}")
+            with self.registry.owner(task.name), self.commands.recording() as commands:
+                task.function()
+            success = True
+        except Exception as e:
+            self.logger.error(f"Error running task {task.name}: {str(e)}")
+            result.error = str(e)
+        finally:
+            result.wall_time += time.perf_counter() - start
+            result.cpu_time += self.cpu_time() - cpu_start
+            result.commands = [(str(r.command), r.returncode) for r in commands]
+            result.status = TaskStatus.APPLIED if success else TaskStatus.FAILED
+            self._local.result = None
+        self._call_hooks('post_task', task, result)
+        return success
+
+    def cpu_time(self) -> float:
+        """
+        CPU clock tasks are measured with
+
+        When tasks run one at a time this is the whole process's, so the
+        deletion and command pools are included; otherwise only the
+        calling thread's can be attributed to a task.
+        """
+        return time.process_time() if self.max_workers == 1 else time.thread_time()
+
+    def record_time(self, wall_time: float, cpu_time: float) -> None:
+        """
+        Adjust the time of the task running on this thread
+
+        Work done once for several tasks, like a shared cleanup sweep, is
+        moved with this from the task that did it to those it was for.
+        """
+        result = getattr(self._local, 'result', None)
+        if result is not None:
+            result.wall_time += wall_time
+            result.cpu_time += cpu_time
+
+    def record_deleted(self, files: int, bytes_deleted: int) -> None:
+        """Add to the deletion counters of the task running on this thread"""
+        result = getattr(self._local, 'result', None)
+        if result is not None:
+            result.files_deleted += files
+            result.bytes_deleted += bytes_deleted
+
+    def record_deferred(self, files: int, bytes_deferred: int) -> None:
+        """Add to the counters of files in use left behind by the task running on this thread"""
+        result = getattr(self._local, 'result', None)
+        if result is not None:
+            result.files_deferred += files
+            result.bytes_deferred += bytes_deferred
 
 # Import optimizers after base classes are defined
+from .catalog import SWEEP_RESOURCE, CleanupSweep, CleanupTarget, dirs_empty, get_target
 from .safe_optimizer import SafeOptimizer
 from .optional_optimizer import OptionalOptimizer
 from .hardcore_optimizer import HardcoreOptimizer
@@ -64,7 +528,10 @@ from .hardcore_optimizer import HardcoreOptimizer
 __all__ = [
     'OptimizationLevel',
     'OptimizationTask',
+    'TaskStatus',
+    'TaskResult',
     'BaseOptimizer',
+    'CleanupTarget',
     'SafeOptimizer',
     'OptionalOptimizer',
     'HardcoreOptimizer'
@@ -0,0 +1,357 @@
+"""
+Declarative catalog of file cleanup targets
+
+Each CleanupTarget names the directories to sweep, as path templates with
+%VARIABLE% references and wildcards, and optionally which files inside
+them to delete by name pattern, age and size. The optimizers turn the targets of
+their level into ordinary OptimizationTasks; when several of them run,
+CleanupSweep deletes all of them in a single DeletionEngine pass.
+"""
+import os
+import re
+import glob
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from ..cleanup import (
+    DeletionEngine, DeletionManifest, DeletionStats, SweepTarget, canonical_roots
+)
+from ..columnar import ExtensionIn, LargerThan, NameMatches, OlderThan, Policy
+from ..scanner import Candidate
+from . import OptimizationLevel
+
+# Shared by every catalog task so the scheduler runs them one at a time;
+# the first one sweeps for all of them
+SWEEP_RESOURCE = "cleanup:sweep"
+
+_VARIABLE = re.compile(r'%(\w+)%')
+_EXTENSION = re.compile(r'^\*\.[^*?\[\]]+$')
+
+@dataclass
+class CleanupTarget:
+    """A set of directories whose contents a cleanup task deletes"""
+    name: str
+    description: str
+    level: OptimizationLevel
+    # Directory templates, e.g. r"%LOCALAPPDATA%\Google\Chrome\User Data\*\Cache"
+    paths: List[str]
+    # Only files whose name matches one of these are deleted; empty means all
+    patterns: List[str] = field(default_factory=list)
+    # Only files not modified for this many days are deleted
+    min_age_days: float = 0
+    # Only files larger than this many bytes are deleted
+    min_size: int = 0
+    requires_admin: bool = False
+
+    @property
+    def filtered(self) -> bool:
+        """Whether some files under the roots are kept"""
+        return bool(self.patterns or self.min_age_days or self.min_size)
+
+    def roots(self) -> List[str]:
+        """
+        The existing directories this target currently refers to
+
+        A template referring to an unset variable is skipped rather than
+        expanded to a path relative to the drive root.
+        """
+        paths = []
+        for template in self.paths:
+            path = _expand(template.replace('\\', os.sep))
+            if path is None:
+                continue
+            if glob.has_magic(path):
+                paths.extend(sorted(glob.glob(path)))
+            else:
+                paths.append(path)
+        return canonical_roots(path for path in paths if os.path.isdir(path))
+
+    def policy(self) -> Optional[Policy]:
+        """Policy selecting the files to delete, or None for all of them"""
+        policies = []
+        if self.patterns:
+            # "*.ext" patterns compare interned extensions instead of names
+            extensions = [pattern[1:] for pattern in self.patterns if _EXTENSION.match(pattern)]
+            if len(extensions) == len(self.patterns):
+                policies.append(ExtensionIn(extensions))
+            else:
+                policies.append(NameMatches(self.patterns))
+        if self.min_age_days:
+            policies.append(OlderThan(self.min_age_days))
+        if self.min_size:
+            policies.append(LargerThan(self.min_size))
+        if not policies:
+            return None
+        policy = policies[0]
+        for other in policies[1:]:
+            policy = policy & other
+        return policy
+
+def _expand(template: str) -> Optional[str]:
+    """Replace %VARIABLE% references, or None if one is unset"""
+    missing = []
+
+    def value(match) -> str:
+        result = os.environ.get(match.group(1), '')
+        if not result:
+            missing.append(match.group(1))
+        return result
+    path = _VARIABLE.sub(value, template)
+    return None if missing else path
+
+def _browser_caches(user_data: str) -> List[str]:
+    """Cache directories of every profile of a Chromium-based browser"""
+    return [
+        rf"{user_data}\*\{cache}"
+        for cache in ("Cache", "Code Cache", "GPUCache")
+    ]
+
+CLEANUP_TARGETS = [
+    CleanupTarget(
+        name="clear_temp_files",
+        description="Clear temporary files",
+        level=OptimizationLevel.SAFE,
+        # TEMP, TMP and LOCALAPPDATA\Temp usually name the same directory
+        paths=[r"%TEMP%", r"%TMP%", r"%WINDIR%\Temp", r"%LOCALAPPDATA%\Temp"]
+    ),
+    CleanupTarget(
+        name="clear_windows_update_cache",
+        description="Clear Windows Update cache",
+        level=OptimizationLevel.SAFE,
+        paths=[r"%WINDIR%\SoftwareDistribution\Download"],
+        requires_admin=True
+    ),
+    CleanupTarget(
+        name="clear_prefetch",
+        description="Clear Prefetch entries of programs not run for a week",
+        level=OptimizationLevel.OPTIONAL,
+        paths=[r"%WINDIR%\Prefetch"],
+        patterns=["*.pf"],
+        min_age_days=7,
+        requires_admin=True
+    ),
+    CleanupTarget(
+        name="clear_browser_caches",
+        description="Clear Chrome, Edge and Firefox caches",
+        level=OptimizationLevel.OPTIONAL,
+        paths=(
+            _browser_caches(r"%LOCALAPPDATA%\Google\Chrome\User Data")
+            + _browser_caches(r"%LOCALAPPDATA%\Microsoft\Edge\User Data")
+            + [r"%LOCALAPPDATA%\Mozilla\Firefox\Profiles\*\cache2"]
+        )
+    )
+]
+
+def get_target(name: str) -> CleanupTarget:
+    """Look up a catalog target by task name"""
+    for target in CLEANUP_TARGETS:
+        if target.name == name:
+            return target
+    raise KeyError(f"No cleanup target '{name}'")
+
+def dirs_empty(paths: List[str]) -> bool:
+    """Whether every existing directory in paths has no entries"""
+    for path in paths:
+        try:
+            with os.scandir(path) as entries:
+                if next(entries, None) is not None:
+                    return False
+        except FileNotFoundError:
+            continue
+    return True
+
+class CleanupSweep:
+    """
+    Runs the catalog tasks of one optimizer as a single deletion pass
+
+    run_all tells the sweep which catalog tasks it scheduled. The first of
+    them to run sweeps all of them at once, so one scanner and one worker
+    pool per device cover every target; the others then only collect
+    their totals.
+    A target with a previewed manifest deletes exactly that manifest
+    instead. When the optimizer has a quarantine, the files of a manifest
+    and unfiltered targets are moved there rather than deleted. With a disk index, the largest targets and roots
+    are swept first, so an interrupted run has freed the most it could.
+
+    A failure is recorded against the targets it affected and raised only
+    from their own run; a target handled once, successfully or not, is
+    never swept again in the same run. The time a sweep took is divided
+    among its targets by the entries each one removed.
+    """
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.logger = logging.getLogger(__name__)
+        self._scheduled: Set[str] = set()
+        self._results: Dict[str, Union[DeletionStats, Exception]] = {}
+        # (wall, CPU) seconds to charge to each target's task
+        self._costs: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reset(self, task_names: List[str]) -> None:
+        """Start a new run in which the given catalog tasks are scheduled"""
+        with self._lock:
+            self._scheduled = set(task_names)
+            self._results = {}
+            self._costs = {}
+
+    def run(self, name: str) -> DeletionStats:
+        """
+        Clear one target, sweeping every other scheduled target with it
+
+        Returns:
+            Totals for this target
+        """
+        with self._lock:
+            if name not in self._results:
+                names = (self._scheduled | {name}) - set(self._results)
+                self._scheduled = set()
+                start, cpu_start = time.perf_counter(), self.optimizer.cpu_time()
+                try:
+                    self._sweep(names)
+                except Exception as e:
+                    for failed in names:
+                        self._results.setdefault(failed, e)
+                self._share_cost(
+                    names, name, time.perf_counter() - start, self.optimizer.cpu_time() - cpu_start
+                )
+            result = self._results.pop(name, None) or DeletionStats()
+            wall_time, cpu_time = self._costs.pop(name, (0.0, 0.0))
+        self.optimizer.record_time(wall_time, cpu_time)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _share_cost(self, names: Set[str], runner: str, wall_time: float, cpu_time: float) -> None:
+        """Divide the cost of a sweep among its targets; runner was charged all of it"""
+        weights = {}
+        for name in names:
+            result = self._results.get(name)
+            weights[name] = (
+                result.files + result.directories if isinstance(result, DeletionStats) else 0
+            )
+        total = sum(weights.values())
+        for name in names:
+            share = weights[name] / total if total else 1 / len(names)
+            self._costs[name] = (wall_time * share, cpu_time * share)
+        own_wall, own_cpu = self._costs[runner]
+        self._costs[runner] = (own_wall - wall_time, own_cpu - cpu_time)
+
+    def _sweep(self, names: Set[str]) -> None:
+        optimizer = self.optimizer
+        engine = DeletionEngine(
+            max_workers=optimizer.deletion_workers,
+            throttle=optimizer.throttle,
+            locked=optimizer.locked_files,
+            reboot=optimizer.reboot_deleter
+        )
+        roots = {name: get_target(name).roots() for name in sorted(names)}
+        index = optimizer.disk_index
+        if index is not None:
+            roots = {name: index.rank(paths) for name, paths in roots.items()}
+            sizes = {
+                name: sum(index.size_of(path) or 0 for path in paths)
+                for name, paths in roots.items()
+            }
+            roots = dict(sorted(roots.items(), key=lambda item: sizes[item[0]], reverse=True))
+        sweep_targets: Dict[str, SweepTarget] = {}
+        journals = {}
+
+        for name, target_roots in roots.items():
+            target = get_target(name)
+            try:
+                # A taken manifest is only ever deleted here; if that fails
+                # the target fails rather than being swept without it
+                manifest = optimizer.take_manifest(target.name)
+                if manifest is not None and optimizer.quarantine is not None:
+                    self._results[target.name] = self._quarantine_manifest(manifest)
+                elif manifest is not None:
+                    self._results[target.name] = engine.delete(manifest)
+                elif optimizer.quarantine is not None and not target.filtered:
+                    # Renames only; the purger frees the space later
+                    for root in target_roots:
+                        optimizer.quarantine.quarantine(root)
+                    self._results[target.name] = DeletionStats()
+                else:
+                    # An interrupted sweep leaves its journal behind for --resume
+                    journals[target.name] = optimizer.open_journal(target.name)
+                    sweep_targets[target.name] = SweepTarget(
+                        target_roots, target.policy(), journals[target.name]
+                    )
+            except Exception as e:
+                self.logger.error(f"Cleanup of {target.name} failed: {str(e)}")
+                self._results[target.name] = e
+
+        if sweep_targets:
+            try:
+                self._results.update(engine.sweep(sweep_targets))
+            except Exception as e:
+                # The targets share one pass, so none of them is known to be done
+                self.logger.error(f"Cleanup sweep failed: {str(e)}")
+                for name in sweep_targets:
+                    self._results[name] = e
+            else:
+                for journal in journals.values():
+                    journal.complete()
+        try:
+            optimizer.locked_files.save()
+        except OSError as e:
+            self.logger.warning(f"Failed to save locked-file list: {str(e)}")
+
+    def _quarantine_manifest(self, manifest: DeletionManifest) -> DeletionStats:
+        """
+        Move the files of a manifest into quarantine, one item per directory
+
+        Like DeletionEngine.delete, anything created since the preview is
+        left alone; a directory of the manifest is only removed once its
+        files have been moved out and it is empty.
+        """
+        stats = DeletionStats()
+        directory: Optional[str] = None
+        batch: List[Candidate] = []
+        try:
+            # Manifests are post-ordered, so a directory's files come before it
+            for candidate in manifest:
+                if candidate.is_dir:
+                    self._quarantine_batch(directory, batch, stats)
+                    batch = []
+                    try:
+                        os.rmdir(candidate.path)
+                        stats.directories += 1
+                    except OSError:
+                        pass
+                    continue
+                parent = os.path.dirname(candidate.path)
+                if parent != directory:
+                    self._quarantine_batch(directory, batch, stats)
+                    directory, batch = parent, []
+                batch.append(candidate)
+            self._quarantine_batch(directory, batch, stats)
+        finally:
+            manifest.close()
+        return stats
+
+    def _quarantine_batch(
+        self,
+        directory: Optional[str],
+        batch: List[Candidate],
+        stats: DeletionStats
+    ) -> None:
+        """Quarantine files of one directory, counting those still in place as errors"""
+        if not batch:
+            return
+        try:
+            self.optimizer.quarantine.quarantine_entries(
+                directory, [os.path.basename(candidate.path) for candidate in batch]
+            )
+        except OSError as e:
+            self.logger.debug(f"Could not quarantine files in {directory}: {str(e)}")
+        for candidate in batch:
+            if os.path.lexists(candidate.path):
+                stats.errors += 1
+            else:
+                stats.files += 1
+                stats.bytes += candidate.size
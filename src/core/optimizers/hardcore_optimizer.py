@@ -1,11 +1,40 @@
 """
 Hardcore optimization tasks that provide maximum performance but may affect system stability
 """
-import os
-import winreg
 from typing import Optional
 
+from ..commands import Command
+from ..registry import REG_DWORD
 from . import BaseOptimizer, OptimizationLevel, OptimizationTask
+from ..scheduler import registry_resources, service_resource
+from ..state import SERVICE_DISABLED, merge_state, service_state
+
+PREFETCH_STATE = {
+    r"HKLM\SYSTEM\CurrentControlSet\Control\Session Manager\Memory Management\PrefetchParameters": {
+        "EnableSuperfetch": (REG_DWORD, 0),
+        "EnablePrefetcher": (REG_DWORD, 0)
+    }
+}
+
+SEARCH_INDEXING_STATE = {
+    r"HKLM\SOFTWARE\Policies\Microsoft\Windows\Windows Search": {
+        "DisableBackoff": (REG_DWORD, 1),
+        "DisableRemovableDriveIndexing": (REG_DWORD, 1),
+        "PreventIndexingLowDiskSpaceMB": (REG_DWORD, 1)
+    }
+}
+
+NETWORK_THROTTLING_STATE = {
+    r"HKLM\SOFTWARE\Microsoft\Windows NT\CurrentVersion\Multimedia\SystemProfile": {
+        "NetworkThrottlingIndex": (REG_DWORD, 0xFFFFFFFF)
+    }
+}
+
+# Settings from 'netsh int tcp show global' that still exist on current builds
+TCP_GLOBAL_SETTINGS = {
+    "receive window auto-tuning level": "restricted",
+    "receive-side scaling state": "enabled"
+}
 
 class HardcoreOptimizer(BaseOptimizer):
     """Hardcore optimizations for maximum performance (use with caution)"""
@@ -18,68 +47,103 @@ class HardcoreOptimizer(BaseOptimizer):
                 description="Disable Superfetch service",
                 function=self.disable_superfetch,
                 level=OptimizationLevel.HARDCORE,
-                requires_admin=True
+                requires_admin=True,
+                resources=[service_resource("SysMain")] + registry_resources(PREFETCH_STATE),
+                state=merge_state(PREFETCH_STATE, service_state("SysMain", SERVICE_DISABLED))
             ),
             OptimizationTask(
                 name="disable_search_indexing",
                 description="Disable Windows Search indexing",
                 function=self.disable_search_indexing,
                 level=OptimizationLevel.HARDCORE,
-                requires_admin=True
+                requires_admin=True,
+                resources=[service_resource("WSearch")] + registry_resources(SEARCH_INDEXING_STATE),
+                state=merge_state(SEARCH_INDEXING_STATE, service_state("WSearch", SERVICE_DISABLED))
             ),
             OptimizationTask(
                 name="optimize_network_settings",
                 description="Optimize network settings for performance",
                 function=self.optimize_network_settings,
                 level=OptimizationLevel.HARDCORE,
-                requires_admin=True
+                requires_admin=True,
+                resources=["netsh:tcp"] + registry_resources(NETWORK_THROTTLING_STATE),
+                state=NETWORK_THROTTLING_STATE,
+                probe=self.probe_network_settings
+            ),
+            OptimizationTask(
+                name="clear_event_logs",
+                description="Clear all Windows event logs",
+                function=self.clear_event_logs,
+                level=OptimizationLevel.HARDCORE,
+                requires_admin=True,
+                resources=["eventlog"]
             )
         ]
     
     def disable_superfetch(self) -> None:
         """Disable Superfetch service"""
-        try:
-            # Stop and disable Superfetch service
-            os.system('net stop "SysMain"')
-            os.system('sc config "SysMain" start= disabled')
-            
-            # Disable Superfetch in registry
-            with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SYSTEM\CurrentControlSet\Control\Session Manager\Memory Management\PrefetchParameters") as key:
-                winreg.SetValueEx(key, "EnableSuperfetch", 0, winreg.REG_DWORD, 0)
-                winreg.SetValueEx(key, "EnablePrefetcher", 0, winreg.REG_DWORD, 0)
-        except WindowsError:
-            pass
+        # Stop and disable Superfetch service
+        self.commands.run([
+            Command(['net', 'stop', 'SysMain'], timeout=30, check=False),
+            Command(['sc', 'config', 'SysMain', 'start=', 'disabled'], timeout=30)
+        ], ordered=True)
+        
+        # Disable Superfetch in registry
+        self.registry.set_state(PREFETCH_STATE)
     
     def disable_search_indexing(self) -> None:
         """Disable Windows Search indexing"""
-        try:
-            # Stop and disable Windows Search service
-            os.system('net stop "WSearch"')
-            os.system('sc config "WSearch" start= disabled')
-            
-            # Disable indexing in registry
-            with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SOFTWARE\Policies\Microsoft\Windows\Windows Search") as key:
-                winreg.SetValueEx(key, "DisableBackoff", 0, winreg.REG_DWORD, 1)
-                winreg.SetValueEx(key, "DisableRemovableDriveIndexing", 0, winreg.REG_DWORD, 1)
-                winreg.SetValueEx(key, "PreventIndexingLowDiskSpaceMB", 0, winreg.REG_DWORD, 1)
-        except WindowsError:
-            pass
+        # Stop and disable Windows Search service
+        self.commands.run([
+            Command(['net', 'stop', 'WSearch'], timeout=30, check=False),
+            Command(['sc', 'config', 'WSearch', 'start=', 'disabled'], timeout=30)
+        ], ordered=True)
+        
+        # Disable indexing in registry
+        self.registry.set_state(SEARCH_INDEXING_STATE)
     
     def optimize_network_settings(self) -> None:
         """Optimize network settings for performance"""
-        try:
-            # Optimize TCP settings
-            os.system('netsh int tcp set global autotuninglevel=restricted')
-            os.system('netsh int tcp set global chimney=auto')
-            os.system('netsh int tcp set global dca=enabled')
-            os.system('netsh int tcp set global netdma=enabled')
-            os.system('netsh int tcp set global rss=enabled')
-            
-            # Disable network throttling
-            with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Multimedia\SystemProfile") as key:
-                winreg.SetValueEx(key, "NetworkThrottlingIndex", 0, winreg.REG_DWORD, 0xFFFFFFFF)
-        except Exception:
-            pass
+        # Optimize TCP settings. chimney, dca and netdma were removed in
+        # newer Windows builds, so their failure is not fatal.
+        self.commands.run([
+            Command(['netsh', 'int', 'tcp', 'set', 'global', 'autotuninglevel=restricted']),
+            Command(['netsh', 'int', 'tcp', 'set', 'global', 'chimney=auto'], check=False),
+            Command(['netsh', 'int', 'tcp', 'set', 'global', 'dca=enabled'], check=False),
+            Command(['netsh', 'int', 'tcp', 'set', 'global', 'netdma=enabled'], check=False),
+            Command(['netsh', 'int', 'tcp', 'set', 'global', 'rss=enabled'])
+        ])
+        
+        # Disable network throttling
+        self.registry.set_state(NETWORK_THROTTLING_STATE)
+    
+    def probe_network_settings(self) -> Optional[bool]:
+        """Check the current TCP global settings; None if they cannot be read"""
+        result = self.commands.run_one('netsh', 'int', 'tcp', 'show', 'global',
+                                       timeout=10, check=False)
+        if not result.ok:
+            return None
+        
+        settings = {}
+        for line in result.stdout.splitlines():
+            name, sep, value = line.partition(':')
+            if sep:
+                settings[name.strip().lower()] = value.strip().lower()
+        
+        # Localized output won't contain the English setting names
+        if not all(name in settings for name in TCP_GLOBAL_SETTINGS):
+            return None
+        return all(settings[name] == value for name, value in TCP_GLOBAL_SETTINGS.items())
+    
+    def clear_event_logs(self) -> None:
+        """Clear all Windows event logs"""
+        logs = self.commands.run_one('wevtutil', 'el').stdout.splitlines()
+        # Independent per log, so they run concurrently up to the runner's
+        # limit; some logs (analytic, debug) cannot be cleared and are skipped
+        results = self.commands.run([
+            Command(['wevtutil', 'cl', log.strip()], check=False)
+            for log in logs if log.strip()
+        ])
+        failed = [result for result in results if not result.ok]
+        if failed:
+            self.logger.info(f"{len(failed)} of {len(results)} event log(s) could not be cleared")
@@ -2,10 +2,59 @@
 Optional optimization tasks that are generally safe but may affect some applications
 """
 import os
-import winreg
-from typing import Optional
+import sys
+from typing import Iterator, List, Optional
 
-from . import BaseOptimizer, OptimizationLevel, OptimizationTask
+from ..commands import Command
+from ..duplicates import DuplicateAction, DuplicateFinder
+from ..registry import REG_DWORD
+from ..scanner import Candidate
+from . import BaseOptimizer, CleanupTarget, OptimizationLevel, OptimizationTask
+from ..scheduler import path_resource, registry_resources
+from ..state import (
+    HIGH_PERFORMANCE_SCHEME, SUBGROUP_VIDEO, VIDEO_IDLE_TIMEOUT,
+    active_power_scheme_state, merge_state, power_setting_state
+)
+
+GAME_BAR_STATE = {
+    r"HKCU\SOFTWARE\Microsoft\Windows\CurrentVersion\GameDVR": {
+        "AppCaptureEnabled": (REG_DWORD, 0),
+        "GameDVR_Enabled": (REG_DWORD, 0)
+    }
+}
+
+TELEMETRY_STATE = {
+    r"HKLM\SOFTWARE\Policies\Microsoft\Windows\DataCollection": {
+        "AllowTelemetry": (REG_DWORD, 0)
+    }
+}
+
+BACKGROUND_APPS_STATE = {
+    r"HKCU\Software\Microsoft\Windows\CurrentVersion\BackgroundAccessApplications": {
+        "GlobalUserDisabled": (REG_DWORD, 1)
+    }
+}
+
+# SHEmptyRecycleBinW flags: no confirmation dialog, progress UI or sound
+SHERB_NOCONFIRMATION = 0x1
+SHERB_NOPROGRESSUI = 0x2
+SHERB_NOSOUND = 0x4
+
+# Returned by SHEmptyRecycleBinW when the Recycle Bin is already empty
+E_UNEXPECTED = -2147418113
+
+# Searched for duplicate copies rather than swept
+DOWNLOAD_DIRS = CleanupTarget(
+    name="dedupe_downloads",
+    description="Find duplicate files in Downloads folders",
+    level=OptimizationLevel.OPTIONAL,
+    paths=[r"%USERPROFILE%\Downloads", r"%PUBLIC%\Downloads"]
+)
+
+VISUAL_EFFECTS_STATE = merge_state(
+    active_power_scheme_state(HIGH_PERFORMANCE_SCHEME),
+    power_setting_state(HIGH_PERFORMANCE_SCHEME, SUBGROUP_VIDEO, VIDEO_IDLE_TIMEOUT, ac=0, dc=0)
+)
 
 class OptionalOptimizer(BaseOptimizer):
     """Optional optimizations that are generally safe but may affect some applications"""
@@ -18,49 +67,156 @@ class OptionalOptimizer(BaseOptimizer):
                 description="Disable Xbox Game Bar",
                 function=self.disable_game_bar,
                 level=OptimizationLevel.OPTIONAL,
-                requires_admin=True
+                requires_admin=True,
+                resources=registry_resources(GAME_BAR_STATE),
+                state=GAME_BAR_STATE
             ),
             OptimizationTask(
                 name="disable_telemetry",
                 description="Disable telemetry and data collection",
                 function=self.disable_telemetry,
                 level=OptimizationLevel.OPTIONAL,
-                requires_admin=True
+                requires_admin=True,
+                resources=registry_resources(TELEMETRY_STATE),
+                state=TELEMETRY_STATE
+            ),
+            OptimizationTask(
+                name="disable_background_apps",
+                description="Stop Store apps from running in the background",
+                function=self.disable_background_apps,
+                level=OptimizationLevel.OPTIONAL,
+                resources=registry_resources(BACKGROUND_APPS_STATE),
+                state=BACKGROUND_APPS_STATE
+            ),
+            OptimizationTask(
+                name="empty_recycle_bin",
+                description="Empty the Recycle Bin on all drives",
+                function=self.empty_recycle_bin,
+                level=OptimizationLevel.OPTIONAL,
+                resources=["shell:recycle_bin"],
+                probe=self.probe_recycle_bin
+            ),
+            self.cleanup_task("clear_prefetch"),
+            self.cleanup_task("clear_browser_caches"),
+            OptimizationTask(
+                name=DOWNLOAD_DIRS.name,
+                description=DOWNLOAD_DIRS.description,
+                function=self.dedupe_downloads,
+                level=DOWNLOAD_DIRS.level,
+                resources=[path_resource(root) for root in DOWNLOAD_DIRS.roots()],
+                # Only reporting changes nothing, so there is nothing to preview
+                plan=self.plan_duplicates if self.duplicate_action is not None else None,
+                backup_files=self.duplicate_copies
             ),
             OptimizationTask(
                 name="optimize_visual_effects",
                 description="Optimize visual effects for better performance",
                 function=self.optimize_visual_effects,
                 level=OptimizationLevel.OPTIONAL,
-                requires_admin=True
+                requires_admin=True,
+                resources=["power:scheme"],
+                state=VISUAL_EFFECTS_STATE
             )
         ]
     
     def disable_game_bar(self) -> None:
         """Disable Xbox Game Bar"""
-        try:
-            with winreg.CreateKey(winreg.HKEY_CURRENT_USER, 
-                                r"SOFTWARE\Microsoft\Windows\CurrentVersion\GameDVR") as key:
-                winreg.SetValueEx(key, "AppCaptureEnabled", 0, winreg.REG_DWORD, 0)
-                winreg.SetValueEx(key, "GameDVR_Enabled", 0, winreg.REG_DWORD, 0)
-        except WindowsError:
-            pass
+        self.registry.set_state(GAME_BAR_STATE)
     
     def disable_telemetry(self) -> None:
         """Disable telemetry and data collection"""
-        try:
-            with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SOFTWARE\Policies\Microsoft\Windows\DataCollection") as key:
-                winreg.SetValueEx(key, "AllowTelemetry", 0, winreg.REG_DWORD, 0)
-        except WindowsError:
-            pass
+        self.registry.set_state(TELEMETRY_STATE)
+    
+    def disable_background_apps(self) -> None:
+        """Stop Store apps from running in the background"""
+        self.registry.set_state(BACKGROUND_APPS_STATE)
+    
+    def empty_recycle_bin(self) -> None:
+        """Empty the Recycle Bin on all drives"""
+        import ctypes
+        result = ctypes.windll.shell32.SHEmptyRecycleBinW(
+            None, None, SHERB_NOCONFIRMATION | SHERB_NOPROGRESSUI | SHERB_NOSOUND
+        )
+        if result not in (0, E_UNEXPECTED):
+            raise OSError(f"SHEmptyRecycleBinW failed with HRESULT {result & 0xFFFFFFFF:#010x}")
+    
+    def probe_recycle_bin(self) -> Optional[bool]:
+        """Whether the Recycle Bin is already empty, or None if it cannot be queried"""
+        if sys.platform != 'win32':
+            # No Recycle Bin to empty
+            return True
+        import ctypes
+        from ctypes import wintypes
+
+        class SHQUERYRBINFO(ctypes.Structure):
+            _fields_ = [
+                ('cbSize', wintypes.DWORD),
+                ('i64Size', ctypes.c_longlong),
+                ('i64NumItems', ctypes.c_longlong)
+            ]
+
+        info = SHQUERYRBINFO(cbSize=ctypes.sizeof(SHQUERYRBINFO))
+        if ctypes.windll.shell32.SHQueryRecycleBinW(None, ctypes.byref(info)) != 0:
+            return None
+        return info.i64NumItems == 0
+    
+    def dedupe_downloads(self) -> None:
+        """
+        Report duplicate downloads, linking or deleting copies if configured
+        
+        After a preview only the copies it listed are touched, and only if
+        they are still duplicates. Deleted copies go into quarantine when
+        one is configured.
+        """
+        finder = DuplicateFinder(throttle=self.throttle)
+        self.duplicates = finder.find(DOWNLOAD_DIRS.roots())
+        if self.duplicate_action is None:
+            return
+        manifest = self.take_manifest(DOWNLOAD_DIRS.name)
+        confirmed = None
+        if manifest is not None:
+            confirmed = {candidate.path for candidate in manifest}
+            manifest.close()
+        stats = finder.resolve(
+            self.duplicates, self.duplicate_action, only=confirmed, quarantine=self.quarantine
+        )
+        self.record_deleted(stats.files, stats.bytes)
+    
+    def plan_duplicates(self) -> Iterator[Candidate]:
+        """The duplicate downloads dedupe_downloads would replace or delete"""
+        report = DuplicateFinder(throttle=self.throttle).find(DOWNLOAD_DIRS.roots())
+        for group in report.groups:
+            for path in group.paths[1:]:
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                yield Candidate(path, group.size, False, mtime)
+    
+    def duplicate_copies(self) -> List[str]:
+        """
+        The copies dedupe_downloads would replace or delete, for the backup
+
+        They are identical to the copy kept, so the chunk store holds their
+        contents once. Copies moved into quarantine stay restorable there
+        and are not listed.
+        """
+        if self.duplicate_action is None:
+            return []
+        if self.duplicate_action is DuplicateAction.DELETE and self.quarantine is not None:
+            return []
+        manifest = self.manifests.get(DOWNLOAD_DIRS.name)
+        candidates = manifest if manifest is not None else self.plan_duplicates()
+        return [candidate.path for candidate in candidates]
     
     def optimize_visual_effects(self) -> None:
         """Optimize visual effects for better performance"""
-        try:
-            # Set visual effects to best performance
-            os.system('powercfg -setactive 8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c')
-            os.system('powercfg -change monitor-timeout-ac 0')
-            os.system('powercfg -change monitor-timeout-dc 0')
-        except Exception:
-            pass
+        # Set visual effects to best performance
+        self.commands.run([
+            Command(['powercfg', '-setactive', HIGH_PERFORMANCE_SCHEME])
+        ])
+        # Timeouts apply to the now-active scheme and are independent
+        self.commands.run([
+            Command(['powercfg', '-change', 'monitor-timeout-ac', '0']),
+            Command(['powercfg', '-change', 'monitor-timeout-dc', '0'])
+        ])
@@ -0,0 +1,122 @@
+"""
+Per-task profiling for Ruddibaba Optimizer
+
+TaskProfiler attaches to an optimizer through its pre/post task hooks,
+runs each task under cProfile and tracemalloc, writes a pstats file per
+task and builds a summary of the hottest functions and allocation sites.
+"""
+import os
+import io
+import re
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+@dataclass
+class TaskProfile:
+    """Profiling summary for one task"""
+    name: str
+    stats_file: str
+    hot_functions: List[Tuple[str, int, float, float]] = field(default_factory=list)
+    allocations: List[Tuple[str, int, int]] = field(default_factory=list)
+    peak_memory: int = 0
+
+class TaskProfiler:
+    """
+    Profiles every task an optimizer runs.
+
+    cProfile only sees the thread it is enabled on, which is the worker
+    thread running the task. Deletions and commands only show up when
+    they run on that thread too, i.e. with deletion_workers=1 and a
+    single-host HostedCommandRunner. tracemalloc is process-wide, so
+    allocation figures are only attributable to one task when tasks run
+    one at a time (max_workers=1).
+    """
+
+    def __init__(self, output_dir: str, top_n: int = 15):
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.profiles: Dict[str, TaskProfile] = {}
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def attach(self, optimizer) -> None:
+        """Start profiling the tasks run by an optimizer"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        optimizer.add_hook('pre_task', self._before)
+        optimizer.add_hook('post_task', self._after)
+
+    def detach(self, optimizer) -> None:
+        """Stop profiling and write the summary"""
+        optimizer.remove_hook('pre_task', self._before)
+        optimizer.remove_hook('post_task', self._after)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.write_summary()
+
+    def _before(self, optimizer, task) -> None:
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        self._local.snapshot = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        self._local.profile = profile
+        profile.enable()
+
+    def _after(self, optimizer, task, result) -> None:
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+
+        stats_file = os.path.join(self.output_dir, f"{_safe_name(task.name)}.pstats")
+        profile.dump_stats(stats_file)
+
+        summary = TaskProfile(task.name, stats_file, peak_memory=peak)
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        for (filename, line, function), (_, calls, total, cumulative, _) in ranked[:self.top_n]:
+            summary.hot_functions.append(
+                (f"{function} ({os.path.basename(filename)}:{line})", calls, total, cumulative)
+            )
+
+        differences = after.compare_to(self._local.snapshot, 'lineno')
+        for difference in differences[:self.top_n]:
+            frame = difference.traceback[0]
+            summary.allocations.append(
+                (f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                 difference.size_diff, difference.count_diff)
+            )
+
+        self.profiles[task.name] = summary
+        self._local.profile = None
+        self._local.snapshot = None
+
+    def write_summary(self) -> str:
+        """Write a plain-text top-N report for all profiled tasks"""
+        path = os.path.join(self.output_dir, 'summary.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for summary in self.profiles.values():
+                f.write(f"== {summary.name} ==\n")
+                f.write(f"pstats: {summary.stats_file}\n")
+                f.write(f"peak traced memory: {summary.peak_memory} bytes\n")
+                f.write("hot functions (calls, tottime, cumtime):\n")
+                for function, calls, total, cumulative in summary.hot_functions:
+                    f.write(f"  {cumulative:9.4f}s {total:9.4f}s {calls:8d}  {function}\n")
+                f.write("allocations (size diff, count diff):\n")
+                for location, size, count in summary.allocations:
+                    f.write(f"  {size:+12d} B {count:+8d}  {location}\n")
+                f.write("\n")
+        return path
+
+def _safe_name(name: str) -> str:
+    """Make a task name usable as a file name"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
@@ -0,0 +1,302 @@
+"""
+Quarantine store for cleanup targets in Ruddibaba Optimizer
+
+Instead of deleting a directory's contents, a cleanup can move them into a
+quarantine directory on the same volume. A rename does not touch file
+data, so it finishes almost immediately however large the tree is. The
+items stay restorable until a background purger deletes them, once they
+exceed the configured age or the store exceeds its size limit.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from .cleanup import DeletionEngine
+from .scanner import TreeScanner
+from .throttle import enter_background_mode
+
+DEFAULT_MAX_AGE = 3 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Name of the quarantine directory created at the root of other volumes
+VOLUME_QUARANTINE_DIR = '.RuddibabaQuarantine'
+
+def default_quarantine_dir() -> str:
+    """Location of the quarantine store under the application data directory"""
+    return os.path.join(
+        os.environ.get('LOCALAPPDATA', ''),
+        'RuddibabaOptimizer',
+        'quarantine'
+    )
+
+@dataclass
+class QuarantineItem:
+    """Contents of one directory moved into quarantine"""
+    id: str
+    original_path: str
+    location: str
+    created: float
+    entries: int
+    size: Optional[int] = None
+
+class QuarantineStore:
+    """Moves cleanup targets aside and purges them later"""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_age: float = DEFAULT_MAX_AGE,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        """
+        Initialize the store
+
+        Args:
+            root: Store directory holding the index (default: under %LOCALAPPDATA%)
+            max_age: Seconds an item stays restorable
+            max_bytes: Total size of quarantined items before the oldest are purged
+        """
+        self.root = root or default_quarantine_dir()
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.root, 'index.json')
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def quarantine(self, path: str) -> Optional[QuarantineItem]:
+        """
+        Move everything inside a directory into quarantine
+
+        The directory itself stays in place, with its permissions. Entries
+        that cannot be moved (typically files in use) are left where they
+        are.
+
+        Args:
+            path: Directory to empty
+
+        Returns:
+            The new item, or None if nothing was moved
+        """
+        path = os.path.realpath(path)
+        try:
+            names = os.listdir(path)
+        except OSError as e:
+            self.logger.debug(f"Nothing to quarantine in {path}: {str(e)}")
+            return None
+        return self.quarantine_entries(path, names)
+
+    def quarantine_entries(self, path: str, names: List[str]) -> Optional[QuarantineItem]:
+        """
+        Move some entries of a directory into quarantine, as one item
+
+        Args:
+            path: Directory holding the entries
+            names: Names of the entries within path
+
+        Returns:
+            The new item, or None if nothing was moved
+        """
+        path = os.path.realpath(path)
+        if not names:
+            return None
+
+        item_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        location = os.path.join(self._volume_root(path), item_id)
+        os.makedirs(location)
+
+        moved = 0
+        for name in names:
+            try:
+                os.rename(os.path.join(path, name), os.path.join(location, name))
+                moved += 1
+            except OSError as e:
+                self.logger.debug(f"Could not quarantine {os.path.join(path, name)}: {str(e)}")
+        if not moved:
+            os.rmdir(location)
+            return None
+
+        item = QuarantineItem(item_id, path, location, time.time(), moved)
+        with self._lock:
+            items = self._load()
+            items[item_id] = item
+            self._save(items)
+        self.logger.info(f"Quarantined {moved} item(s) from {path} as {item_id}")
+        return item
+
+    def list(self) -> List[QuarantineItem]:
+        """Quarantined items, oldest first"""
+        with self._lock:
+            return sorted(self._load().values(), key=lambda item: item.created)
+
+    def restore(self, item_id: str) -> bool:
+        """
+        Move a quarantined item back to where it came from
+
+        Entries whose original name has been reused since are left in
+        quarantine, and the item is kept so nothing is lost.
+
+        Returns:
+            True if every entry was restored
+        """
+        with self._lock:
+            items = self._load()
+            item = items.get(item_id)
+            if item is None:
+                self.logger.error(f"No quarantined item {item_id}")
+                return False
+
+            os.makedirs(item.original_path, exist_ok=True)
+            conflicts = 0
+            for name in os.listdir(item.location):
+                target = os.path.join(item.original_path, name)
+                if os.path.lexists(target):
+                    conflicts += 1
+                    continue
+                os.rename(os.path.join(item.location, name), target)
+
+            if conflicts:
+                self.logger.warning(
+                    f"{conflicts} entry(ies) of {item_id} already exist in "
+                    f"{item.original_path} and were left in quarantine"
+                )
+                return False
+            os.rmdir(item.location)
+            del items[item_id]
+            self._save(items)
+        self.logger.info(f"Restored {item_id} to {item.original_path}")
+        return True
+
+    def purge(self, item_id: str, engine: Optional[DeletionEngine] = None) -> int:
+        """
+        Permanently delete a quarantined item
+
+        Returns:
+            Bytes freed
+        """
+        with self._lock:
+            item = self._load().get(item_id)
+        if item is None:
+            return 0
+        stats = (engine or DeletionEngine()).clear([item.location], remove_roots=True)
+        with self._lock:
+            items = self._load()
+            if os.path.exists(item.location):
+                # Partly purged; whatever is left stays restorable
+                self.logger.warning(f"Could not fully purge {item_id}")
+                if item_id in items:
+                    items[item_id].size = None
+            else:
+                items.pop(item_id, None)
+            self._save(items)
+        self.logger.info(f"Purged {item_id}: {stats.bytes} byte(s) freed")
+        return stats.bytes
+
+    def expired(self) -> List[QuarantineItem]:
+        """
+        Items over the age limit, then the oldest items while over the size limit
+
+        Measures any item whose size is not yet known, which walks its tree.
+        """
+        now = time.time()
+        items = self.list()
+        for item in items:
+            if item.size is None:
+                item.size = self._measure(item.location)
+        with self._lock:
+            stored = self._load()
+            for item in items:
+                if item.id in stored:
+                    stored[item.id].size = item.size
+            self._save(stored)
+
+        due = [item for item in items if now - item.created > self.max_age]
+        total = sum(item.size for item in items if item not in due)
+        for item in items:
+            if total <= self.max_bytes:
+                break
+            if item not in due:
+                due.append(item)
+                total -= item.size
+        return due
+
+    def _measure(self, path: str) -> int:
+        return sum(
+            candidate.size for candidate in TreeScanner().walk([path])
+            if not candidate.is_dir
+        )
+
+    def _volume_root(self, path: str) -> str:
+        """A quarantine directory on the same volume as path"""
+        try:
+            same_volume = os.stat(self.root).st_dev == os.stat(path).st_dev
+        except OSError:
+            same_volume = False
+        if same_volume:
+            return self.root
+        mount = path
+        while not os.path.ismount(mount):
+            parent = os.path.dirname(mount)
+            if parent == mount:
+                break
+            mount = parent
+        volume_root = os.path.join(mount, VOLUME_QUARANTINE_DIR)
+        os.makedirs(volume_root, exist_ok=True)
+        return volume_root
+
+    def _load(self) -> Dict[str, QuarantineItem]:
+        try:
+            with open(self.index_path, 'r') as f:
+                return {
+                    entry['id']: QuarantineItem(**entry)
+                    for entry in json.load(f)
+                }
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            self.logger.warning(f"Ignoring unreadable quarantine index: {str(e)}")
+            return {}
+
+    def _save(self, items: Dict[str, QuarantineItem]) -> None:
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump([asdict(item) for item in items.values()], f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+class QuarantinePurger(threading.Thread):
+    """
+    Background thread that purges expired quarantine items
+
+    The thread enters background mode, which on Windows lowers both its
+    CPU and its I/O priority so purging does not compete with foreground
+    work. With the default single worker every file is deleted on this
+    thread, so all of the purge runs at that priority.
+    """
+
+    def __init__(self, store: QuarantineStore, max_workers: int = 1):
+        super().__init__(name="quarantine-purger", daemon=True)
+        self.store = store
+        self.max_workers = max_workers
+        self.freed = 0
+        self.logger = logging.getLogger(__name__)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        enter_background_mode(thread=True)
+        try:
+            engine = DeletionEngine(max_workers=self.max_workers)
+            for item in self.store.expired():
+                if self._stop_event.is_set():
+                    break
+                self.freed += self.store.purge(item.id, engine)
+        except Exception as e:
+            self.logger.error(f"Quarantine purge failed: {str(e)}")
+
+    def stop(self) -> None:
+        """Stop after the item being purged; the rest waits for the next run"""
+        self._stop_event.set()
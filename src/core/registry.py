@@ -0,0 +1,346 @@
+"""
+Registry access for Ruddibaba Optimizer
+
+Writes are staged in a RegistryTransaction and applied in one pass per key,
+skipping values that already hold the target data. Storage is delegated to
+a RegistryBackend so the same code path runs against the Windows registry
+or an in-memory registry.
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import winreg
+except ImportError:  # pragma: no cover - non-Windows platforms
+    winreg = None
+
+# Value types, numerically identical to the winreg constants
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+HIVES = ('HKCU', 'HKLM', 'HKCR', 'HKU')
+
+# Full hive names, accepted wherever a short one is
+HIVE_ALIASES = {
+    'HKEY_CURRENT_USER': 'HKCU',
+    'HKEY_LOCAL_MACHINE': 'HKLM',
+    'HKEY_CLASSES_ROOT': 'HKCR',
+    'HKEY_USERS': 'HKU',
+}
+
+RegistryValue = Tuple[int, Any]
+
+def split_key_path(key_path: str) -> Tuple[str, str]:
+    """Split 'HKLM\\SOFTWARE\\...' into the short hive name and sub key"""
+    hive, _, sub_key = key_path.partition('\\')
+    hive = hive.upper()
+    hive = HIVE_ALIASES.get(hive, hive)
+    if hive not in HIVES:
+        raise ValueError(f"Unsupported registry hive in {key_path}")
+    return hive, sub_key
+
+def normalize_key_path(key_path: str) -> str:
+    """
+    The form of a key path that is equal for every spelling of the same key
+
+    Hive names are shortened and the sub key is case-folded, since the
+    registry ignores case, with stray backslashes removed.
+    """
+    hive, sub_key = split_key_path(key_path)
+    sub_key = sub_key.strip('\\').casefold()
+    return f"{hive}\\{sub_key}"
+
+class RegistryKey(ABC):
+    """An open registry key"""
+
+    @abstractmethod
+    def read(self, name: str) -> Optional[RegistryValue]:
+        """Read a value, or None if it does not exist"""
+
+    @abstractmethod
+    def write(self, name: str, value_type: int, data: Any) -> None:
+        """Write a value"""
+
+    def read_many(self, names: Iterable[str]) -> Dict[str, RegistryValue]:
+        """Read several values; missing values are omitted"""
+        values = {}
+        for name in names:
+            value = self.read(name)
+            if value is not None:
+                values[name] = value
+        return values
+
+    def close(self) -> None:
+        """Release the key"""
+
+    def __enter__(self) -> "RegistryKey":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class RegistryBackend(ABC):
+    """Storage behind RegistryTransaction"""
+
+    @abstractmethod
+    def open_key(
+        self,
+        key_path: str,
+        create: bool = False,
+        write: bool = False
+    ) -> Optional[RegistryKey]:
+        """
+        Open a key for reading, and for writing if asked to
+
+        Args:
+            key_path: Full key path including the hive, e.g. 'HKLM\\SOFTWARE\\...'
+            create: Create the key if it does not exist; implies write
+            write: Open the key for writing too, which needs elevation for
+                most of HKLM
+
+        Returns:
+            The open key, or None if it does not exist and create is False
+        """
+
+    def read_values(self, key_path: str, names: Iterable[str]) -> Dict[str, RegistryValue]:
+        """Read several values from one key with a single open"""
+        key = self.open_key(key_path)
+        if key is None:
+            return {}
+        with key:
+            return key.read_many(names)
+
+class WinRegistryBackend(RegistryBackend):
+    """Backend for the live Windows registry"""
+
+    def __init__(self):
+        if winreg is None:
+            raise OSError("The Windows registry is not available on this platform")
+        self._hives = {
+            'HKCU': winreg.HKEY_CURRENT_USER,
+            'HKLM': winreg.HKEY_LOCAL_MACHINE,
+            'HKCR': winreg.HKEY_CLASSES_ROOT,
+            'HKU': winreg.HKEY_USERS,
+        }
+
+    def open_key(
+        self,
+        key_path: str,
+        create: bool = False,
+        write: bool = False
+    ) -> Optional[RegistryKey]:
+        hive, sub_key = split_key_path(key_path)
+        access = winreg.KEY_READ
+        if write or create:
+            access |= winreg.KEY_WRITE
+        try:
+            if create:
+                handle = winreg.CreateKeyEx(self._hives[hive], sub_key, 0, access)
+            else:
+                handle = winreg.OpenKey(self._hives[hive], sub_key, 0, access)
+        except FileNotFoundError:
+            return None
+        return _WinRegistryKey(handle)
+
+class _WinRegistryKey(RegistryKey):
+    def __init__(self, handle):
+        self._handle = handle
+
+    def read(self, name: str) -> Optional[RegistryValue]:
+        try:
+            data, value_type = winreg.QueryValueEx(self._handle, name)
+        except FileNotFoundError:
+            return None
+        return value_type, data
+
+    def write(self, name: str, value_type: int, data: Any) -> None:
+        winreg.SetValueEx(self._handle, name, 0, value_type, data)
+
+    def close(self) -> None:
+        self._handle.Close()
+
+class MemoryRegistryBackend(RegistryBackend):
+    """
+    In-memory registry, for tests, benchmarks and non-Windows platforms.
+
+    Key paths are case-insensitive like the real registry. ``opens`` and
+    ``writes`` count backend operations so callers can verify batching.
+    """
+
+    def __init__(self, data: Optional[Dict[str, Dict[str, RegistryValue]]] = None):
+        self.keys: Dict[str, Dict[str, RegistryValue]] = {}
+        self.opens = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        for key_path, values in (data or {}).items():
+            self.keys[normalize_key_path(key_path)] = dict(values)
+
+    def open_key(
+        self,
+        key_path: str,
+        create: bool = False,
+        write: bool = False
+    ) -> Optional[RegistryKey]:
+        path = normalize_key_path(key_path)
+        with self._lock:
+            self.opens += 1
+            values = self.keys.get(path)
+            if values is None:
+                if not create:
+                    return None
+                values = self.keys[path] = {}
+        return _MemoryRegistryKey(self, values)
+
+class _MemoryRegistryKey(RegistryKey):
+    def __init__(self, backend: MemoryRegistryBackend, values: Dict[str, RegistryValue]):
+        self._backend = backend
+        self._values = values
+
+    def read(self, name: str) -> Optional[RegistryValue]:
+        return self._values.get(name)
+
+    def write(self, name: str, value_type: int, data: Any) -> None:
+        self._values[name] = (value_type, data)
+        self._backend.writes += 1
+
+def default_registry_backend() -> RegistryBackend:
+    """The Windows registry where available, otherwise an empty in-memory registry"""
+    if winreg is not None:
+        return WinRegistryBackend()
+    logging.getLogger(__name__).debug(
+        "Windows registry not available; using an in-memory registry"
+    )
+    return MemoryRegistryBackend()
+
+def values_equal(current: Optional[RegistryValue], value_type: int, data: Any) -> bool:
+    """Compare a stored value with a target, treating lists and tuples alike"""
+    if current is None or current[0] != value_type:
+        return False
+    current_data = current[1]
+    if isinstance(current_data, (list, tuple)) and isinstance(data, (list, tuple)):
+        return list(current_data) == list(data)
+    return current_data == data
+
+@dataclass
+class RegistryCommitResult:
+    """Outcome of RegistryTransaction.commit"""
+    written: int = 0
+    skipped: int = 0
+    failed: int = 0
+    failed_keys: Dict[str, str] = field(default_factory=dict)
+    owners: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def _count(self, owner: Optional[str], outcome: str) -> None:
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if owner is not None:
+            counts = self.owners.setdefault(owner, {'written': 0, 'skipped': 0, 'failed': 0})
+            counts[outcome] += 1
+
+class RegistryTransaction:
+    """
+    Collects registry writes and applies them in one pass.
+
+    Writes may be staged from several threads. On commit every key is
+    opened once, its current values are read together, and only values
+    that differ from the target are written. Each staged write is
+    attributed to the owner active on the staging thread (see ``owner``)
+    so failures can be traced back to the task that requested them.
+    Writes to different spellings of one key path are staged together, in
+    the order they were made.
+    """
+
+    def __init__(self, backend: RegistryBackend):
+        self.backend = backend
+        self.logger = logging.getLogger(__name__)
+        self._writes: Dict[str, Dict[str, Tuple[int, Any, Optional[str]]]] = {}
+        # Key path as first staged, by normalized path
+        self._paths: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def owner(self, name: str) -> Iterator[None]:
+        """Attribute writes staged on this thread to the given owner"""
+        previous = getattr(self._local, 'owner', None)
+        self._local.owner = name
+        try:
+            yield
+        finally:
+            self._local.owner = previous
+
+    def set(self, key_path: str, name: str, value_type: int, data: Any) -> None:
+        """Stage a value write; the last write to a value wins"""
+        normalized = normalize_key_path(key_path)
+        owner = getattr(self._local, 'owner', None)
+        with self._lock:
+            self._paths.setdefault(normalized, key_path)
+            self._writes.setdefault(normalized, {})[name] = (value_type, data, owner)
+
+    def set_values(self, key_path: str, values: Dict[str, RegistryValue]) -> None:
+        """Stage several writes to one key"""
+        for name, (value_type, data) in values.items():
+            self.set(key_path, name, value_type, data)
+
+    def set_state(self, state: Dict[str, Dict[str, RegistryValue]]) -> None:
+        """Stage every value in a key path -> values mapping"""
+        for key_path, values in state.items():
+            self.set_values(key_path, values)
+
+    @property
+    def pending(self) -> int:
+        """Number of staged value writes"""
+        with self._lock:
+            return sum(len(values) for values in self._writes.values())
+
+    def commit(self) -> RegistryCommitResult:
+        """
+        Apply all staged writes
+
+        Returns:
+            Counts of values written and skipped, plus any keys that failed
+        """
+        with self._lock:
+            writes, self._writes = self._writes, {}
+            paths, self._paths = self._paths, {}
+
+        result = RegistryCommitResult()
+        for normalized, values in writes.items():
+            key_path = paths[normalized]
+            done = set()
+            try:
+                with self.backend.open_key(key_path, create=True, write=True) as key:
+                    current = key.read_many(values)
+                    for name, (value_type, data, owner) in values.items():
+                        if values_equal(current.get(name), value_type, data):
+                            result._count(owner, 'skipped')
+                        else:
+                            key.write(name, value_type, data)
+                            result._count(owner, 'written')
+                        done.add(name)
+            except Exception as e:
+                self.logger.error(f"Failed to write registry key {key_path}: {str(e)}")
+                result.failed_keys[key_path] = str(e)
+                # Values handled before the failure have already been counted
+                for name, (_, _, owner) in values.items():
+                    if name not in done:
+                        result._count(owner, 'failed')
+
+        if result.written or result.skipped:
+            self.logger.info(
+                f"Registry: {result.written} value(s) changed, {result.skipped} already set"
+            )
+        return result
+
+    def rollback(self) -> None:
+        """Discard all staged writes"""
+        with self._lock:
+            self._writes = {}
+            self._paths = {}
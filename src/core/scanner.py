@@ -0,0 +1,197 @@
+"""
+Bounded-memory directory scanning for Ruddibaba Optimizer
+
+TreeScanner walks directory trees iteratively with os.scandir and streams
+what it finds, so memory use does not grow with the number of entries:
+at most ``max_open_dirs`` directory listings are open at once and nothing
+is collected per directory. Entries are yielded in post-order, with every
+directory after its contents, which is the order they can be deleted in.
+"""
+import os
+import stat
+import logging
+from dataclasses import dataclass
+from typing import AbstractSet, Iterable, Iterator, List, Optional
+
+DEFAULT_MAX_OPEN_DIRS = 64
+DEFAULT_BATCH_SIZE = 256
+
+@dataclass
+class Candidate:
+    """A file or directory found by a scan"""
+    path: str
+    size: int = 0
+    is_dir: bool = False
+    mtime: float = 0.0
+    atime: float = 0.0
+
+class _Frame:
+    """A directory on the walk stack"""
+    __slots__ = ('path', 'entries', 'subdirectories')
+
+    def __init__(self, path: str, entries):
+        self.path = path
+        self.entries = entries
+        # Only filled in when the listing had to be closed early
+        self.subdirectories: List[str] = []
+
+class TreeScanner:
+    """
+    Iterative, streaming directory walker
+
+    Memory is bounded by ``max_open_dirs`` open listings. A tree deeper
+    than that does not fail: the shallowest open listing is read to the
+    end and closed, keeping only the names of its remaining
+    subdirectories, so the ceiling then also includes those names.
+    Links and junctions are reported as files and never followed.
+    """
+
+    def __init__(
+        self,
+        max_open_dirs: int = DEFAULT_MAX_OPEN_DIRS,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ):
+        """
+        Initialize the scanner
+
+        Args:
+            max_open_dirs: Directory listings held open at once
+            batch_size: Entries per list yielded by walk_batches
+        """
+        self.max_open_dirs = max(1, max_open_dirs)
+        self.batch_size = max(1, batch_size)
+        self.errors = 0
+        self.logger = logging.getLogger(__name__)
+
+    def walk(
+        self,
+        roots: Iterable[str],
+        exclude: Optional[AbstractSet[str]] = None
+    ) -> Iterator[Candidate]:
+        """
+        Stream every file, link and directory below the given roots
+
+        The roots themselves are not yielded. Unreadable entries are
+        skipped and counted in ``errors``.
+
+        Args:
+            roots: Directories to walk
+            exclude: Directory paths, as yielded by a previous walk, to
+                neither enter nor yield
+
+        Yields:
+            One Candidate per entry, directories after their contents
+        """
+        for root in roots:
+            yield from self._walk_root(root, exclude or frozenset())
+
+    def walk_batches(
+        self,
+        roots: Iterable[str],
+        exclude: Optional[AbstractSet[str]] = None
+    ) -> Iterator[List[Candidate]]:
+        """Like walk, in lists of up to batch_size entries"""
+        return batched(self.walk(roots, exclude), self.batch_size)
+
+    def _walk_root(self, root: str, exclude: AbstractSet[str]) -> Iterator[Candidate]:
+        first = self._open(root)
+        if first is None:
+            return
+        stack = [first]
+        open_listings = 1
+        try:
+            while stack:
+                frame = stack[-1]
+                subdirectory: Optional[str] = None
+
+                if frame.entries is not None:
+                    for entry in frame.entries:
+                        candidate = self._classify(entry)
+                        if candidate is None:
+                            continue
+                        if candidate.is_dir:
+                            subdirectory = candidate.path
+                            break
+                        yield candidate
+                    else:
+                        frame.entries.close()
+                        frame.entries = None
+                        open_listings -= 1
+                if subdirectory is None and frame.subdirectories:
+                    subdirectory = frame.subdirectories.pop()
+
+                if subdirectory is None:
+                    stack.pop()
+                    if stack:
+                        yield Candidate(frame.path, is_dir=True)
+                    continue
+                if subdirectory in exclude:
+                    continue
+
+                if open_listings >= self.max_open_dirs:
+                    shallowest = next(f for f in stack if f.entries is not None)
+                    yield from self._drain(shallowest)
+                    open_listings -= 1
+                child = self._open(subdirectory)
+                if child is None:
+                    continue
+                stack.append(child)
+                open_listings += 1
+        finally:
+            # The consumer may stop early; release any open listings
+            for frame in stack:
+                if frame.entries is not None:
+                    frame.entries.close()
+
+    def _drain(self, frame: _Frame) -> Iterator[Candidate]:
+        """Read a listing to the end, yielding files and keeping subdirectory names"""
+        for entry in frame.entries:
+            candidate = self._classify(entry)
+            if candidate is None:
+                continue
+            if candidate.is_dir:
+                frame.subdirectories.append(candidate.path)
+            else:
+                yield candidate
+        frame.entries.close()
+        frame.entries = None
+
+    def _open(self, path: str) -> Optional[_Frame]:
+        try:
+            return _Frame(path, os.scandir(path))
+        except OSError as e:
+            self.logger.debug(f"Could not scan {path}: {str(e)}")
+            self.errors += 1
+            return None
+
+    def _classify(self, entry: os.DirEntry) -> Optional[Candidate]:
+        """Turn a directory entry into a Candidate using its cached type, size and times"""
+        try:
+            if entry.is_dir(follow_symlinks=False) and not is_link(entry):
+                return Candidate(entry.path, is_dir=True)
+            info = entry.stat(follow_symlinks=False)
+            return Candidate(entry.path, info.st_size, mtime=info.st_mtime, atime=info.st_atime)
+        except OSError as e:
+            self.logger.debug(f"Could not read {entry.path}: {str(e)}")
+            self.errors += 1
+            return None
+
+def batched(candidates: Iterable[Candidate], size: int) -> Iterator[List[Candidate]]:
+    """Group a stream of candidates into lists of up to size entries"""
+    batch: List[Candidate] = []
+    for candidate in candidates:
+        batch.append(candidate)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def is_link(entry: os.DirEntry) -> bool:
+    """Symlink or, on Windows, any other reparse point such as a junction"""
+    if entry.is_symlink():
+        return True
+    if os.name != 'nt':
+        return False
+    attributes = getattr(entry.stat(follow_symlinks=False), 'st_file_attributes', 0)
+    return bool(attributes & stat.FILE_ATTRIBUTE_REPARSE_POINT)
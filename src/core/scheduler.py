@@ -0,0 +1,147 @@
+"""
+Dependency-aware parallel task scheduler for Ruddibaba Optimizer
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from .registry import normalize_key_path
+
+def registry_resource(key_path: str) -> str:
+    """Resource name for a registry key (e.g. 'HKLM\\SOFTWARE\\Policies')"""
+    return f"registry:{normalize_key_path(key_path)}"
+
+def registry_resources(key_paths: Iterable[str]) -> List[str]:
+    """
+    Resource names for the keys a task writes, e.g. those of its state
+
+    Writes are staged and committed after every task has finished, so
+    only tasks writing the same key need to be kept apart.
+    """
+    return sorted({registry_resource(key_path) for key_path in key_paths})
+
+def service_resource(name: str) -> str:
+    """Resource name for a Windows service"""
+    return f"service:{name.lower()}"
+
+def path_resource(path: str) -> str:
+    """Resource name for a filesystem root"""
+    return f"fs:{os.path.normcase(os.path.abspath(path))}"
+
+class TaskScheduler:
+    """
+    Runs optimization tasks concurrently on a bounded thread pool.
+
+    A task is started once every task named in its ``depends_on`` has
+    finished successfully and none of its ``resources`` are held by a task
+    that is still running. Tasks whose dependencies failed are not run and
+    are reported as failed.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+        self.logger = logging.getLogger(__name__)
+
+    def run(
+        self,
+        tasks: Sequence,
+        runner: Callable[[object], bool],
+        on_complete: Optional[Callable[[object, bool], None]] = None
+    ) -> Dict[str, bool]:
+        """
+        Run tasks in dependency order, in parallel where possible
+
+        Args:
+            tasks: Tasks to run (anything with name, depends_on and resources)
+            runner: Callable that runs a single task and returns its success
+            on_complete: Optional callback invoked after each task finishes
+
+        Returns:
+            Dictionary mapping task names to success, in task order
+        """
+        by_name = {task.name: task for task in tasks}
+        deps = self._resolve_dependencies(tasks, by_name)
+
+        results: Dict[str, bool] = {}
+        pending: List = list(tasks)
+        held: Set[str] = set()
+        running = {}
+
+        def finish(task, success: bool) -> None:
+            results[task.name] = success
+            if on_complete:
+                on_complete(task, success)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for task in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+
+                    if any(results.get(dep) is False for dep in deps[task.name]):
+                        self.logger.warning(
+                            f"Skipping task {task.name}: a dependency failed"
+                        )
+                        pending.remove(task)
+                        finish(task, False)
+                        continue
+
+                    if not all(dep in results for dep in deps[task.name]):
+                        continue
+
+                    resources = set(task.resources)
+                    if resources & held:
+                        continue
+
+                    pending.remove(task)
+                    held.update(resources)
+                    running[pool.submit(runner, task)] = task
+
+                if not running:
+                    # Skipped tasks unblocked their dependents; go round again
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    held.difference_update(task.resources)
+                    try:
+                        success = bool(future.result())
+                    except Exception as e:
+                        self.logger.error(f"Error running task {task.name}: {str(e)}")
+                        success = False
+                    finish(task, success)
+
+        return {task.name: results[task.name] for task in tasks}
+
+    def _resolve_dependencies(self, tasks: Sequence, by_name: Dict) -> Dict[str, List[str]]:
+        """Drop dependencies outside the task set and reject cycles"""
+        deps: Dict[str, List[str]] = {}
+        for task in tasks:
+            deps[task.name] = []
+            for dep in task.depends_on:
+                if dep in by_name:
+                    deps[task.name].append(dep)
+                else:
+                    self.logger.debug(
+                        f"Task {task.name} depends on {dep}, which is not scheduled; ignoring"
+                    )
+
+        visiting: Set[str] = set()
+        visited: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle detected at task '{name}'")
+            visiting.add(name)
+            for dep in deps[name]:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for task in tasks:
+            visit(task.name)
+        return deps
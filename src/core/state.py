@@ -0,0 +1,110 @@
+"""
+Desired-state declarations and batched state probing for Ruddibaba Optimizer
+
+Tasks describe the registry-visible state they establish as a mapping of
+key path -> value name -> (type, data). Service start types and power
+settings are registry values too, so one batched registry read is enough
+to tell whether most tasks still need to run.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable
+
+from .registry import REG_DWORD, REG_SZ, RegistryBackend, RegistryValue, values_equal
+
+RegistryState = Dict[str, Dict[str, RegistryValue]]
+
+# Service start types as stored in the Start value
+SERVICE_AUTO = 2
+SERVICE_MANUAL = 3
+SERVICE_DISABLED = 4
+
+POWER_SCHEMES_KEY = r"HKLM\SYSTEM\CurrentControlSet\Control\Power\User\PowerSchemes"
+
+# Power scheme, subgroup and setting GUIDs used by the optimizers
+HIGH_PERFORMANCE_SCHEME = "8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c"
+SUBGROUP_DISK = "0012ee47-9041-4b5d-9b77-535fba8b1442"
+DISK_IDLE_TIMEOUT = "6738e2c4-e8a5-4a42-b16a-e040e769756e"
+SUBGROUP_USB = "2a737441-1930-4402-8d77-b2bebba308a3"
+USB_SELECTIVE_SUSPEND = "48e6b7a6-50f5-4782-a5d4-53bb8f07e226"
+SUBGROUP_VIDEO = "7516b95f-f776-4464-8c53-06167f40cc99"
+VIDEO_IDLE_TIMEOUT = "3c0bc021-c8a8-4e07-a973-6b14cbcb2b7e"
+
+def service_state(name: str, start_type: int) -> RegistryState:
+    """Desired start type of a Windows service"""
+    return {
+        rf"HKLM\SYSTEM\CurrentControlSet\Services\{name}": {"Start": (REG_DWORD, start_type)}
+    }
+
+def active_power_scheme_state(scheme: str) -> RegistryState:
+    """Desired active power scheme GUID"""
+    return {POWER_SCHEMES_KEY: {"ActivePowerScheme": (REG_SZ, scheme)}}
+
+def power_setting_state(
+    scheme: str,
+    subgroup: str,
+    setting: str,
+    ac: Any = None,
+    dc: Any = None
+) -> RegistryState:
+    """Desired AC and/or DC index of a power setting within a scheme"""
+    values = {}
+    if ac is not None:
+        values["ACSettingIndex"] = (REG_DWORD, ac)
+    if dc is not None:
+        values["DCSettingIndex"] = (REG_DWORD, dc)
+    return {rf"{POWER_SCHEMES_KEY}\{scheme}\{subgroup}\{setting}": values}
+
+def merge_state(*states: RegistryState) -> RegistryState:
+    """Combine several state mappings into one"""
+    merged: RegistryState = {}
+    for state in states:
+        for key_path, values in state.items():
+            merged.setdefault(key_path, {}).update(values)
+    return merged
+
+def read_state(
+    backend: RegistryBackend,
+    states: Iterable[RegistryState],
+    max_workers: int = 4
+) -> RegistryState:
+    """
+    Read the current values of everything named in the given states
+
+    Each key is opened once, however many states mention it, and keys are
+    read in parallel.
+
+    Args:
+        backend: Registry backend to read from
+        states: State mappings whose keys and value names should be read
+        max_workers: Number of keys read concurrently
+
+    Returns:
+        Current values, in the same shape; missing keys and values are
+        omitted, and so are keys that cannot be read, which are logged
+    """
+    wanted = merge_state(*states)
+    if not wanted:
+        return {}
+
+    def read(key_path: str):
+        try:
+            return key_path, backend.read_values(key_path, wanted[key_path])
+        except OSError as e:
+            # Not the same as a missing key: probes and backups are then incomplete
+            logging.getLogger(__name__).warning(
+                f"Could not read registry key {key_path}: {str(e)}"
+            )
+            return key_path, {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(wanted)))) as pool:
+        return {key_path: values for key_path, values in pool.map(read, wanted) if values}
+
+def state_matches(desired: RegistryState, current: RegistryState) -> bool:
+    """Whether every desired value is present in the current state"""
+    for key_path, values in desired.items():
+        existing = current.get(key_path, {})
+        for name, (value_type, data) in values.items():
+            if not values_equal(existing.get(name), value_type, data):
+                return False
+    return True
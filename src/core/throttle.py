@@ -0,0 +1,237 @@
+"""
+Low-impact background execution for Ruddibaba Optimizer
+
+In background mode the optimizer runs at background priority: on Windows,
+process background mode lowers its CPU, I/O and memory priority together.
+A Throttle then caps file operations and bytes per second with token
+buckets, and pauses while the system is busier than a threshold. The
+optimizer waits on it before every task, and the cleanup and duplicate
+engines wait on it before every file.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Callable, Optional, Tuple
+
+DEFAULT_OPS_PER_SECOND = 500
+DEFAULT_BYTES_PER_SECOND = 32 * 1024 * 1024
+
+# Fraction of total CPU capacity in use above which work pauses
+DEFAULT_MAX_LOAD = 0.75
+
+# Seconds a load reading is reused before the system is asked again
+LOAD_SAMPLE_INTERVAL = 1.0
+
+# Longest single pause while the system is busy
+MAX_BACKOFF = 8.0
+
+class TokenBucket:
+    """
+    Rate limit of ``rate`` units per second with bursts of up to ``burst``
+
+    A request larger than the burst is admitted once the bucket is full and
+    leaves it in debt, so a single large file is slowed down, not refused.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float = 1) -> float:
+        """
+        Wait until amount can be spent, then spend it
+
+        Returns:
+            Seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve now; whoever comes next waits behind this request
+            needed = min(amount, self.burst)
+            delay = max(0.0, (needed - self._tokens) / self.rate)
+            self._tokens -= amount
+        if delay:
+            time.sleep(delay)
+        return delay
+
+class SystemLoad:
+    """Share of total CPU capacity in use, between 0 and 1"""
+
+    def __init__(self):
+        self._previous: Optional[Tuple[int, int]] = None
+
+    def sample(self) -> Optional[float]:
+        """Current load, or None where it cannot be measured"""
+        if sys.platform == 'win32':
+            return self._sample_windows()
+        try:
+            return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+        except (AttributeError, OSError):
+            return None
+
+    def _sample_windows(self) -> Optional[float]:
+        """Busy share of CPU time since the previous sample"""
+        try:
+            import ctypes
+            idle, kernel, user = (ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong())
+            if not ctypes.windll.kernel32.GetSystemTimes(
+                ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)
+            ):
+                return None
+        except (ImportError, AttributeError, OSError):
+            return None
+        # Kernel time includes idle time
+        current = (idle.value, kernel.value + user.value)
+        previous, self._previous = self._previous, current
+        if previous is None or current[1] == previous[1]:
+            return None
+        return 1.0 - (current[0] - previous[0]) / (current[1] - previous[1])
+
+class Throttle:
+    """Operation, bandwidth and system-load limits shared by all workers"""
+
+    def __init__(
+        self,
+        ops_per_second: float = DEFAULT_OPS_PER_SECOND,
+        bytes_per_second: float = DEFAULT_BYTES_PER_SECOND,
+        max_load: float = DEFAULT_MAX_LOAD,
+        load: Optional[Callable[[], Optional[float]]] = None
+    ):
+        """
+        Initialize the throttle
+
+        Args:
+            ops_per_second: File operations allowed per second
+            bytes_per_second: Bytes read, written or deleted per second
+            max_load: System load above which work pauses; 1 or more never pauses
+            load: Load reading to use (default: SystemLoad().sample)
+        """
+        self.operations = TokenBucket(ops_per_second)
+        self.bandwidth = TokenBucket(bytes_per_second)
+        self.max_load = max_load
+        self.load = load or SystemLoad().sample
+        # Seconds callers spent waiting, for the log
+        self.waited = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._last_load: Optional[float] = None
+        self._load_checked = 0.0
+
+    def acquire(self, operations: int = 1, nbytes: int = 0) -> float:
+        """
+        Wait until the given work is allowed
+
+        Args:
+            operations: File operations about to be performed
+            nbytes: Bytes about to be read, written or freed; freeing a
+                large file updates allocation metadata for all of its
+                extents, so deletions count their size too
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = self.wait_for_load()
+        if operations:
+            waited += self.operations.take(operations)
+        if nbytes:
+            waited += self.bandwidth.take(nbytes)
+        if waited:
+            with self._lock:
+                self.waited += waited
+        return waited
+
+    def wait_for_load(self) -> float:
+        """
+        Pause while the system is busier than max_load
+
+        Pauses double from LOAD_SAMPLE_INTERVAL up to MAX_BACKOFF while the
+        load stays high.
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        backoff = LOAD_SAMPLE_INTERVAL
+        while self._current_load() > self.max_load:
+            if not waited:
+                self.logger.debug(f"System load above {self.max_load:.0%}; pausing")
+            time.sleep(backoff)
+            waited += backoff
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        return waited
+
+    def _current_load(self) -> float:
+        """The latest load reading, refreshed at most every LOAD_SAMPLE_INTERVAL"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._load_checked >= LOAD_SAMPLE_INTERVAL:
+                self._load_checked = now
+                self._last_load = self.load()
+            return self._last_load if self._last_load is not None else 0.0
+
+_background = False
+
+def enter_background_mode(thread: bool = False) -> bool:
+    """
+    Lower the whole process's CPU and I/O priority where supported
+
+    Calling it again has no further effect.
+
+    Args:
+        thread: Lower only the calling thread instead, for work such as
+            quarantine purging that runs beside a foreground process
+
+    Returns:
+        Whether the process, or thread, runs at background priority
+    """
+    global _background
+    if thread:
+        return _lower_thread_priority()
+    if not _background:
+        _background = _lower_priority()
+    return _background
+
+def _lower_thread_priority() -> bool:
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(
+                kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN
+            ))
+        except (ImportError, AttributeError, OSError):
+            return False
+    if not sys.platform.startswith('linux'):
+        # nice() would lower the whole process
+        return False
+    try:
+        # On Linux the nice value belongs to the calling thread alone
+        os.nice(10)
+    except OSError:
+        return False
+    return True
+
+def _lower_priority() -> bool:
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetPriorityClass(
+                kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN
+            ))
+        except (ImportError, AttributeError, OSError):
+            return False
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        return False
+    return True
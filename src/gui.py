@@ -173,7 +173,7 @@ class RuddibabaOptimizerGUI:
             # Create backup if needed
             if create_backup:
                 self.log("Creating backup...")
-                backup_data = {"optimization_level": level}
+                backup_data = optimizer.capture_state()
                 backup_file = self.backup_manager.create_backup(backup_data, f"pre_{level}")
                 self.log(f"Backup created: {backup_file}")
             
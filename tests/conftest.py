@@ -0,0 +1,41 @@
+"""
+Shared fixtures for the test suite
+
+Optimizers run against the synthetic system of the benchmark suite: a
+sandboxed %LOCALAPPDATA% and %WINDIR%, an in-memory registry and a
+command runner that never starts a process.
+"""
+import os
+from typing import Dict, Optional
+
+import pytest
+
+from benchmarks.fixtures import FakeCommandRunner, sandbox_environment
+from src.core.cache import TaskCache
+from src.core.optimizers import OptimizationLevel, SafeOptimizer
+from src.core.registry import MemoryRegistryBackend
+
+@pytest.fixture
+def sandbox(tmp_path) -> Dict[str, str]:
+    """Windows directory variables pointing into a temporary directory"""
+    with sandbox_environment(str(tmp_path)) as variables:
+        yield variables
+
+@pytest.fixture
+def make_optimizer(sandbox, tmp_path):
+    """Factory for optimizers wired to in-memory backends inside the sandbox"""
+    def make(cls=SafeOptimizer, level: OptimizationLevel = OptimizationLevel.SAFE,
+             registry: Optional[Dict] = None, **kwargs):
+        kwargs.setdefault('command_runner', FakeCommandRunner())
+        kwargs.setdefault('registry_backend', MemoryRegistryBackend(registry or {}))
+        kwargs.setdefault('cache', TaskCache(os.path.join(str(tmp_path), 'task_cache.json')))
+        kwargs.setdefault('journal_dir', os.path.join(str(tmp_path), 'journals'))
+        return cls(level=level, **kwargs)
+    return make
+
+def write_file(path: str, size: int = 100) -> str:
+    """Create a file of the given size, and its parent directories"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
@@ -0,0 +1,63 @@
+"""Tests for BackupManager and the .rbk format"""
+import os
+
+from benchmarks.fixtures import backup_document, build_registry
+from src.core.backup import BackupManager
+from src.core.backupfile import is_backup_file
+from src.core.registry import REG_BINARY, REG_SZ, MemoryRegistryBackend, normalize_key_path
+
+from .conftest import write_file
+
+def _manager(tmp_path, backend=None):
+    backend = backend or MemoryRegistryBackend()
+    return BackupManager(str(tmp_path / 'backups'), registry_backend=backend)
+
+def test_rbk_round_trip_with_binary_values(tmp_path):
+    registry = build_registry(50)
+    assert any(
+        value_type == REG_BINARY
+        for values in registry.values() for value_type, _ in values.values()
+    )
+    backup_file = _manager(tmp_path).create_backup(backup_document(registry), 'test')
+    assert is_backup_file(backup_file)
+
+    backend = MemoryRegistryBackend()
+    assert _manager(tmp_path, backend).restore_backup(backup_file)
+    assert backend.keys == {
+        normalize_key_path(key_path): values for key_path, values in registry.items()
+    }
+    loaded = _manager(tmp_path).load_backup(backup_file)['registry']
+    assert {k: {n: tuple(v) for n, v in values.items()} for k, values in loaded.items()} == registry
+
+def test_value_names_cannot_collide_with_the_bytes_tag(tmp_path):
+    registry = {
+        r"HKCU\SOFTWARE\Hex": {"hex": (REG_SZ, "abc")},
+        r"HKCU\SOFTWARE\Tag": {"__bytes__": (REG_SZ, "def")},
+        r"HKCU\SOFTWARE\Binary": {"Data": (REG_BINARY, b"\x00\xff")},
+    }
+    backup_file = _manager(tmp_path).create_backup(backup_document(registry), 'test')
+    backend = MemoryRegistryBackend()
+    assert _manager(tmp_path, backend).restore_backup(backup_file)
+    assert backend.keys[normalize_key_path(r"HKCU\SOFTWARE\Hex")] == {"hex": (REG_SZ, "abc")}
+    assert backend.keys[normalize_key_path(r"HKCU\SOFTWARE\Tag")] == {"__bytes__": (REG_SZ, "def")}
+    assert backend.keys[normalize_key_path(r"HKCU\SOFTWARE\Binary")] == {
+        "Data": (REG_BINARY, b"\x00\xff")
+    }
+
+def test_single_key_restore(tmp_path):
+    registry = build_registry(20)
+    backup_file = _manager(tmp_path).create_backup(backup_document(registry), 'test')
+    key_path = sorted(registry)[3]
+    backend = MemoryRegistryBackend()
+    assert _manager(tmp_path, backend).restore_backup(backup_file, keys=[key_path])
+    assert list(backend.keys) == [normalize_key_path(key_path)]
+
+def test_files_round_trip_through_the_chunk_store(tmp_path):
+    path = write_file(str(tmp_path / 'data' / 'settings.ini'), 5000)
+    manager = _manager(tmp_path)
+    backup_file = manager.create_backup({'files': [path]}, 'test')
+    os.remove(path)
+    assert manager.restore_backup(backup_file)
+    with open(path, 'rb') as f:
+        assert f.read() == b'x' * 5000
+    assert [entry.path for entry in manager.list_backups()] == [backup_file]
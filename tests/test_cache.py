@@ -0,0 +1,84 @@
+"""Tests for TaskCache and probe decisions"""
+import os
+
+from src.core.cache import TaskCache, fingerprint
+from src.core.metrics import TaskStatus
+from src.core.optimizers import OptimizationLevel, OptimizationTask
+from src.core.registry import REG_DWORD
+
+KEY = r"HKCU\SOFTWARE\RuddibabaTest"
+STATE = {KEY: {"Enabled": (REG_DWORD, 0)}}
+
+def test_fingerprint_follows_inputs(tmp_path):
+    drifted = fingerprint(STATE, {KEY: {"Enabled": (REG_DWORD, 1)}}, [])
+    applied = fingerprint(STATE, STATE, [])
+    assert drifted != applied
+    assert applied == fingerprint(STATE, STATE, [])
+    # Unrelated values do not matter
+    with_other = {KEY: {"Enabled": (REG_DWORD, 0), "Other": (REG_DWORD, 5)}}
+    assert applied == fingerprint(STATE, with_other, [])
+
+    directory = str(tmp_path)
+    before = fingerprint({}, {}, [directory])
+    os.utime(directory, ns=(0, 0))
+    assert fingerprint({}, {}, [directory]) != before
+
+def test_cache_entries_persist_and_expire(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    cache = TaskCache(path)
+    cache.put('task', 'abc')
+    assert cache.is_fresh('task', 'abc')
+    assert not cache.is_fresh('task', 'def')
+    cache.save()
+
+    assert TaskCache(path).is_fresh('task', 'abc')
+    assert not TaskCache(path, max_age=-1).is_fresh('task', 'abc')
+
+    cache.invalidate('task')
+    assert not cache.is_fresh('task', 'abc')
+
+def _task(name, **kwargs):
+    return OptimizationTask(name, name, lambda: None, OptimizationLevel.SAFE, **kwargs)
+
+def test_probe_decisions(make_optimizer):
+    def failing_probe():
+        raise OSError("cannot tell")
+
+    optimizer = make_optimizer(registry={KEY: {"Enabled": (REG_DWORD, 0)}})
+    tasks = [
+        _task('state_holds', state=STATE),
+        _task('state_drifted', state={KEY: {"Enabled": (REG_DWORD, 1)}}),
+        _task('probe_says_compliant', probe=lambda: True),
+        _task('probe_says_drifted', state=STATE, probe=lambda: False),
+        _task('probe_fails', probe=failing_probe),
+        _task('nothing_declared'),
+    ]
+    assert optimizer.probe_all(tasks) == {
+        'state_holds': True,
+        'state_drifted': False,
+        'probe_says_compliant': True,
+        'probe_says_drifted': False,
+        'probe_fails': None,
+        'nothing_declared': None,
+    }
+
+def test_compliant_tasks_are_skipped_then_cached(make_optimizer):
+    ran = []
+    optimizer = make_optimizer(registry={KEY: {"Enabled": (REG_DWORD, 0)}})
+    optimizer.tasks = [
+        _task('compliant', state=STATE),
+        OptimizationTask('drifted', 'drifted', lambda: ran.append('drifted'),
+                         OptimizationLevel.SAFE, state={KEY: {"Enabled": (REG_DWORD, 1)}}),
+    ]
+    optimizer.run_all()
+    assert optimizer.last_status == {
+        'compliant': TaskStatus.COMPLIANT,
+        'drifted': TaskStatus.APPLIED
+    }
+    assert ran == ['drifted']
+
+    optimizer.run_all()
+    assert optimizer.last_status['compliant'] is TaskStatus.CACHED
+    # Its function changed nothing, so it is probed and run again
+    assert optimizer.last_status['drifted'] is TaskStatus.APPLIED
+    assert ran == ['drifted', 'drifted']
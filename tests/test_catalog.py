@@ -0,0 +1,72 @@
+"""Tests for the cleanup catalog and CleanupSweep"""
+import os
+
+from src.core.quarantine import QuarantineStore
+
+from .conftest import write_file
+
+def test_manifest_is_quarantined_when_configured(make_optimizer, sandbox, tmp_path):
+    store_root = os.path.join(str(tmp_path), 'quarantine')
+    os.makedirs(store_root)
+    store = QuarantineStore(store_root)
+    first = write_file(os.path.join(sandbox['TEMP'], 'a.tmp'), 100)
+    second = write_file(os.path.join(sandbox['TEMP'], 'sub', 'b.tmp'), 200)
+    optimizer = make_optimizer(quarantine=store)
+    optimizer.preview()
+    # Created after the preview, so not confirmed
+    late = write_file(os.path.join(sandbox['TEMP'], 'sub', 'late.tmp'))
+
+    optimizer.run_all()
+    assert not os.path.exists(first) and not os.path.exists(second)
+    assert os.path.exists(late)
+    result = optimizer.last_results['clear_temp_files']
+    assert (result.files_deleted, result.bytes_deleted) == (2, 300)
+
+    items = store.list()
+    assert sorted(item.entries for item in items) == [1, 1]
+    for item in items:
+        assert store.restore(item.id)
+    assert os.path.exists(first) and os.path.exists(second)
+
+def test_sweep_time_is_divided_among_targets(make_optimizer, sandbox):
+    for i in range(2000):
+        write_file(os.path.join(sandbox['TEMP'], f'd{i % 20}', f'{i}.tmp'))
+    update_cache = os.path.join(sandbox['WINDIR'], 'SoftwareDistribution', 'Download')
+    for i in range(200):
+        write_file(os.path.join(update_cache, f'{i}.cab'))
+    optimizer = make_optimizer(max_workers=1)
+
+    optimizer.run_all(probe=False, use_cache=False)
+    temp = optimizer.last_results['clear_temp_files']
+    update = optimizer.last_results['clear_windows_update_cache']
+    assert (temp.files_deleted, update.files_deleted) == (2000, 200)
+    assert temp.wall_time > update.wall_time > 0
+    assert temp.cpu_time > update.cpu_time > 0
+
+def test_manifest_deletes_exactly_what_was_previewed(make_optimizer, sandbox):
+    previewed = write_file(os.path.join(sandbox['TEMP'], 'sub', 'old.tmp'))
+    optimizer = make_optimizer()
+    optimizer.preview()
+    late = write_file(os.path.join(sandbox['TEMP'], 'sub', 'late.tmp'))
+
+    optimizer.run_all()
+    assert not os.path.exists(previewed)
+    # Created after the preview: kept, and its directory with it
+    assert os.path.exists(late)
+    assert optimizer.manifests == {}
+
+def test_failed_target_does_not_fail_the_others(make_optimizer, sandbox):
+    temp_file = write_file(os.path.join(sandbox['TEMP'], 'a.tmp'))
+    optimizer = make_optimizer()
+    take_manifest = optimizer.take_manifest
+
+    def failing_take_manifest(name):
+        if name == 'clear_windows_update_cache':
+            raise OSError("manifest unreadable")
+        return take_manifest(name)
+    optimizer.take_manifest = failing_take_manifest
+
+    results = optimizer.run_all(probe=False, use_cache=False)
+    assert results['clear_temp_files'] and not results['clear_windows_update_cache']
+    assert optimizer.last_results['clear_windows_update_cache'].error == "manifest unreadable"
+    assert not os.path.exists(temp_file)
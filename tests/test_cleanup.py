@@ -0,0 +1,45 @@
+"""Tests for DeletionEngine and CleanupJournal"""
+import os
+
+from src.core.cleanup import DeletionEngine
+from src.core.journal import CleanupJournal
+from src.core.throttle import Throttle
+
+from .conftest import write_file
+
+def test_deletions_are_charged_against_the_byte_limit(tmp_path):
+    root = str(tmp_path / 'tree')
+    for i in range(13):
+        write_file(os.path.join(root, f'{i}.tmp'), 1000)
+    # The bucket holds ten files' worth; the last three wait 0.1 s each
+    throttle = Throttle(ops_per_second=1_000_000, bytes_per_second=10_000, load=lambda: None)
+
+    stats = DeletionEngine(max_workers=1, throttle=throttle).clear([root])
+    assert (stats.files, stats.bytes) == (13, 13_000)
+    assert throttle.waited >= 0.25
+
+def test_resumed_cleanup_skips_handled_directories(make_optimizer, sandbox):
+    handled = os.path.realpath(os.path.join(sandbox['TEMP'], 'handled'))
+    kept = write_file(os.path.join(handled, 'locked.tmp'))
+    remaining = write_file(os.path.join(sandbox['TEMP'], 'remaining', 'a.tmp'), 300)
+    optimizer = make_optimizer()
+    # What an interrupted run left: 5 files freed, one directory finished
+    journal = CleanupJournal.for_task('clear_temp_files', optimizer.journal_dir, resume=True)
+    journal.record(5, 500, [handled])
+    journal.flush()
+
+    optimizer.run_all(probe=False, use_cache=False, resume=True)
+    assert os.path.exists(kept)
+    assert not os.path.exists(remaining)
+    assert optimizer.last_results['clear_temp_files'].files_deleted == 1
+    # Finished, so nothing is left to resume
+    assert not os.path.exists(journal.path)
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+    path = str(tmp_path / 'task.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"files": 2, "bytes": 20, "dirs": ["/a"]}\n{"files": 3, "by')
+    journal = CleanupJournal(path)
+    journal.load()
+    assert (journal.files, journal.bytes, journal.completed) == (2, 20, {"/a"})
+    assert journal.resumed
@@ -0,0 +1,62 @@
+"""Tests for BaseOptimizer.run_all"""
+import os
+
+from src.core.metrics import TaskStatus
+from src.core.optimizers import HardcoreOptimizer, OptimizationLevel, OptionalOptimizer
+from src.core.optimizers.safe_optimizer import POWER_SETTINGS_STATE
+from src.core.state import HIGH_PERFORMANCE_SCHEME
+
+from .conftest import write_file
+
+def _task(optimizer, name):
+    return next(task for task in optimizer.tasks if task.name == name)
+
+def test_confirmed_preview_always_deletes(make_optimizer, sandbox):
+    path = write_file(os.path.join(sandbox['TEMP'], 'preview.tmp'), 1000)
+    optimizer = make_optimizer()
+    task = _task(optimizer, 'clear_temp_files')
+    # A stale cache entry and probe both claim the task has nothing to do
+    optimizer.cache.put(task.name, optimizer._fingerprint(task, {}))
+    task.probe = lambda: True
+
+    manifests = optimizer.preview()
+    assert manifests[task.name].files == 1
+    assert manifests[task.name].bytes == 1000
+
+    optimizer.run_all()
+    assert optimizer.last_status[task.name] is TaskStatus.APPLIED
+    assert not os.path.exists(path)
+
+def test_unverified_state_is_not_cached(make_optimizer):
+    # The fake runner reports success but never changes the registry
+    optimizer = make_optimizer()
+    optimizer.run_all()
+    assert optimizer.last_status['optimize_power_settings'] is TaskStatus.APPLIED
+
+    optimizer.run_all()
+    assert optimizer.last_status['optimize_power_settings'] is TaskStatus.APPLIED
+    assert optimizer.commands.executed.count(
+        f"powercfg /setactive {HIGH_PERFORMANCE_SCHEME}"
+    ) == 2
+
+def test_reached_state_is_cached(make_optimizer):
+    optimizer = make_optimizer(registry=_materialized(POWER_SETTINGS_STATE))
+    optimizer.run_all(probe=False)
+    assert optimizer.last_status['optimize_power_settings'] is TaskStatus.APPLIED
+
+    optimizer.run_all(probe=False)
+    assert optimizer.last_status['optimize_power_settings'] is TaskStatus.CACHED
+
+def _materialized(state):
+    """Registry contents in which a declared state holds"""
+    return {key_path: dict(values) for key_path, values in state.items()}
+
+def test_tasks_writing_different_keys_can_run_together(make_optimizer):
+    for cls, level in ((OptionalOptimizer, OptimizationLevel.OPTIONAL),
+                       (HardcoreOptimizer, OptimizationLevel.HARDCORE)):
+        tasks = [task for task in make_optimizer(cls, level).tasks if task.state]
+        for i, task in enumerate(tasks):
+            for other in tasks[i + 1:]:
+                shared_keys = set(task.state) & set(other.state)
+                if not shared_keys:
+                    assert not set(task.resources) & set(other.resources), (task.name, other.name)
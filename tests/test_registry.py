@@ -0,0 +1,33 @@
+"""Tests for registry transactions and state reads"""
+import logging
+
+from src.core.registry import REG_DWORD, MemoryRegistryBackend
+from src.core.state import read_state
+
+KEY = r"HKLM\SOFTWARE\Policies\Test"
+
+class _DeniedBackend(MemoryRegistryBackend):
+    """Registry whose keys cannot be opened, as HKLM without elevation"""
+
+    def open_key(self, key_path, create=False, write=False):
+        raise PermissionError(5, "Access is denied")
+
+def test_unreadable_keys_are_logged(caplog):
+    with caplog.at_level(logging.WARNING):
+        current = read_state(_DeniedBackend(), [{KEY: {"Value": (REG_DWORD, 1)}}])
+    assert current == {}
+    assert any(KEY in record.getMessage() for record in caplog.records)
+
+def test_reads_do_not_open_for_writing():
+    opened = []
+
+    class Recording(MemoryRegistryBackend):
+        def open_key(self, key_path, create=False, write=False):
+            opened.append(write or create)
+            return super().open_key(key_path, create, write)
+
+    backend = Recording({KEY: {"Value": (REG_DWORD, 0)}})
+    assert read_state(backend, [{KEY: {"Value": (REG_DWORD, 1)}}]) == {
+        KEY: {"Value": (REG_DWORD, 0)}
+    }
+    assert opened == [False]
@@ -0,0 +1,75 @@
+"""Tests for TaskScheduler"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+import pytest
+
+from src.core.scheduler import TaskScheduler, registry_resource
+
+@dataclass
+class _Task:
+    name: str
+    depends_on: List[str] = field(default_factory=list)
+    resources: List[str] = field(default_factory=list)
+    succeeds: bool = True
+
+class _Recorder:
+    """Runner that logs start and end of every task and tracks overlap"""
+
+    def __init__(self, duration: float = 0.02):
+        self.duration = duration
+        self.events: List[str] = []
+        self.running = set()
+        self.overlaps = []
+        self._lock = threading.Lock()
+
+    def __call__(self, task: _Task) -> bool:
+        with self._lock:
+            self.events.append(f"start:{task.name}")
+            self.overlaps.append(set(self.running))
+            self.running.add(task.name)
+        time.sleep(self.duration)
+        with self._lock:
+            self.running.discard(task.name)
+            self.events.append(f"end:{task.name}")
+        return task.succeeds
+
+def test_dependencies_run_first():
+    tasks = [_Task('c', depends_on=['b']), _Task('b', depends_on=['a']), _Task('a')]
+    runner = _Recorder()
+    results = TaskScheduler(max_workers=4).run(tasks, runner)
+    assert results == {'c': True, 'b': True, 'a': True}
+    assert runner.events == ['start:a', 'end:a', 'start:b', 'end:b', 'start:c', 'end:c']
+
+def test_tasks_sharing_a_resource_never_overlap():
+    shared = registry_resource(r"HKLM\SOFTWARE\Policies\Test")
+    tasks = [
+        _Task('first', resources=[shared]),
+        # The same key, spelled differently
+        _Task('second', resources=[
+            registry_resource(r"HKEY_LOCAL_MACHINE\Software\policies\TEST")
+        ]),
+        _Task('other', resources=[registry_resource(r"HKLM\SOFTWARE\Other")]),
+    ]
+    runner = _Recorder(duration=0.05)
+    TaskScheduler(max_workers=4).run(tasks, runner)
+    # Tasks already running when each task started
+    started = [event[len('start:'):] for event in runner.events if event.startswith('start:')]
+    running = dict(zip(started, runner.overlaps))
+    assert 'first' not in running['second'] and 'second' not in running['first']
+    # The unrelated task ran alongside one of them
+    assert running['other'] or any('other' in names for names in running.values())
+
+def test_failed_dependency_skips_dependents():
+    tasks = [_Task('a', succeeds=False), _Task('b', depends_on=['a']), _Task('c')]
+    runner = _Recorder(duration=0)
+    results = TaskScheduler().run(tasks, runner)
+    assert results == {'a': False, 'b': False, 'c': True}
+    assert 'start:b' not in runner.events
+
+def test_dependency_cycles_are_rejected():
+    tasks = [_Task('a', depends_on=['b']), _Task('b', depends_on=['a'])]
+    with pytest.raises(ValueError):
+        TaskScheduler().run(tasks, _Recorder(duration=0))